@@ -0,0 +1,102 @@
+"""This module checks cold start of voice activity detection: import time and heavy modules loaded on import
+
+Usage: python -m benchmarks.import_time [--module voice_detection.vad] [--budget 1.0]
+
+The module is imported in a fresh interpreter, so nothing is cached in ``sys.modules``. The check fails when import
+takes longer than ``--budget`` seconds or when any optional heavy dependency is imported eagerly.
+
+The first analysis of a fresh worker also pays loading of numba and its cached kernels. It is reported, with and
+without numba, as the time of import and analysis of one second of synthetic speech.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('librosa', 'numba', 'sklearn', 'matplotlib', 'noisereduce')
+
+# probes import modules of the repository whatever the working directory is
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': sorted(sys.modules)}}))
+"""
+
+
+_FIRST_CALL_PROBE = """
+import json, time
+start = time.perf_counter()
+import io
+import soundfile as sf
+from loguru import logger
+from benchmarks.signals import synthetic_speech
+from voice_detection.analysis import SpeechAnalysis
+logger.remove()
+file = io.BytesIO()
+sf.write(file, synthetic_speech(1.0)[0], 22050, format='WAV')
+file.seek(0)
+SpeechAnalysis(file, denoise='gate').detect().segments
+print(json.dumps({'seconds': time.perf_counter() - start}))
+"""
+
+
+def first_call_time(disable_numba=False):
+    """Import and analyse one second of audio in a fresh interpreter
+
+    :param disable_numba: if True run without numba kernels, see utils.kernels (default: False);
+    :return time in seconds.
+    """
+    environment = dict(os.environ)
+    environment.pop('VAD_DISABLE_NUMBA', None)
+    if disable_numba:
+        environment['VAD_DISABLE_NUMBA'] = '1'
+    output = subprocess.run([sys.executable, '-c', _FIRST_CALL_PROBE], capture_output=True, text=True, check=True,
+                            cwd=ROOT, env=environment).stdout
+    return json.loads(output.splitlines()[-1])['seconds']
+
+
+def import_time(module='voice_detection.vad'):
+    """Import module in a fresh interpreter
+
+    :param module: dotted name of module (default: voice_detection.vad);
+    :return tuple of import time in seconds and list of heavy modules that were imported.
+    """
+    output = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)], capture_output=True, text=True,
+                            check=True, cwd=ROOT).stdout
+    result = json.loads(output.splitlines()[-1])
+    loaded = [name for name in HEAVY_MODULES if name in result['modules']]
+    return result['seconds'], loaded
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Check import time of voice activity detection')
+    parser.add_argument('--module', default='voice_detection.vad',
+                        help='module to import (default: voice_detection.vad)')
+    parser.add_argument('--budget', type=float, default=1.0, help='allowed import time in seconds (default: 1.0)')
+    parser.add_argument('--first-call', action='store_true', help='also report cost of the first analysis')
+    args = parser.parse_args(argv)
+
+    seconds, loaded = import_time(args.module)
+    print(f'import {args.module}: {seconds:.3f} s')
+    if args.first_call:
+        with_numba, without_numba = first_call_time(), first_call_time(disable_numba=True)
+        print(f'first analysis: {with_numba:.3f} s with numba, {without_numba:.3f} s without, '
+              f'{with_numba - without_numba:+.3f} s for numba')
+    failed = False
+    if loaded:
+        print(f'heavy modules imported eagerly: {", ".join(loaded)}', file=sys.stderr)
+        failed = True
+    if seconds > args.budget:
+        print(f'import time exceeds budget of {args.budget:.3f} s', file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
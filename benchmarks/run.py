@@ -0,0 +1,273 @@
+"""This module provides reproducible benchmarks of every stage of voice activity detection
+
+Usage: python -m benchmarks.run [--durations 5 60 600] [--shard-workers 1 2 4] [--output results.json]
+                                [--compare baseline.json]
+
+Every stage and every descriptor implementation is timed (best of ``--repeat`` runs) and its peak allocation is
+measured with tracemalloc on synthetic signals, so no audio files or network are needed. Results are written as JSON
+and can be compared with results of another version to catch regressions. Throughput of ShardedAnalysis is measured
+for every number of ``--shard-workers`` threads, to check how intra-file parallelism scales.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+import utils.audio_operations as audio_operations
+import utils.descriptors as speech_descriptors
+import utils.kernels as kernels
+from benchmarks.signals import synthetic_speech
+from utils.denoise import SpectralGate
+from voice_detection.decision import DESCRIPTORS, Thresholds, detect_speech, hangover, speech_condition
+from voice_detection.sharding import ShardedAnalysis, shard_bounds
+
+SAMPLE_RATE = 22050
+
+# per frame reference implementations are far too slow for hours of audio
+SLOW_FRAMES_LIMIT = 20000
+
+
+def _librosa_load(path):
+    import librosa
+    return librosa.load(path, mono=True)
+
+
+def _noisereduce(signal):
+    import noisereduce as nr
+    return nr.reduce_noise(signal, signal[:-1])
+
+
+def measure(function, repeat=3):
+    """Time function and measure its peak allocation
+
+    :param function: callable without arguments;
+    :param repeat: number of timed runs, the best one is reported (default: 3);
+    :return tuple of result, best wall time in seconds and peak allocation in MB.
+    """
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return result, best, peak / 2 ** 20
+
+
+def descriptor_cases(framed_signal, sample_rate):
+    """Descriptor implementations to compare
+
+    :return list of (stage, implementation, callable, slow) tuples.
+    """
+    power = speech_descriptors.power_spectrum(framed_signal, power=2.0)
+    return [
+        ('short_term_energy', 'short_term_energy', lambda: speech_descriptors.short_term_energy(framed_signal), True),
+        ('short_term_energy', 'additional_short_term_energy',
+         lambda: speech_descriptors.additional_short_term_energy(framed_signal), True),
+        ('short_term_energy', 'numpy_mean', lambda: np.mean(framed_signal ** 2, axis=1), False),
+        ('zero_crossing_rate', 'zero_crossing_rate', lambda: speech_descriptors.zero_crossing_rate(framed_signal),
+         True),
+        ('zero_crossing_rate', 'additional_zero_crossing_rate',
+         lambda: speech_descriptors.additional_zero_crossing_rate(framed_signal), True),
+        ('zero_crossing_rate', 'zero_crossing_rates', lambda: speech_descriptors.zero_crossing_rates(framed_signal),
+         False),
+        ('time_domain', 'energy_zero_crossings', lambda: kernels.energy_zero_crossings(framed_signal), False),
+        ('spectral_flatness', 'spectral_flatness', lambda: speech_descriptors.spectral_flatness(power), True),
+        ('spectral_flatness', 'additional_spectral_flatness',
+         lambda: speech_descriptors.additional_spectral_flatness(framed_signal), True),
+        ('spectral_rolloff', 'spectral_rolloff', lambda: speech_descriptors.spectral_rolloff(framed_signal), True),
+        ('spectral_bandwidth', 'spectral_bandwidth', lambda: speech_descriptors.spectral_bandwidth(framed_signal),
+         True),
+        ('spectral', 'spectral_descriptors',
+         lambda: speech_descriptors.spectral_descriptors(framed_signal, sample_rate), False),
+        ('descriptors', 'descriptor_matrix',
+         lambda: speech_descriptors.descriptor_matrix(framed_signal, sample_rate), False),
+    ]
+
+
+def _sharded_descriptors(path, workers, audio):
+    """Descriptors of ShardedAnalysis with gate, the loaded signal is reused so only sharded work is timed"""
+    analysis = ShardedAnalysis(path, denoise='gate', workers=workers)
+    analysis.__dict__['_audio'] = audio
+    return analysis.descriptors
+
+
+def run_sharding(duration, workers_list, repeat=3):
+    """Benchmark throughput of ShardedAnalysis against the number of worker threads
+
+    :param duration: duration of signal in seconds;
+    :param workers_list: numbers of worker threads;
+    :param repeat: number of timed runs (default: 3);
+    :return list of result records.
+    """
+    signal, _ = synthetic_speech(duration, SAMPLE_RATE)
+    frames = audio_operations.frame_count(len(signal), SAMPLE_RATE, 0.03, 0.015)
+    audio = (signal.astype(np.float64), SAMPLE_RATE)
+    records = []
+    handle, path = tempfile.mkstemp(suffix='.wav')
+    os.close(handle)
+    try:
+        sf.write(path, signal, SAMPLE_RATE)
+        for workers in workers_list:
+            entry = {'stage': 'sharding', 'implementation': f'threads_{workers}', 'duration': duration}
+            if workers > 1 and len(shard_bounds(frames, 2 * workers)) < 2:
+                entry['skipped'] = 'too short for shards'
+            else:
+                _, seconds, peak = measure(lambda: _sharded_descriptors(path, workers, audio), repeat)
+                entry.update(seconds=seconds, peak_mb=peak, frames_per_second=frames / seconds)
+            records.append(entry)
+    finally:
+        os.remove(path)
+    return records
+
+
+def run_duration(duration, repeat=3, slow=True):
+    """Benchmark all stages on a synthetic signal of given duration
+
+    :param duration: duration of signal in seconds;
+    :param repeat: number of timed runs (default: 3);
+    :param slow: if True run per frame reference implementations on short signals too (default: True);
+    :return list of result records.
+    """
+    signal, _ = synthetic_speech(duration, SAMPLE_RATE)
+    records = []
+
+    def record(stage, implementation, function, frames=None):
+        entry = {'stage': stage, 'implementation': implementation, 'duration': duration}
+        try:
+            result, seconds, peak = measure(function, repeat)
+        except Exception as error:
+            entry['error'] = f'{type(error).__name__}: {error}'
+            records.append(entry)
+            return None
+        entry.update(seconds=seconds, peak_mb=peak)
+        if frames:
+            entry['frames_per_second'] = frames / seconds
+        records.append(entry)
+        return result
+
+    handle, path = tempfile.mkstemp(suffix='.wav')
+    os.close(handle)
+    try:
+        sf.write(path, signal, SAMPLE_RATE)
+        record('load', 'soundfile', lambda: sf.read(path, dtype='float32'))
+        record('load', 'librosa', lambda: _librosa_load(path))
+
+        record('denoise', 'noisereduce', lambda: _noisereduce(signal))
+        framed_signal = record('framing', 'framing_signal',
+                               lambda: audio_operations.framing_signal(signal, SAMPLE_RATE))
+        frames = len(framed_signal)
+        record('framing', 'framing_signal_float32',
+               lambda: audio_operations.framing_signal(signal, SAMPLE_RATE, dtype=np.float32), frames)
+        framed_float32 = audio_operations.framing_signal(signal, SAMPLE_RATE, dtype=np.float32)
+        record('spectral', 'spectral_descriptors_float32',
+               lambda: speech_descriptors.spectral_descriptors(framed_float32, SAMPLE_RATE), frames)
+        del framed_float32
+        record('denoise', 'spectral_gate', lambda: SpectralGate().gate_frames(framed_signal), frames)
+        record('reconstruction', 'overlap_add',
+               lambda: audio_operations.overlap_add(framed_signal, int(round(0.015 * SAMPLE_RATE)),
+                                                    np.blackman(framed_signal.shape[1]), len(signal)), frames)
+
+        for stage, implementation, function, is_slow in descriptor_cases(framed_signal, SAMPLE_RATE):
+            if is_slow and (not slow or frames > SLOW_FRAMES_LIMIT):
+                records.append({'stage': stage, 'implementation': implementation, 'duration': duration,
+                                'skipped': 'per frame implementation'})
+                continue
+            record(stage, implementation, function, frames)
+
+        raw = speech_descriptors.descriptor_matrix(framed_signal, SAMPLE_RATE)
+        deltas = ((raw - raw[:31].mean(axis=0)) / np.ptp(raw, axis=0)).T
+        record('decision', 'hangover', lambda: hangover(speech_condition(deltas, Thresholds())), frames)
+        record('decision', 'detect_speech', lambda: detect_speech(deltas, Thresholds()), frames)
+        record('save', 'soundfile', lambda: sf.write(path, signal, SAMPLE_RATE))
+    finally:
+        os.remove(path)
+    return records
+
+
+def environment():
+    """Describe versions and machine results belong to"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'descriptors': list(DESCRIPTORS)}
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=0.005):
+    """Find stages that became slower than in baseline
+
+    :param results: results dict of this run;
+    :param baseline: results dict of previous run;
+    :param tolerance: allowed relative slowdown (default: 0.2);
+    :param min_seconds: slowdowns shorter than this are timer noise (default: 0.005);
+    :return list of regression messages.
+    """
+    previous = {(entry['stage'], entry['implementation'], entry['duration']): entry
+                for entry in baseline['results'] if 'seconds' in entry}
+    regressions = []
+    for entry in results['results']:
+        key = (entry['stage'], entry['implementation'], entry['duration'])
+        if 'seconds' in entry and key in previous:
+            ratio = entry['seconds'] / previous[key]['seconds']
+            if ratio > 1 + tolerance and entry['seconds'] - previous[key]['seconds'] > min_seconds:
+                regressions.append(f'{key[0]}/{key[1]} at {key[2]} s: {ratio:.2f}x slower')
+    return regressions
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark voice activity detection stages')
+    parser.add_argument('--durations', type=float, nargs='+', default=[5, 60, 600],
+                        help='signal durations in seconds (default: 5 60 600)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (default: 3)')
+    parser.add_argument('--no-slow', action='store_true', help='skip per frame reference implementations')
+    parser.add_argument('--shard-workers', type=int, nargs='*', default=[1, 2, 4],
+                        help='worker threads of ShardedAnalysis to measure throughput of (default: 1 2 4)')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file for results')
+    parser.add_argument('--compare', help='JSON results of a previous run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    results = {'environment': environment(), 'results': []}
+    for duration in args.durations:
+        entries = run_duration(duration, args.repeat, slow=not args.no_slow)
+        entries += run_sharding(duration, args.shard_workers, args.repeat)
+        for entry in entries:
+            results['results'].append(entry)
+            if 'seconds' in entry:
+                print(f"{duration:>8g} s  {entry['stage']:<20} {entry['implementation']:<30} "
+                      f"{entry['seconds']:10.4f} s {entry['peak_mb']:10.1f} MB")
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+"""This module provides load generator for the local VAD service
+
+Usage: python -m benchmarks.server_client [--url http://127.0.0.1:8765/segments] [--file audio.wav]
+                                          [--requests 200] [--concurrency 8] [--spawn]
+
+Every connection is kept alive and sends requests one after another, ``--concurrency`` connections run at once.
+Latency percentiles, requests per second and refused requests are reported. With ``--spawn`` a server is started
+in this process on a free port, so the benchmark needs nothing else on localhost.
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.signals import synthetic_speech
+
+
+async def _request(reader, writer, host, target, body):
+    """Send one POST request on an open connection
+
+    :return tuple of status code and response body.
+    """
+    writer.write(f'POST {target} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/octet-stream\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    response = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, response, headers.get('connection', '').lower() == 'close'
+
+
+async def _connection(url, body, count, latencies, statuses):
+    """Send ``count`` requests on one keep-alive connection, reconnecting when the server closes it"""
+    reader = writer = None
+    target = url.path + (f'?{url.query}' if url.query else '')
+    for _ in range(count):
+        if writer is None:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        start = time.perf_counter()
+        status, _, close = await _request(reader, writer, url.netloc, target, body)
+        latencies.append(time.perf_counter() - start)
+        statuses.append(status)
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url, body, requests=200, concurrency=8):
+    """Send requests concurrently and measure them
+
+    :param url: URL of endpoint;
+    :param body: bytes of request body;
+    :param requests: total number of requests (default: 200);
+    :param concurrency: number of connections (default: 8);
+    :return dict of results.
+    """
+    url = urlsplit(url)
+    latencies, statuses = [], []
+    counts = [requests // concurrency + (index < requests % concurrency) for index in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(_connection(url, body, count, latencies, statuses) for count in counts if count))
+    elapsed = time.perf_counter() - start
+
+    statuses = np.array(statuses)
+    ok = np.array(latencies)[statuses == 200]
+    return {'requests': len(statuses),
+            'ok': int(np.count_nonzero(statuses == 200)),
+            'refused': int(np.count_nonzero(statuses == 503)),
+            'errors': int(np.count_nonzero((statuses != 200) & (statuses != 503))),
+            'elapsed': elapsed,
+            'requests_per_second': len(statuses) / elapsed,
+            'p50': float(np.percentile(ok, 50)) if len(ok) else None,
+            'p99': float(np.percentile(ok, 99)) if len(ok) else None,
+            'concurrency': concurrency}
+
+
+def synthetic_body(duration=5.0, sample_rate=16000):
+    """WAV file of synthetic speech as bytes"""
+    signal, _ = synthetic_speech(duration, sample_rate)
+    file = io.BytesIO()
+    sf.write(file, signal, sample_rate, format='WAV')
+    return file.getvalue()
+
+
+async def _spawned(args, body):
+    """Start a server in this process, run the load and stop it"""
+    from voice_detection.server import VADServer
+
+    server = VADServer(port=0, workers=args.workers, queue_size=args.queue_size,
+                       params={'denoise': None if args.denoise == 'none' else args.denoise})
+    await server.start()
+    try:
+        url = urlsplit(args.url)._replace(netloc=f'127.0.0.1:{server.port}').geturl()
+        return await run_load(url, body, args.requests, args.concurrency)
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Measure latency and throughput of the local VAD service')
+    parser.add_argument('--url', default='http://127.0.0.1:8765/segments', help='endpoint with query string')
+    parser.add_argument('--file', help='audio file to send (default: 5 s of synthetic speech)')
+    parser.add_argument('--requests', type=int, default=200, help='total requests (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel connections (default: 8)')
+    parser.add_argument('--spawn', action='store_true', help='start a server in this process on a free port')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes of spawned server')
+    parser.add_argument('--queue-size', type=int, default=64, help='pending requests of spawned server')
+    parser.add_argument('--denoise', choices=('noisereduce', 'gate', 'none'), default='gate',
+                        help='denoise method of spawned server (default: gate)')
+    parser.add_argument('--output', help='JSON file for results')
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file, 'rb') as file:
+            body = file.read()
+    else:
+        body = synthetic_body()
+
+    if args.spawn:
+        results = asyncio.run(_spawned(args, body))
+    else:
+        results = asyncio.run(run_load(args.url, body, args.requests, args.concurrency))
+
+    print(f"{results['requests']} requests, {results['ok']} ok, {results['refused']} refused, "
+          f"{results['errors']} errors in {results['elapsed']:.2f} s: {results['requests_per_second']:.1f} req/s")
+    if results['p50'] is not None:
+        print(f"latency p50 {results['p50'] * 1000:.1f} ms, p99 {results['p99'] * 1000:.1f} ms")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if results['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
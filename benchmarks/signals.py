@@ -0,0 +1,38 @@
+"""This module provides deterministic synthetic speech-like signals for benchmarks"""
+
+import numpy as np
+
+
+def synthetic_speech(duration, sample_rate=22050, seed=0, noise_level=0.01, lead_silence=0.6):
+    """Generate harmonic "syllables" separated by pauses on top of white noise
+
+    Syllables are 150-600 ms long harmonic tones with a moving fundamental frequency and a smooth envelope, pauses
+    are 150-800 ms long, so the signal has the rhythm of speech. The first ``lead_silence`` seconds hold noise only,
+    as VAD assumes. The same arguments always give the same signal.
+
+    :param duration: duration in seconds;
+    :param sample_rate: sample rate (default: 22050);
+    :param seed: random seed (default: 0);
+    :param noise_level: standard deviation of background noise (default: 0.01);
+    :param lead_silence: duration of leading silence in seconds (default: 0.6);
+    :return tuple of signal and numpy array of reference (start, end) speech samples.
+    """
+    rng = np.random.default_rng(seed)
+    length = int(duration * sample_rate)
+    signal = rng.normal(0, noise_level, length)
+    segments = []
+
+    position = int(lead_silence * sample_rate)
+    while True:
+        syllable = int(rng.uniform(0.15, 0.6) * sample_rate)
+        if position + syllable > length:
+            break
+        time = np.arange(syllable) / sample_rate
+        f0 = rng.uniform(90, 250) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 4) * time))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        tone = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 9))
+        signal[position:position + syllable] += rng.uniform(0.1, 0.4) * np.hanning(syllable) * tone
+        segments.append((position, position + syllable))
+        position += syllable + int(rng.uniform(0.15, 0.8) * sample_rate)
+
+    return signal.astype(np.float32), np.array(segments, dtype=np.int64).reshape(-1, 2)
@@ -3,6 +3,7 @@
 # look at speech descriptors graphs and change thresholds value (sometimes it can be negative)
 # the black line guides you
 
+from voice_detection.analysis import SpeechAnalysis
 from voice_detection.vad import VAD
 
 if __name__ == '__main__':
@@ -13,3 +14,11 @@ if __name__ == '__main__':
     baz = VAD('../audio/boosted count to ten.wav', visualise=True, save_path='../results',
               energy_threshold=-3*10**-1,
               flatness_threshold=0.03)
+
+    # descriptors are calculated once, every next detection only compares them with new thresholds
+    analysis = SpeechAnalysis('../audio/boosted count to ten.wav')
+    for flatness_threshold in (0.01, 0.03, 0.05):
+        detection = analysis.detect(energy_threshold=-3*10**-1, flatness_threshold=flatness_threshold)
+        print(flatness_threshold, len(detection.indexes) // 2, 'speech regions')
+    detection.plot()
+    detection.save('../results')
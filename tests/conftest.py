@@ -0,0 +1,30 @@
+"""Shared fixtures of tests: synthetic speech written to audio files"""
+import pathlib
+import sys
+
+import pytest
+import soundfile as sf
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.signals import synthetic_speech  # noqa: E402
+
+
+def write_speech(path, duration, sample_rate=22050, seed=0, channels=1):
+    """Write synthetic speech to a float WAV file, every channel with its own seed
+
+    :return path as str.
+    """
+    import numpy as np
+
+    signal = np.stack([synthetic_speech(duration, sample_rate, seed=seed + channel)[0]
+                       for channel in range(channels)], axis=1)
+    sf.write(path, signal[:, 0] if channels == 1 else signal, sample_rate, subtype='FLOAT')
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def speech_file(tmp_path_factory):
+    """8 seconds of synthetic speech at 22050 Hz"""
+    return write_speech(tmp_path_factory.mktemp('audio') / 'speech.wav', 8)
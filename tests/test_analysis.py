@@ -0,0 +1,35 @@
+"""Tests of SpeechAnalysis options that must not change detection: float32 and the native sample rate"""
+import numpy as np
+import pytest
+
+from conftest import write_speech
+from voice_detection.analysis import SpeechAnalysis
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+def test_float32_detection_equals_float64(speech_file, denoise):
+    double = SpeechAnalysis(speech_file, denoise=denoise).detect()
+    single = SpeechAnalysis(speech_file, denoise=denoise, dtype=np.float32)
+    assert single.descriptors.dtype == np.float32 and single.signal.dtype == np.float32
+    detection = single.detect()
+    assert np.array_equal(detection.speech_detection, double.speech_detection)
+    assert np.array_equal(detection.impact_mask, double.impact_mask)
+    assert np.array_equal(detection.segments, double.segments)
+
+
+def test_native_rate_of_default_rate_file_is_unchanged(speech_file):
+    default = SpeechAnalysis(speech_file, denoise=None)
+    native = SpeechAnalysis(speech_file, denoise=None, sample_rate='native')
+    assert native.fft_size == default.fft_size == 4096
+    assert np.array_equal(native.signal, default.signal)
+    assert np.array_equal(native.descriptors, default.descriptors)
+    # default params keep the cache keys of entries written before sample_rate existed
+    assert 'sample_rate' not in default.cache_params
+
+
+def test_native_rate_adapts_fft_size(tmp_path):
+    path = write_speech(tmp_path / 'phone.wav', 4, sample_rate=8000)
+    analysis = SpeechAnalysis(path, denoise=None, sample_rate='native')
+    assert analysis.sample_rate == 8000 and analysis.fft_size == 2048
+    assert analysis.framed_signal.shape[1] == 240
+    assert analysis.detect().speech_detection.any()
@@ -0,0 +1,97 @@
+"""Tests of framing and overlap-add: the strided and phase-wise versions equal plain per-frame loops"""
+import numpy as np
+import pytest
+
+from utils.audio_operations import deframing_signal, frame_count, framing_signal, overlap_add
+
+SAMPLE_RATE = 8000
+
+
+def loop_framing(signal, sample_rate, frame_length=0.03, frame_overlap=0.015):
+    """Framing with an explicit loop over frames, as the original framing_signal did"""
+    num_frames = frame_count(len(signal), sample_rate, frame_length, frame_overlap)
+    frame_length = int(round(frame_length * sample_rate))
+    frame_step = int(round(frame_overlap * sample_rate))
+    pad_signal = np.concatenate([signal, np.zeros(num_frames * frame_step + frame_length - len(signal))])
+    return np.array([pad_signal[i * frame_step:i * frame_step + frame_length] * np.blackman(frame_length)
+                     for i in range(num_frames)])
+
+
+def loop_overlap_add(frames, frame_step, window, floor=1e-3):
+    """Overlap-add with an explicit loop over frames"""
+    num_frames, frame_length = frames.shape
+    length = (num_frames - 1) * frame_step + frame_length
+    signal = np.zeros(length)
+    weights = np.zeros(length)
+    for i, frame in enumerate(frames):
+        signal[i * frame_step:i * frame_step + frame_length] += frame
+        weights[i * frame_step:i * frame_step + frame_length] += window
+    return signal / np.maximum(weights, floor)
+
+
+@pytest.mark.parametrize('frame_length, frame_overlap', [(0.03, 0.015), (0.03, 0.01), (0.025, 0.02)])
+def test_framing_equals_loop(frame_length, frame_overlap):
+    signal = np.random.default_rng(0).normal(size=SAMPLE_RATE)
+    framed = framing_signal(signal, SAMPLE_RATE, frame_length, frame_overlap)
+    assert np.allclose(framed, loop_framing(signal, SAMPLE_RATE, frame_length, frame_overlap))
+
+
+def test_framing_float32():
+    signal = np.random.default_rng(1).normal(size=SAMPLE_RATE)
+    single = framing_signal(signal, SAMPLE_RATE, dtype=np.float32)
+    assert single.dtype == np.float32
+    assert np.allclose(single, framing_signal(signal, SAMPLE_RATE), atol=1e-6)
+
+
+def test_framing_channels_at_once():
+    signal = np.random.default_rng(1).normal(size=(2, SAMPLE_RATE))
+    framed = framing_signal(signal, SAMPLE_RATE)
+    for channel in range(2):
+        assert np.array_equal(framed[channel], framing_signal(signal[channel], SAMPLE_RATE))
+
+
+def test_framing_slice_equals_frames_of_whole_signal():
+    signal = np.random.default_rng(1).normal(size=SAMPLE_RATE)
+    framed = framing_signal(signal, SAMPLE_RATE)
+    # frames of a slice cut at a hop boundary are the frames of the whole signal
+    step = int(round(0.015 * SAMPLE_RATE))
+    start, num_frames = 10, 20
+    part = framing_signal(signal[start * step:], SAMPLE_RATE, num_frames=num_frames)
+    assert np.array_equal(part, framed[start:start + num_frames])
+    last = framing_signal(signal[-step:], SAMPLE_RATE, num_frames=3)
+    assert last.shape == (3, framed.shape[1]) and not last[1:].any()
+
+
+@pytest.mark.parametrize('frame_step', [120, 80, 200])
+def test_overlap_add_equals_loop(frame_step):
+    rng = np.random.default_rng(frame_step)
+    frames = rng.normal(size=(50, 240))
+    window = np.blackman(240)
+    assert np.allclose(overlap_add(frames, frame_step, window), loop_overlap_add(frames, frame_step, window))
+
+    stacked = rng.normal(size=(3, 50, 240))
+    assert np.allclose(overlap_add(stacked, frame_step, window),
+                       [overlap_add(channel, frame_step, window) for channel in stacked])
+
+
+def test_overlap_add_inverts_framing():
+    signal = np.random.default_rng(2).normal(size=SAMPLE_RATE)
+    framed = framing_signal(signal, SAMPLE_RATE)
+    frame_length = framed.shape[1]
+    rebuilt = overlap_add(framed, int(round(0.015 * SAMPLE_RATE)), np.blackman(frame_length),
+                          signal_length=len(signal))
+    assert rebuilt.shape == signal.shape
+    # the window sum is near zero at the very first and last samples only
+    inner = slice(frame_length, len(signal) - frame_length)
+    assert np.allclose(rebuilt[inner], signal[inner])
+
+    assert overlap_add(framed.astype(np.float32), 120).dtype == np.float32
+
+
+def test_deframing_signal_pads_and_cuts():
+    frames = np.random.default_rng(3).normal(size=(10, 240))
+    whole = deframing_signal(frames, 0, 240, 120)
+    assert np.allclose(whole, loop_overlap_add(frames, 120, np.ones(240), floor=1e-15))
+    assert np.array_equal(deframing_signal(frames, 1000, 240, 120), whole[:1000])
+    padded = deframing_signal(frames, len(whole) + 50, 240, 120)
+    assert np.array_equal(padded[:len(whole)], whole) and not padded[len(whole):].any()
@@ -0,0 +1,54 @@
+"""Tests of batch mode: output folders, resume and environment of the caller"""
+import os
+import shutil
+
+import pytest
+
+from voice_detection.batch import collect_files, read_manifest, result_params, run_batch
+
+
+@pytest.fixture
+def corpus(tmp_path, speech_file):
+    for name in ('x/a.wav', 'y/a.wav', 'x/z/b.wav'):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(speech_file, tmp_path / name)
+    return tmp_path
+
+
+def test_manifest_mirrors_folders_of_files(corpus):
+    manifest = corpus / 'list.txt'
+    manifest.write_text(f"# comment\nx/a.wav\ny/a.wav\n{corpus / 'x/z/b.wav'}\n")
+    files = collect_files(manifest)
+    assert [folder for _, folder in files] == ['x', 'y', 'x/z']
+    assert collect_files(corpus) == sorted(files)
+
+
+def test_colliding_results_fail(corpus):
+    shutil.copy(corpus / 'x/a.wav', corpus / 'x/a.flac')
+    with pytest.raises(ValueError, match='same results'):
+        collect_files(corpus)
+
+
+def test_run_batch_leaves_environment_of_caller(corpus, tmp_path_factory, monkeypatch):
+    monkeypatch.delenv('OMP_NUM_THREADS', raising=False)
+    environment = dict(os.environ)
+    files = collect_files(corpus)
+    summary = run_batch(files, tmp_path_factory.mktemp('out'), workers=1, threads=1,
+                        params={'denoise': None, 'save_audio': False})
+    assert summary['ok'] == len(files)
+    assert dict(os.environ) == environment
+
+
+def test_resume_skips_same_params_only(corpus, tmp_path_factory):
+    output = tmp_path_factory.mktemp('out')
+    files = collect_files(corpus)
+    params = {'denoise': None, 'save_audio': False, 'thresholds': {'rolloff_threshold': 0.7}}
+    assert run_batch(files, output, workers=1, params=params)['ok'] == len(files)
+    assert run_batch(files, output, workers=1, params=params)['skipped'] == len(files)
+
+    changed = {**params, 'thresholds': {'rolloff_threshold': 0.9}}
+    summary = run_batch(files, output, workers=1, params=changed)
+    assert summary['skipped'] == 0 and summary['ok'] == len(files)
+    # the rerun with the first params again finds its results superseded
+    assert run_batch(files, output, workers=1, params=params)['skipped'] == 0
+    assert set(read_manifest(output, result_params(params))) == {file for file, _ in files}
@@ -0,0 +1,42 @@
+"""Tests of BlockAnalysis: block-wise decisions equal the in-memory analysis at the native sample rate"""
+import numpy as np
+import pytest
+import soundfile as sf
+
+from benchmarks.signals import synthetic_speech
+from conftest import write_speech
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.blockwise import BlockAnalysis
+
+
+@pytest.fixture(scope='module')
+def phone_file(tmp_path_factory):
+    return write_speech(tmp_path_factory.mktemp('audio') / 'phone.wav', 20, sample_rate=8000, seed=2)
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+@pytest.mark.parametrize('block_frames', [8, 16, 30, 40, 100, 4096])
+def test_block_segments_equal_in_memory(speech_file, denoise, block_frames):
+    expected = SpeechAnalysis(speech_file, denoise=denoise, sample_rate='native')
+    blocks = BlockAnalysis(speech_file, denoise=denoise, block_frames=block_frames)
+    assert blocks.num_frames == expected.num_frames
+    assert np.array_equal(blocks.detect().segments, expected.detect().segments)
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+def test_block_segments_equal_in_memory_at_8k(phone_file, denoise):
+    expected = SpeechAnalysis(phone_file, denoise=denoise, sample_rate='native').detect()
+    assert np.array_equal(BlockAnalysis(phone_file, denoise=denoise, block_frames=64).detect().segments,
+                          expected.segments)
+
+
+@pytest.mark.parametrize('extra', [0, 1, 200])
+def test_block_frames_equal_in_memory_at_hop_aligned_length(tmp_path, extra):
+    # 662 sample frames, 331 sample hop: the file ends exactly on a hop boundary when extra is 0
+    signal, _ = synthetic_speech(8, 22050, seed=4)
+    path = str(tmp_path / 'aligned.wav')
+    sf.write(path, signal[:662 + 331 * 500 + extra], 22050, subtype='FLOAT')
+    expected = SpeechAnalysis(path, denoise=None, sample_rate='native')
+    blocks = BlockAnalysis(path, block_frames=64)
+    assert blocks.num_frames == expected.num_frames
+    assert np.array_equal(blocks.detect().segments, expected.detect().segments)
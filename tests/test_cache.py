@@ -0,0 +1,31 @@
+"""Tests of DescriptorCache: size cap, eviction and cache hits equal to calculated results"""
+import numpy as np
+
+from utils.cache import DescriptorCache
+from voice_detection.analysis import SpeechAnalysis
+
+
+def test_new_entry_survives_eviction_of_older(tmp_path):
+    cache = DescriptorCache(tmp_path, max_bytes=3000)
+    assert cache.store('a' * 64, {'values': np.zeros(200)})
+    assert cache.store('b' * 64, {'values': np.ones(200)})
+    assert cache.load('a' * 64) is None
+    assert np.array_equal(cache.load('b' * 64)['values'], np.ones(200))
+
+
+def test_entry_over_size_cap_is_not_stored(tmp_path):
+    cache = DescriptorCache(tmp_path, max_bytes=1000)
+    assert cache.store('a' * 64, {'values': np.zeros(100)})
+    assert not cache.store('b' * 64, {'values': np.zeros(1000)})
+    assert cache.load('b' * 64) is None
+    assert cache.load('a' * 64) is not None
+
+
+def test_cache_hit_equals_calculation(speech_file, tmp_path):
+    calculated = SpeechAnalysis(speech_file, denoise='gate', cache=tmp_path)
+    descriptors, signal = calculated.descriptors, calculated.signal
+    cached = SpeechAnalysis(speech_file, denoise='gate', cache=tmp_path)
+    assert cached._cached is not None
+    assert np.array_equal(cached.descriptors, descriptors)
+    assert np.array_equal(cached.signal, signal)
+    assert np.array_equal(cached.detect().speech_detection, calculated.detect().speech_detection)
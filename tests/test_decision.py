@@ -0,0 +1,124 @@
+"""Tests of the speech decision: vectorized, incremental and compiled rules equal the original VAD loop"""
+import numpy as np
+import pytest
+
+import utils.kernels as kernels
+from voice_detection.decision import (DESCRIPTORS, HANGOVER_FRAMES, Hangover, SegmentCollector, Thresholds,
+                                      detect_speech, hangover, impact_mask, speech_condition, unpack_impacts)
+
+
+def loop_hangover(condition, frames=HANGOVER_FRAMES):
+    """Hangover exactly as the frame loop of VAD.__voice_indexes applied it"""
+    detection = np.zeros(len(condition), dtype=bool)
+    speech_counter = 0
+    for i, speech in enumerate(condition):
+        if speech:
+            speech_counter += 1
+            if speech_counter >= frames:
+                detection[i - frames:i] = True
+        else:
+            speech_counter = 0
+    return detection
+
+
+def random_conditions(num_frames, seed, speech=0.8):
+    """Long speech runs broken by short pauses, the pattern hangover() has to bridge"""
+    return np.random.default_rng(seed).random(num_frames) < speech
+
+
+def random_deltas(num_frames, seed):
+    """Descriptor deviations around the default thresholds"""
+    rng = np.random.default_rng(seed)
+    thresholds = np.array(Thresholds())[:, None]
+    return thresholds * rng.uniform(0.5, 1.5, (len(DESCRIPTORS), num_frames))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('frames', [1, 3, HANGOVER_FRAMES])
+def test_hangover_equals_loop(seed, frames):
+    condition = random_conditions(500, seed)
+    assert np.array_equal(hangover(condition, frames), loop_hangover(condition, frames))
+
+
+def test_hangover_of_short_conditions():
+    for num_frames in range(12):
+        condition = np.ones(num_frames, dtype=bool)
+        assert np.array_equal(hangover(condition), loop_hangover(condition))
+
+
+def test_hangover_of_stacked_conditions():
+    stack = np.stack([random_conditions(300, seed) for seed in range(4)])
+    assert np.array_equal(hangover(stack), np.stack([loop_hangover(row) for row in stack]))
+
+
+def test_speech_condition_and_impacts_equal_loop():
+    thresholds = Thresholds()
+    deltas = random_deltas(1000, 0)
+    # exact threshold hits check the comparison operators
+    deltas[:, ::10] = np.array(thresholds)[:, None]
+    energy, zerocross, flatness, rolloff = deltas
+
+    expected = [(flatness[i] <= thresholds.flatness and energy[i] >= thresholds.energy and
+                 rolloff[i] <= thresholds.rolloff and zerocross[i] <= thresholds.zerocrossing)
+                for i in range(deltas.shape[1])]
+    assert np.array_equal(speech_condition(deltas, thresholds), expected)
+
+    impacts = unpack_impacts(impact_mask(deltas, thresholds))
+    assert np.array_equal(impacts[0], energy >= thresholds.energy)
+    assert np.array_equal(impacts[1], zerocross < thresholds.zerocrossing)
+    assert np.array_equal(impacts[2], flatness <= thresholds.flatness)
+    assert np.array_equal(impacts[3], rolloff <= thresholds.rolloff)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_compiled_detection_equals_numpy(seed, monkeypatch):
+    if kernels.compiled() is None:
+        pytest.skip('numba is not available')
+    deltas = random_deltas(2000, seed)
+    thresholds = Thresholds()
+    compiled = detect_speech(deltas, thresholds)
+    monkeypatch.setenv('VAD_DISABLE_NUMBA', '1')
+    assert np.array_equal(compiled, detect_speech(deltas, thresholds))
+    assert np.array_equal(compiled, loop_hangover(speech_condition(deltas, thresholds)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_hangover_equals_offline(seed):
+    condition = random_conditions(400, seed)
+    state = Hangover()
+    decisions = [state.push(value) for value in condition]
+    decisions = [decision for decision in decisions if decision is not None] + state.flush()
+    assert np.array_equal(decisions, hangover(condition))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_block_hangover_equals_offline(seed):
+    condition = random_conditions(400, seed)
+    rng = np.random.default_rng(seed)
+    state = Hangover()
+    bounds = np.unique(np.concatenate([[0], rng.integers(0, len(condition), 30), [len(condition)]]))
+    blocks = [state.push_many(condition[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+    assert np.array_equal(np.concatenate(blocks + [state.flush()]), hangover(condition))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_collected_segments_equal_speech_indexes(seed):
+    detection = hangover(random_conditions(400, seed))
+    collector = SegmentCollector()
+    collector.push(detection)
+    segments = collector.close()
+
+    # VAD.__separate_speech_information joined hops between consecutive change indexes
+    indexes = np.where(detection[:-1] != detection[1:])[0]
+    if detection[0]:
+        indexes = np.concatenate([[0], indexes])
+    if len(indexes) % 2:
+        indexes = np.concatenate([indexes, [len(detection) - 1]])
+    assert np.array_equal(segments, indexes.reshape(-1, 2))
+
+    rng = np.random.default_rng(seed)
+    collector = SegmentCollector()
+    bounds = np.unique(np.concatenate([[0], rng.integers(0, len(detection), 20), [len(detection)]]))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        collector.push(detection[start:stop])
+    assert np.array_equal(collector.close(), segments)
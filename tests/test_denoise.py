@@ -0,0 +1,24 @@
+"""Tests of SpectralGate: shared gates and gating of frames one by one"""
+import numpy as np
+
+from utils.denoise import SpectralGate
+from voice_detection.analysis import SpeechAnalysis
+
+
+def test_gate_gates_frames_independently():
+    frames = np.random.default_rng(0).normal(size=(200, 662))
+    gate = SpectralGate()
+    whole = gate.gate_frames(frames, key='noise')
+    parts = np.concatenate([gate.gate_frames(frames[:70], key='noise'), gate.gate_frames(frames[70:], key='noise')])
+    assert np.allclose(whole, parts)
+
+
+def test_shared_gate_keeps_profiles_of_other_frame_lengths_apart(speech_file):
+    gate = SpectralGate()
+    for frame_length, sample_rate in ((0.03, 22050), (0.05, 22050), (0.03, 16000)):
+        shared = SpeechAnalysis(speech_file, frame_length=frame_length, denoise='gate', gate=gate,
+                                noise_key='speech', sample_rate=sample_rate)
+        own = SpeechAnalysis(speech_file, frame_length=frame_length, denoise='gate', noise_key='speech',
+                             sample_rate=sample_rate)
+        assert np.array_equal(shared.descriptors, own.descriptors)
+    assert len(gate.profiles) == 3
@@ -0,0 +1,74 @@
+"""Tests of batched descriptors: one shared spectrum and the fused kernel equal the per-frame references"""
+import numpy as np
+import pytest
+
+from benchmarks.signals import synthetic_speech
+import utils.kernels as kernels
+from utils.audio_operations import framing_signal
+from utils.descriptors import (descriptor_matrix, fft_size, power_spectrum, spectral_descriptors, zero_crossing_frame,
+                               zero_crossing_rates)
+
+
+@pytest.fixture(scope='module')
+def framed():
+    signal, _ = synthetic_speech(2, 22050, seed=0)
+    return framing_signal(signal, 22050)[::4]
+
+
+def test_fft_size_scales_with_sample_rate():
+    assert [fft_size(rate) for rate in (8000, 16000, 22050, 44100, 48000)] == [2048, 4096, 4096, 8192, 16384]
+
+
+@pytest.mark.filterwarnings('ignore:n_fft')
+def test_spectral_descriptors_equal_librosa(framed):
+    librosa = pytest.importorskip('librosa')
+    nfft = 4096
+    spectral = spectral_descriptors(framed, 22050, nfft=nfft, block_size=7)
+    kwargs = dict(sr=22050, n_fft=nfft, pad_mode='reflect')
+    flatness = [librosa.feature.spectral_flatness(y=frame, n_fft=nfft, pad_mode='reflect')[0, 0] for frame in framed]
+    rolloff = [librosa.feature.spectral_rolloff(y=frame, roll_percent=0.97, **kwargs)[0, 0] for frame in framed]
+    bandwidth = [librosa.feature.spectral_bandwidth(y=frame, **kwargs)[0, 0] for frame in framed]
+    assert np.allclose(spectral['flatness'], flatness, rtol=1e-6, atol=0)
+    assert np.array_equal(spectral['rolloff'], rolloff)
+    assert np.allclose(spectral['bandwidth'], bandwidth, rtol=1e-6, atol=0)
+
+    magnitude = np.abs(librosa.stft(framed[0], n_fft=nfft, pad_mode='reflect')[:, 0])
+    assert np.allclose(power_spectrum(framed[:1], nfft)[0], magnitude, rtol=1e-6, atol=1e-9)
+
+
+def test_spectral_descriptors_do_not_depend_on_block_size(framed):
+    whole = spectral_descriptors(framed, block_size=len(framed))
+    for block_size in (1, 5, 64):
+        blocks = spectral_descriptors(framed, block_size=block_size)
+        for name in whole:
+            assert np.allclose(blocks[name], whole[name], rtol=1e-12, atol=0)
+
+
+def test_zero_crossing_rates_equal_reference(framed):
+    # without values close to zero the threshold and np.sign() agree
+    assert np.allclose(zero_crossing_rates(framed[:, 1:-1]), [zero_crossing_frame(frame) for frame in framed[:, 1:-1]])
+
+
+def test_kernel_equals_numpy(framed, monkeypatch):
+    if kernels.compiled() is None:
+        pytest.skip('numba is not available')
+    energy, crossings = kernels.energy_zero_crossings(framed)
+    serial = kernels.compiled()['serial_energy_zero_crossings'](np.ascontiguousarray(framed), 1e-10)
+    assert np.array_equal(energy, serial[0]) and np.array_equal(crossings, serial[1])
+
+    monkeypatch.setenv('VAD_DISABLE_NUMBA', '1')
+    numpy_energy, numpy_crossings = kernels.energy_zero_crossings(framed)
+    # sequential and pairwise summation differ in the last bits only
+    assert np.allclose(energy, numpy_energy, rtol=1e-12, atol=0)
+    assert np.array_equal(crossings, numpy_crossings)
+    assert np.array_equal(crossings, zero_crossing_rates(framed))
+
+
+def test_descriptor_matrix_columns(framed):
+    matrix = descriptor_matrix(framed)
+    spectral = spectral_descriptors(framed)
+    assert matrix.shape == (len(framed), 4)
+    assert np.allclose(matrix[:, 0], np.mean(framed ** 2, axis=1), rtol=1e-12, atol=0)
+    assert np.array_equal(matrix[:, 1], zero_crossing_rates(framed))
+    assert np.array_equal(matrix[:, 2], spectral['flatness'])
+    assert np.array_equal(matrix[:, 3], spectral['rolloff'])
@@ -0,0 +1,19 @@
+"""Tests of cold start: entry points import fast and load no heavy optional dependency"""
+import pytest
+
+from benchmarks.import_time import import_time
+
+BUDGET = 1.0
+
+
+@pytest.mark.parametrize('module', ['voice_detection.vad', 'voice_detection.analysis', 'voice_detection.batch',
+                                    'voice_detection.server', 'voice_detection.stream'])
+def test_no_heavy_modules_on_import(module):
+    _, loaded = import_time(module)
+    assert loaded == []
+
+
+def test_vad_import_within_budget():
+    # the best of a few fresh interpreters, so a busy machine does not fail the check
+    seconds = min(import_time('voice_detection.vad')[0] for _ in range(3))
+    assert seconds < BUDGET
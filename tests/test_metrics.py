@@ -0,0 +1,76 @@
+"""Tests of stage metrics: instrumented methods, measurements and the Prometheus text format"""
+import re
+import time
+
+import numpy as np
+import pytest
+
+from utils.metrics import Metrics, StageMetrics, instrumented
+from voice_detection.vad import VAD
+
+
+class Stages:
+    """Object with instrumented stages, metrics are switched on by assigning a Metrics object"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.frames = np.zeros((50, 4))
+        self.calls = 0
+
+    @instrumented('allocate', frames_attribute='frames')
+    def allocate(self, size):
+        self.calls += 1
+        data = np.ones(size, dtype=np.uint8)
+        time.sleep(0.02)
+        return int(data.sum())
+
+    @instrumented('count', frames_attribute='calls')
+    def count(self):
+        raise ValueError('failed stage')
+
+
+def test_instrumented_does_nothing_without_metrics():
+    stages = Stages()
+    assert stages.allocate(10) == 10 and stages.metrics is None
+
+
+def test_instrumented_measures_time_memory_and_frames():
+    stages = Stages(Metrics(labels={'file': 'a.wav'}, log=False))
+    assert stages.allocate(2 ** 22) == 2 ** 22
+    metrics = stages.metrics.stages['allocate']
+    assert metrics.wall_time >= 0.02 and metrics.cpu_time >= 0
+    assert metrics.peak_memory >= 2 ** 22
+    assert metrics.frames == 50 and metrics.frames_per_second == 50 / metrics.wall_time
+
+    # failed stages are measured too, integer attributes are frame counts
+    with pytest.raises(ValueError):
+        stages.count()
+    assert list(stages.metrics.stages) == ['allocate', 'count'] and stages.metrics.stages['count'].frames == 1
+    assert stages.metrics.total_time == sum(stage.wall_time for stage in stages.metrics.stages.values())
+
+
+def test_prometheus_text_format():
+    metrics = Metrics(labels={'file': 'say "hi"\\now.wav'}, log=False)
+    metrics.add(StageMetrics('load', 0.5, 0.25, 1024, frames=100))
+    metrics.add(StageMetrics('save', 0.1, 0.1, 0))
+    lines = metrics.to_prometheus().splitlines()
+
+    assert lines[:2] == ['# HELP vad_stage_wall_seconds Wall time of VAD stage', '# TYPE vad_stage_wall_seconds gauge']
+    assert 'vad_stage_wall_seconds{file="say \\"hi\\"\\\\now.wav",stage="load"} 0.5' in lines
+    assert 'vad_stage_frames_per_second{file="say \\"hi\\"\\\\now.wav",stage="load"} 200.0' in lines
+    # throughput is left out where frames are unknown
+    assert not any(line.startswith('vad_stage_frames_per_second') and 'stage="save"' in line for line in lines)
+    sample = re.compile(r'^vad_stage_\w+\{(\w+="(\\.|[^"\\])*",?)+\} [0-9.e+-]+$')
+    assert all(line.startswith('# ') or sample.match(line) for line in lines)
+
+
+def test_vad_writes_prometheus_file(speech_file, tmp_path):
+    path = tmp_path / 'vad.prom'
+    vad = VAD(speech_file, save_path=str(tmp_path), denoise=None, metrics_path=str(path))
+    stages = ['speech_descriptors', 'mean_values', 'voice_indexes', 'separate_speech_information', 'save_signal']
+    assert list(vad.metrics.stages) == stages
+    text = path.read_text()
+    assert text == vad.metrics.to_prometheus()
+    for stage in stages:
+        assert f'vad_stage_wall_seconds{{file="speech.wav",stage="{stage}"}}' in text
+    assert VAD(speech_file, save_audio=False, denoise=None).metrics is None
@@ -0,0 +1,42 @@
+"""Tests of MultiChannelAnalysis: the batched pass equals separate analyses of every channel"""
+import numpy as np
+import pytest
+
+from conftest import write_speech
+from utils.denoise import SpectralGate
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.multichannel import MultiChannelAnalysis
+
+
+@pytest.fixture(scope='module')
+def stereo_file(tmp_path_factory):
+    return write_speech(tmp_path_factory.mktemp('audio') / 'stereo.wav', 6, channels=2, seed=5)
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+def test_channels_equal_single_channel_analysis(stereo_file, denoise):
+    batched = MultiChannelAnalysis(stereo_file, denoise=denoise)
+    detection = batched.detect()
+    assert batched.num_channels == 2
+    for channel in range(2):
+        single = SpeechAnalysis(stereo_file, denoise=denoise, channel=channel)
+        assert np.array_equal(batched.signal[channel], single.signal)
+        assert np.array_equal(batched.descriptors[channel], single.descriptors)
+        expected = single.detect()
+        assert np.array_equal(detection.speech_detection[channel], expected.speech_detection)
+        assert np.array_equal(detection.segments[channel], expected.segments)
+        # per channel analyses reuse the batched arrays with their own thresholds
+        tuned = batched.channels[channel].detect(flatness_threshold=0.2)
+        assert np.array_equal(tuned.speech_detection, single.detect(flatness_threshold=0.2).speech_detection)
+
+
+def test_channels_sharing_a_gate_keep_own_profiles(stereo_file):
+    gate = SpectralGate()
+    shared = [SpeechAnalysis(stereo_file, denoise='gate', gate=gate, channel=channel).descriptors for channel in (0, 1)]
+    assert len(gate.profiles) == 2
+    for channel in (0, 1):
+        assert np.array_equal(shared[channel], SpeechAnalysis(stereo_file, denoise='gate', channel=channel).descriptors)
+
+    # the batched analysis uses the same keys, so it reuses the profiles of single channels
+    batched = MultiChannelAnalysis(stereo_file, denoise='gate', gate=gate)
+    assert np.array_equal(batched.descriptors, shared) and len(gate.profiles) == 2
@@ -0,0 +1,97 @@
+"""Tests of segments: exported files load back, and in-memory, streamed and block-wise output are the same audio"""
+import csv
+import json
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from utils.segments import (CROSSFADE, crossfade_lengths, export_segments, join_segments, load_segments,
+                            segments_to_seconds, stitched_chunks, write_segments)
+from voice_detection.blockwise import BlockAnalysis
+from voice_detection.vad import VAD
+
+SEGMENTS = np.array([[100, 900], [1000, 1010], [1200, 3000], [3500, 4000]])
+
+
+# CSV keeps microseconds, RTTM rounds start and duration to milliseconds
+@pytest.mark.parametrize('segment_format, tolerance', [('json', 0), ('csv', 1e-6), ('rttm', 2e-3)])
+def test_exported_segments_load_back(tmp_path, segment_format, tolerance):
+    path = export_segments(SEGMENTS, 8000, tmp_path / f'recording.{segment_format}')
+    loaded = load_segments(path)
+    assert loaded.shape == SEGMENTS.shape
+    assert np.allclose(loaded, segments_to_seconds(SEGMENTS, 8000), rtol=0, atol=tolerance)
+
+
+def test_exported_samples_are_exact(tmp_path):
+    record = json.loads(export_segments(SEGMENTS, 8000, tmp_path / 'a.json', file_id='a').read_text())
+    assert record['file'] == 'a' and record['sample_rate'] == 8000
+    assert [[segment['start_sample'], segment['end_sample']] for segment in record['segments']] == SEGMENTS.tolist()
+
+    with open(export_segments(SEGMENTS, 8000, tmp_path / 'a.csv'), newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert [[int(row['start_sample']), int(row['end_sample'])] for row in rows] == SEGMENTS.tolist()
+
+
+def test_rttm_field_layout(tmp_path):
+    path = export_segments(SEGMENTS, 8000, tmp_path / 'out.rttm', file_id='my recording', channel=2)
+    lines = path.read_text().splitlines()
+    assert len(lines) == len(SEGMENTS)
+    for line, (start, end) in zip(lines, SEGMENTS):
+        fields = line.split(' ')
+        assert len(fields) == 10
+        assert fields[:3] == ['SPEAKER', 'my_recording', '2']
+        assert fields[3] == f'{start / 8000:.3f}' and fields[4] == f'{(end - start) / 8000:.3f}'
+        assert fields[5:] == ['<NA>', '<NA>', 'speech', '<NA>', '<NA>']
+
+
+def test_unknown_segment_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Unknown segment format'):
+        export_segments(SEGMENTS, 8000, tmp_path / 'out.txt')
+    with pytest.raises(ValueError, match='Unknown segment format'):
+        load_segments(tmp_path / 'out.txt')
+
+
+def test_hard_cuts_concatenate_segments():
+    signal = np.random.default_rng(0).normal(size=5000)
+    expected = np.concatenate([signal[start:end] for start, end in SEGMENTS])
+    assert np.array_equal(join_segments(signal, SEGMENTS), expected)
+
+
+def test_crossfade_shortens_by_fade_lengths_and_keeps_constant_signal():
+    signal = np.ones(5000)
+    joined = join_segments(signal, SEGMENTS, crossfade=64)
+    assert len(joined) == np.diff(SEGMENTS).sum() - crossfade_lengths(SEGMENTS, 64).sum()
+    # complementary gains sum to one
+    assert np.allclose(joined, 1)
+
+
+def test_streamed_segments_equal_joined(tmp_path):
+    signal = np.random.default_rng(1).normal(0, 0.1, (5000, 2)).astype(np.float32)
+    path = write_segments(tmp_path / 'out.wav', signal, SEGMENTS, 8000, crossfade=40)
+    written, _ = sf.read(path, dtype='float32')
+    joined = join_segments(signal, SEGMENTS, crossfade=40)
+    assert np.allclose(written, joined, atol=1e-4)
+    assert sum(len(chunk) for chunk in stitched_chunks(signal, SEGMENTS, 40)) == len(joined)
+
+
+def test_block_save_equals_joined_file_signal(speech_file, tmp_path):
+    detection = BlockAnalysis(speech_file, block_frames=128).detect()
+    signal, sample_rate = sf.read(speech_file, dtype='float64')
+    for crossfade in (0, 0.005):
+        path = detection.save(tmp_path, chunk_size=1000, crossfade=crossfade)
+        written, _ = sf.read(path, dtype='float64')
+        expected = join_segments(signal, detection.segments, int(round(crossfade * sample_rate)))
+        assert np.allclose(written, expected, atol=1e-4)
+
+
+def test_vad_cuts_hard_unless_crossfade_is_asked_for(speech_file, tmp_path):
+    vad = VAD(speech_file, save_path=str(tmp_path), denoise=None)
+    expected = np.concatenate([vad.signal[start:end] for start, end in vad.segments])
+    assert np.array_equal(vad.cutted_signal, expected)
+    written, _ = sf.read(tmp_path / 'speech_vad.wav', dtype='float64')
+    assert np.allclose(written, expected, atol=1e-4)
+
+    faded = VAD(speech_file, save_audio=False, denoise=None, crossfade=CROSSFADE)
+    assert np.array_equal(faded.cutted_signal,
+                          join_segments(vad.signal, vad.segments, int(round(CROSSFADE * vad.sample_rate))))
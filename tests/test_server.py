@@ -0,0 +1,134 @@
+"""Tests of the local service: answers of every endpoint, request errors are reported to the client with 4xx"""
+import asyncio
+import http.client
+import io
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.server import VADServer, analyse
+from voice_detection.stream import StreamingVAD
+
+
+def serve(client, params=None):
+    """Run client(port) on a thread while a server with one worker is running
+
+    :return result of client.
+    """
+    async def run():
+        server = VADServer(port=0, workers=1, params=params or {'denoise': 'gate'})
+        await server.start()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, client, server.port)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def _post(port, path, body):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=body, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def _post_chunked(port, path, blocks):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('POST', path, body=iter(blocks), encode_chunked=True)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+@pytest.fixture(scope='module')
+def audio(speech_file):
+    with open(speech_file, 'rb') as file:
+        return file.read()
+
+
+def test_undecodable_body_is_value_error():
+    with pytest.raises(ValueError, match='can not decode audio'):
+        analyse(b'not audio' * 100, {'denoise': 'gate'})
+
+
+def test_service_answers_bad_requests_with_400(audio):
+    def client(port):
+        responses = [_post(port, path, body) for path, body in (('/segments', b'not audio' * 100), ('/trim', b'RIFF'),
+                                                                 ('/segments', audio))]
+        with socket.create_connection(('127.0.0.1', port), timeout=60) as connection:
+            connection.sendall(b'POST /segments HTTP/1.1\r\nHost: localhost\r\nContent-Length: abc\r\n\r\n')
+            responses.append(connection.recv(1024))
+        return responses
+
+    (bad_status, bad_body), (trim_status, _), (status, body), length_response = serve(client)
+    assert bad_status == 400 and bad_body.startswith(b'can not decode audio')
+    assert trim_status == 400
+    assert status == 200 and json.loads(body)['segments']
+    assert length_response.startswith(b'HTTP/1.1 400 ') and b'invalid Content-Length' in length_response
+
+
+def test_trim_returns_speech_signal(speech_file, audio):
+    status, body = serve(lambda port: _post(port, '/trim', audio))
+    assert status == 200
+    trimmed, sample_rate = sf.read(io.BytesIO(body), dtype='float64')
+    expected = SpeechAnalysis(speech_file, denoise='gate').detect().speech_signal()
+    assert sample_rate == 22050 and len(trimmed) == len(expected)
+    # the response is 16 bit PCM
+    assert np.allclose(trimmed, expected, atol=2 ** -15)
+
+
+def test_stream_answers_speech_events(speech_file):
+    signal, sample_rate = sf.read(speech_file, dtype='float64')
+    pcm = np.round(np.clip(signal, -1, 1 - 2 ** -15) * 2 ** 15).astype('<i2').tobytes()
+    # odd block sizes split samples between chunks
+    blocks = [pcm[start:start + 9999] for start in range(0, len(pcm), 9999)]
+    status, body = serve(lambda port: _post_chunked(port, f'/stream?sample_rate={sample_rate}', blocks))
+    assert status == 200
+
+    detector = StreamingVAD(sample_rate)
+    samples = np.frombuffer(pcm, dtype='<i2')
+    expected = detector.process(samples.astype(np.float32) / 2 ** 15) + detector.flush()
+    events = [json.loads(line) for line in body.decode().splitlines()]
+    assert [(event['kind'], event['sample']) for event in events] == [(event.kind, event.sample)
+                                                                       for event in expected]
+    assert expected
+
+
+def test_stream_error_aborts_response(monkeypatch):
+    def fail(self, block):
+        raise RuntimeError('broken detector')
+
+    monkeypatch.setattr(StreamingVAD, 'process', fail)
+    block = np.zeros(22050, dtype='<i2').tobytes()
+
+    def client(port):
+        received = b''
+        with socket.create_connection(('127.0.0.1', port), timeout=60) as connection:
+            connection.sendall(b'POST /stream?sample_rate=22050 HTTP/1.1\r\nHost: localhost\r\n'
+                               b'Transfer-Encoding: chunked\r\n\r\n' +
+                               f'{len(block):x}\r\n'.encode() + block + b'\r\n0\r\n\r\n')
+            try:
+                while True:
+                    data = connection.recv(65536)
+                    if not data:
+                        break
+                    received += data
+            except ConnectionError:
+                pass
+        return received
+
+    received = serve(client)
+    # the 200 header is already sent, a second response must not be written into the chunked body
+    assert received.startswith(b'HTTP/1.1 200 OK')
+    assert b'HTTP/1.1 500' not in received and not received.endswith(b'0\r\n\r\n')
@@ -0,0 +1,53 @@
+"""Tests of ShardedAnalysis: shards merged in any executor are the same as a single pass"""
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import ROOT, write_speech
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.sharding import MIN_SHARD_FRAMES, ShardedAnalysis, shard_bounds
+
+
+@pytest.fixture(scope='module')
+def long_file(tmp_path_factory):
+    """Recording long enough for a few shards, at 8 kHz to keep it cheap"""
+    return write_speech(tmp_path_factory.mktemp('audio') / 'long.wav', 100, sample_rate=8000, seed=3)
+
+
+def test_shard_bounds_cover_all_frames():
+    bounds = shard_bounds(10 * MIN_SHARD_FRAMES + 7, 4)
+    assert bounds[0, 0] == 0 and bounds[-1, 1] == 10 * MIN_SHARD_FRAMES + 7
+    assert np.array_equal(bounds[1:, 0], bounds[:-1, 1])
+    assert len(shard_bounds(MIN_SHARD_FRAMES, 8)) == 1
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+def test_sharded_threads_equal_single_pass(long_file, denoise):
+    single = SpeechAnalysis(long_file, denoise=denoise, sample_rate='native')
+    sharded = ShardedAnalysis(long_file, denoise=denoise, sample_rate='native', workers=2, shards=3)
+    assert np.array_equal(single.descriptors, sharded.descriptors)
+    assert np.array_equal(single.signal, sharded.signal)
+    assert np.array_equal(single.detect().speech_detection, sharded.detect().speech_detection)
+
+
+SCRIPT = """
+import sys
+import numpy as np
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.sharding import ShardedAnalysis
+
+# the parallel kernel runs in the main thread of the parent before the pool is created
+single = SpeechAnalysis(sys.argv[1], denoise='gate', sample_rate='native')
+sharded = ShardedAnalysis(sys.argv[1], denoise='gate', sample_rate='native', workers=2, shards=2, executor='process')
+assert np.array_equal(single.detect().speech_detection, sharded.detect().speech_detection)
+print('ok')
+"""
+
+
+def test_process_executor_after_analysis_exits(long_file):
+    result = subprocess.run([sys.executable, '-c', SCRIPT, long_file], cwd=ROOT, capture_output=True, text=True,
+                            timeout=180)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'ok'
@@ -0,0 +1,49 @@
+"""Tests of StreamingVAD: results do not depend on how the stream is cut into blocks"""
+import numpy as np
+import pytest
+import soundfile as sf
+
+from voice_detection.stream import StreamingVAD
+
+
+def stream_events(signal, sample_rate, block_size):
+    vad = StreamingVAD(sample_rate)
+    events = []
+    for start in range(0, len(signal), block_size):
+        events.extend(vad.process(signal[start:start + block_size]))
+    return [(event.kind, event.sample) for event in events + vad.flush()]
+
+
+def stream_trim(signal, sample_rate, block_size):
+    vad = StreamingVAD(sample_rate)
+    chunks = [vad.trim(signal[start:start + block_size]) for start in range(0, len(signal), block_size)]
+    return np.concatenate(chunks + [vad.flush(chunks=True)])
+
+
+@pytest.fixture(scope='module')
+def audio(speech_file):
+    return sf.read(speech_file, dtype='float64')
+
+
+def test_events_do_not_depend_on_block_size(audio):
+    signal, sample_rate = audio
+    expected = stream_events(signal, sample_rate, len(signal))
+    assert expected and expected[0][0] == 'start'
+    for block_size in (1, 160, 331, 4096):
+        assert stream_events(signal, sample_rate, block_size) == expected
+
+
+def test_trim_joins_samples_between_events(audio):
+    signal, sample_rate = audio
+    events = stream_events(signal, sample_rate, 512)
+    starts = [sample for kind, sample in events if kind == 'start']
+    ends = [sample for kind, sample in events if kind == 'end']
+    expected = np.concatenate([signal[start:end] for start, end in zip(starts, ends)])
+    for block_size in (160, 4096):
+        assert np.array_equal(stream_trim(signal, sample_rate, block_size), expected)
+
+
+def test_integer_pcm_is_scaled(audio):
+    signal, sample_rate = audio
+    pcm = np.round(np.clip(signal, -1, 1 - 2 ** -15) * 2 ** 15).astype(np.int16)
+    assert stream_events(pcm, sample_rate, 1024) == stream_events(pcm / 2 ** 15, sample_rate, 1024)
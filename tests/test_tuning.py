@@ -0,0 +1,44 @@
+"""Tests of threshold tuning: broadcast evaluation scores every combination like a separate detect() call"""
+import numpy as np
+import pytest
+
+from benchmarks.signals import synthetic_speech
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.decision import Thresholds
+from voice_detection.tuning import (VAD_PARAMS, evaluate, random_thresholds, reference_hops, score_detections,
+                                    threshold_grid, tune)
+
+
+@pytest.fixture(scope='module')
+def analysis(speech_file):
+    return SpeechAnalysis(speech_file, denoise=None)
+
+
+@pytest.fixture(scope='module')
+def reference(analysis):
+    _, segments = synthetic_speech(8, 22050, seed=0)
+    return segments / 22050
+
+
+@pytest.mark.parametrize('metric', ['f1', 'accuracy'])
+def test_evaluate_equals_separate_detections(analysis, reference, metric):
+    frame_step = int(round(analysis.frame_overlap * analysis.sample_rate))
+    labels = reference_hops(reference, analysis.num_frames - 1, frame_step, analysis.sample_rate)
+    grid = threshold_grid()[::37]
+    thresholds = np.vstack([grid, random_thresholds(50, seed=1)])
+    names = [VAD_PARAMS[name] for name in Thresholds._fields]
+    expected = [score_detections(analysis.detect(**dict(zip(names, row))).speech_detection[None], labels, metric)[0]
+                for row in thresholds]
+    # chunks that do not divide the number of combinations
+    assert np.array_equal(evaluate(analysis.deltas, thresholds, labels, metric, chunk_size=7), expected)
+
+
+def test_tune_returns_params_of_best_combination(analysis, reference):
+    result = tune(analysis, reference, samples=200, refine=2)
+    assert len(result.scores) == 600
+    score, best = result.top(1)[0]
+    assert score == result.best_score and best == result.best_thresholds
+    frame_step = int(round(analysis.frame_overlap * analysis.sample_rate))
+    labels = reference_hops(reference, analysis.num_frames - 1, frame_step, analysis.sample_rate)
+    detection = analysis.detect(**result.best_params)
+    assert score_detections(detection.speech_detection[None], labels)[0] == result.best_score
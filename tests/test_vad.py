@@ -0,0 +1,15 @@
+"""Tests of VAD: the staged API gives the same result as the main entry point"""
+import numpy as np
+import pytest
+
+from voice_detection.analysis import SpeechAnalysis
+from voice_detection.vad import VAD
+
+
+@pytest.mark.parametrize('denoise', [None, 'gate'])
+def test_vad_passes_denoise_to_analysis(speech_file, denoise):
+    vad = VAD(speech_file, save_audio=False, denoise=denoise)
+    detection = SpeechAnalysis(speech_file, denoise=denoise).detect()
+    assert vad.analysis.denoise == denoise
+    assert np.array_equal(vad.speech_detection, detection.speech_detection)
+    assert np.array_equal(vad.segments, detection.segments)
@@ -0,0 +1,16 @@
+"""Tests of plotting helpers: detected spans and decimated lines"""
+import numpy as np
+
+from utils.visualize import detection_spans, min_max_envelope
+
+
+def test_detection_spans_follow_hop():
+    detect = np.array([0, 1, 1, 0, 0, 1, 1, 1], dtype=bool)
+    assert np.allclose(detection_spans(detect, 0.01), [[0.01, 0.03], [0.05, 0.08]])
+
+
+def test_min_max_envelope_keeps_extremes():
+    values = np.sin(np.linspace(0, 100, 100000))
+    time, minimum, maximum = min_max_envelope(values, 10.0, max_points=1000)
+    assert len(time) == 1000
+    assert minimum.min() == values.min() and maximum.max() == values.max()
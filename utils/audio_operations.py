@@ -3,7 +3,7 @@
 import decimal
 
 import numpy as np
-import sklearn
+import soundfile as sf
 
 
 def round_half_up(number):
@@ -16,30 +16,90 @@ def round_half_up(number):
     return rounded_value
 
 
-def framing_signal(audio_signal, sample_rate, frame_length=0.03, frame_overlap=0.015, ):
-    """Separate audio signal into frames
+def frame_count(signal_length, sample_rate, frame_length=0.03, frame_overlap=0.015):
+    """Number of frames framing_signal makes of a signal
 
-    :param audio_signal: librosa.open() object;
+    :param signal_length: number of samples;
+    :param sample_rate: sample rate of audio signal;
     :param frame_length: length of each frame (default = 0.03);
     :param frame_overlap: duration of frames overlap (default = 0.015);
-    :param sample_rate: sample rate of audio signal (librosa open() object)
-    :return numpy array of frames.
+    :return number of frames.
     """
-    frame_length, frame_step = frame_length * sample_rate, frame_overlap * sample_rate
-    signal_length = len(audio_signal)
-    frame_length = int(round(frame_length))
-    frame_step = int(round(frame_step))
-    num_frames = int(np.ceil(float(np.abs(signal_length - frame_length)) / frame_step))
+    frame_length = int(round(frame_length * sample_rate))
+    frame_step = int(round(frame_overlap * sample_rate))
+    return int(np.ceil(float(np.abs(signal_length - frame_length)) / frame_step))
 
-    pad_signal_length = num_frames * frame_step + frame_length
-    z = np.zeros((pad_signal_length - signal_length))
-    pad_signal = np.append(audio_signal, z)
 
-    indices = np.tile(np.arange(0, frame_length), (num_frames, 1)) + np.tile(
-        np.arange(0, num_frames * frame_step, frame_step), (frame_length, 1)).T
-    frames = pad_signal[indices.astype(np.int32, copy=False)]
-    frames *= np.blackman(frame_length)
-    return frames
+def framing_signal(audio_signal, sample_rate, frame_length=0.03, frame_overlap=0.015, dtype=np.float64,
+                   num_frames=None):
+    """Separate audio signal into frames
+
+    Frames are a windowed copy of a strided view of the zero padded signal, so the only allocations are the padded
+    signal and the frames themselves, both of ``dtype``. Signals of several channels are framed at once.
+
+    :param audio_signal: numpy array of audio signal (samples,) or (channels, samples);
+    :param frame_length: length of each frame (default = 0.03);
+    :param frame_overlap: duration of frames overlap (default = 0.015);
+    :param sample_rate: sample rate of audio signal;
+    :param dtype: float dtype of frames, float32 halves memory (default: float64);
+    :param num_frames: number of frames, the signal is zero padded or cut to fit them, e.g. for a slice of a longer
+        signal (default: frame_count() of the signal);
+    :return numpy array of frames (num_frames, frame_length) or (channels, num_frames, frame_length).
+    """
+    signal_length = np.shape(audio_signal)[-1]
+    if num_frames is None:
+        num_frames = frame_count(signal_length, sample_rate, frame_length, frame_overlap)
+    frame_length = int(round(frame_length * sample_rate))
+    frame_step = int(round(frame_overlap * sample_rate))
+
+    pad_length = num_frames * frame_step + frame_length
+    pad_signal = np.zeros(np.shape(audio_signal)[:-1] + (pad_length,), dtype=dtype)
+    signal_length = min(signal_length, pad_length)
+    pad_signal[..., :signal_length] = audio_signal[..., :signal_length]
+
+    windows = np.lib.stride_tricks.sliding_window_view(pad_signal, frame_length, axis=-1)
+    windows = windows[..., :num_frames * frame_step:frame_step, :]
+    return windows * np.blackman(frame_length).astype(dtype)
+
+
+def overlap_add(framed_signal, frame_step, window=None, signal_length=None, floor=1e-3):
+    """Rebuild signal from windowed frames dividing by the sum of overlapping windows, the inverse of framing_signal
+
+    Frames are split into ``ceil(frame_length / frame_step)`` phases of ``frame_step`` samples. The phase k of every
+    frame lands on hop block i + k of the signal, so each phase is added to the signal as one shifted slice. The loop
+    runs over phases only, usually 2, and the cost is linear in the number of samples. Frames of several channels
+    (..., num_frames, frame_length) are rebuilt at once.
+
+    :param framed_signal: numpy array of windowed frames (..., num_frames, frame_length);
+    :param frame_step: number of samples between frame starts;
+    :param window: analysis window frames were multiplied by (default: rectangular);
+    :param signal_length: length of result, longer results are zero padded (default: whole covered length);
+    :param floor: lower bound of the window sum, blackman edges are close to zero and a floor keeps the first and
+        last samples from blowing up (default: 1e-3);
+    :return numpy array of signal (..., signal_length) of the dtype of frames.
+    """
+    framed_signal = np.asarray(framed_signal)
+    *batch, num_frames, frame_length = framed_signal.shape
+    window = np.ones(frame_length) if window is None else np.asarray(window, dtype=np.float64)
+    phases = -(-frame_length // frame_step)
+    padding = phases * frame_step - frame_length
+    length = (num_frames - 1) * frame_step + frame_length
+
+    # accumulate in float64 like np.bincount, frames of float32 are converted one phase at a time
+    signal = np.zeros((*batch, num_frames + phases - 1, frame_step))
+    weights = np.zeros((num_frames + phases - 1, frame_step))
+    blocks = np.pad(window, (0, padding)).reshape(phases, frame_step)
+    for phase in range(phases):
+        width = min(frame_step, frame_length - phase * frame_step)
+        part = framed_signal[..., phase * frame_step:phase * frame_step + width]
+        signal[..., phase:phase + num_frames, :width] += part
+        weights[phase:phase + num_frames] += blocks[phase]
+
+    signal = signal.reshape(*batch, -1)[..., :length]
+    signal /= np.maximum(weights.reshape(-1)[:length], floor)
+    if signal_length is not None and signal_length > length:
+        signal = np.concatenate([signal, np.zeros((*batch, signal_length - length))], axis=-1)
+    return signal[..., :signal_length].astype(framed_signal.dtype, copy=False)
 
 
 def deframing_signal(array_of_frames, signal_length, frame_length, frame_overlap,
@@ -47,39 +107,76 @@ def deframing_signal(array_of_frames, signal_length, frame_length, frame_overlap
     """Concatenate framing signal into normal signal
 
     :param array_of_frames: numpy array of audio signal frames;
-    :param signal_length: audio signal length using len() function;
-    :param frame_length: length of each frame (default = 0.03);
-    :param frame_overlap: duration of frames overlap (default = 0.015);
+    :param signal_length: audio signal length using len() function, 0 or less for the whole covered length;
+    :param frame_length: length of each frame in samples;
+    :param frame_overlap: number of samples between frame starts;
     :param window_function: window function;
     :return array of audio signal.
     """
     frame_length = round_half_up(frame_length)
     frame_overlap = round_half_up(frame_overlap)
-    number_of_frames = np.shape(array_of_frames)[0]
-    assert np.shape(array_of_frames)[
-               1] == number_of_frames, '"frames" matrix is wrong size, 2nd dim is not equal to frame_len'
+    assert np.shape(array_of_frames)[-1] == frame_length, \
+        '"frames" matrix is wrong size, 2nd dim is not equal to frame_len'
+    return overlap_add(array_of_frames, frame_overlap, window_function(frame_length),
+                       signal_length=signal_length if signal_length > 0 else None, floor=1e-15)
 
-    indices = np.tile(np.arange(0, frame_length), (number_of_frames, 1)) + np.tile(
-        np.arange(0, number_of_frames * frame_overlap, frame_overlap), (frame_length, 1)).T
-    indices = np.array(indices, dtype=np.int32)
-    padlen = (number_of_frames - 1) * frame_overlap + frame_length
 
-    if signal_length <= 0:
-        siglen = padlen
+def normalize(x, axis=0):
+    """Normalize any array of values to [0, 1] range, like sklearn.preprocessing.minmax_scale"""
+    x = np.asarray(x, dtype=np.float64)
+    minimum = np.min(x, axis=axis, keepdims=True)
+    scale = np.max(x, axis=axis, keepdims=True) - minimum
+    scale[scale < 10 * np.finfo(np.float64).eps] = 1
+    return (x - minimum) / scale
 
-    rec_signal = np.zeros((padlen,))
-    window_correction = np.zeros((padlen,))
-    win = window_function(frame_length)
 
-    for i in range(0, number_of_frames):
-        window_correction[indices[i, :]] = window_correction[
-                                               indices[i, :]] + win + 1e-15  # add a little bit so it is never zero
-        rec_signal[indices[i, :]] = rec_signal[indices[i, :]] + array_of_frames[i, :]
+def load(file, sample_rate=22050, mono=True):
+    """Load audio file with soundfile and resample it with polyphase filter
 
-    rec_signal = rec_signal / window_correction
-    return rec_signal[0:siglen]
+    Formats soundfile can not decode are loaded with librosa, which is imported only in this case. At the native
+    sample rate the decoded samples are returned without any filtering.
 
+    :param file: name of audio file with path;
+    :param sample_rate: target sample rate, 'native' or None keeps the sample rate of file (default: 22050);
+    :param mono: if True average channels (default: True);
+    :return tuple of float32 signal (samples,) or (channels, samples) and sample rate.
+    """
+    if sample_rate == 'native':
+        sample_rate = None
+    try:
+        signal, native_rate = sf.read(file, dtype='float32', always_2d=True)
+    except RuntimeError:
+        import librosa
+        return librosa.load(file, sr=sample_rate, mono=mono)
+
+    signal = signal.mean(axis=1) if mono else signal.T
+    if sample_rate is None:
+        sample_rate = native_rate
+    elif native_rate != sample_rate:
+        signal = resample(signal, native_rate, sample_rate)
+    return np.ascontiguousarray(signal, dtype=np.float32), sample_rate
+
+
+def resample(signal, original_rate, target_rate):
+    """Resample signal along last axis with scipy polyphase filter
+
+    :param signal: numpy array of audio signal;
+    :param original_rate: sample rate of signal;
+    :param target_rate: target sample rate;
+    :return resampled numpy array.
+    """
+    from scipy.signal import resample_poly
 
-def normalize(x, axis=0):
-    """Normalize any array of values"""
-    return sklearn.preprocessing.minmax_scale(x, axis=axis)
+    divisor = np.gcd(int(original_rate), int(target_rate))
+    return resample_poly(signal, int(target_rate) // divisor, int(original_rate) // divisor, axis=-1)
+
+
+def preemphasis(signal, coef=0.97):
+    """Apply preemphasis filter y[n] = x[n] - coef * x[n - 1]
+
+    :param signal: numpy array of audio signal;
+    :param coef: filter coefficient (default: 0.97);
+    :return numpy array of filtered signal.
+    """
+    signal = np.asarray(signal)
+    return np.append(signal[:1], signal[1:] - coef * signal[:-1])
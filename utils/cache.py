@@ -0,0 +1,199 @@
+"""This module provides content-addressed on-disk cache of analysed signals and speech descriptors
+
+Entries are keyed by the SHA-256 of audio file content and analysis params, so a renamed or copied file hits the same
+entry and a changed file or param never does. Every entry is a folder of .npy files that are opened memory-mapped,
+plus meta.json. Entries are written to a temporary folder and renamed into place, so concurrent writers of a process
+pool never see half written entries, and the first writer wins. When the cache grows over its size cap, least recently
+used entries are removed under a file lock.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from loguru import logger
+
+# bump when cached arrays are calculated differently
+CACHE_VERSION = 1
+
+META_NAME = 'meta.json'
+LOCK_NAME = '.lock'
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock of file between processes"""
+    with open(path, 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def content_hash(file, chunk_size=2 ** 20):
+    """Hash content of audio file
+
+    :param file: path or binary file object, file objects are rewound afterwards;
+    :param chunk_size: bytes read at once (default: 1 MB);
+    :return SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    if hasattr(file, 'read'):
+        position = file.tell()
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+        file.seek(position)
+    else:
+        with open(file, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DescriptorCache:
+    """Persistent cache of arrays calculated by SpeechAnalysis"""
+
+    def __init__(self, path, max_bytes=2 ** 30):
+        """Initialize cache folder
+
+        :param path: cache folder, created if missing;
+        :param max_bytes: size cap of all entries in bytes (default: 1 GB).
+        """
+        self.path = pathlib.Path(path).expanduser()
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(self, file, params):
+        """Key of audio file analysed with params
+
+        :param file: path or binary file object of audio;
+        :param params: JSON serializable dict of params that change cached arrays;
+        :return hex key.
+        """
+        params = json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True)
+        return hashlib.sha256(f'{content_hash(file)}:{params}'.encode()).hexdigest()
+
+    def _entry(self, key):
+        return self.path / key[:2] / key
+
+    def load(self, key):
+        """Read entry and mark it as recently used
+
+        :param key: key of entry;
+        :return dict of read-only memory-mapped arrays and meta values, or None if there is no such entry.
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry / META_NAME) as file:
+                meta = json.load(file)
+            arrays = {name: np.load(entry / f'{name}.npy', mmap_mode='r') for name in meta.pop('arrays')}
+            os.utime(entry / META_NAME)
+        except (OSError, ValueError):
+            # missing, or removed by eviction of another process meanwhile
+            return None
+        return {**meta, **arrays}
+
+    def store(self, key, arrays, meta=None):
+        """Write entry unless another writer was faster, then evict old entries, never the new one
+
+        An entry larger than the size cap is not written at all, it would only be evicted again at once.
+
+        :param key: key of entry;
+        :param arrays: dict of name -> numpy array;
+        :param meta: JSON serializable dict of other values (default: none);
+        :return True if this call wrote the entry.
+        """
+        entry = self._entry(key)
+        if entry.exists():
+            return False
+        size = sum(np.asarray(array).nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            logger.warning(f"Entry of {size / 2 ** 20:.1f} MB exceeds cache size cap of "
+                           f"{self.max_bytes / 2 ** 20:.1f} MB, not cached")
+            return False
+        entry.parent.mkdir(exist_ok=True)
+        temporary = pathlib.Path(tempfile.mkdtemp(prefix=f'.{key}.', dir=entry.parent))
+        try:
+            for name, array in arrays.items():
+                np.save(temporary / f'{name}.npy', np.asarray(array), allow_pickle=False)
+            with open(temporary / META_NAME, 'w') as file:
+                json.dump({**(meta or {}), 'arrays': list(arrays)}, file)
+            os.replace(temporary, entry)
+        except OSError:
+            # the entry appeared meanwhile, renaming onto a non-empty folder fails
+            shutil.rmtree(temporary, ignore_errors=True)
+            return False
+        self.evict(keep=entry)
+        return True
+
+    def entries(self):
+        """Entries with their last use time and size
+
+        :return list of (last use time, size in bytes, folder) tuples.
+        """
+        entries = []
+        for entry in self.path.glob('*/*'):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                used = (entry / META_NAME).stat().st_mtime
+                size = sum(file.stat().st_size for file in entry.iterdir())
+            except OSError:
+                continue
+            entries.append((used, size, entry))
+        return entries
+
+    @property
+    def size(self):
+        """Size of all entries in bytes"""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None, keep=None):
+        """Remove least recently used entries until the cache fits its size cap
+
+        :param max_bytes: size cap (default: cap of cache);
+        :param keep: folder of entry that is never removed, e.g. the one just written (default: none);
+        :return number of removed entries.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with _file_lock(self.path / LOCK_NAME):
+            entries = sorted(self.entries(), key=lambda item: item[0])
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= max_bytes:
+                    break
+                if entry == keep:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                removed += 1
+            # temporary folders of writers that crashed long ago
+            for temporary in self.path.glob('*/.*.*'):
+                with contextlib.suppress(OSError):
+                    if time.time() - temporary.stat().st_mtime > 24 * 3600:
+                        shutil.rmtree(temporary, ignore_errors=True)
+        if removed:
+            logger.info(f"Evicted {removed} cache entries")
+        return removed
+
+    def clear(self):
+        """Remove all entries"""
+        self.evict(max_bytes=0)
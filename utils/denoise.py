@@ -0,0 +1,96 @@
+"""This module provides fast spectral gating noise reduction that works on frames of audio signal"""
+
+import numpy as np
+
+
+class SpectralGate:
+    """Spectral gate with noise profiles cached per source or channel
+
+    The noise profile of every frequency bin is ``mean + n_std * std`` of its level in decibels over noise frames,
+    usually the first N_frames frames that VAD already assumes to be silent. Bins below the profile are attenuated
+    by ``prop_decrease``. The mask is smoothed along frequency only, so every frame is gated independently and
+    blocks or shards of a signal give the same result as the whole signal.
+
+    Profiles of ``gate_frames`` are cached under the key of the source together with the FFT size and sample rate,
+    so a gate shared by analyses with other frame lengths or sample rates never applies a profile of other bins.
+    """
+
+    def __init__(self, n_std=1.5, prop_decrease=1.0, smoothing_bins=5, amin=1e-10):
+        """Initialize main params
+
+        :param n_std: number of standard deviations above mean noise level to place the threshold (default: 1.5);
+        :param prop_decrease: attenuation of noise bins between 0 and 1 (default: 1.0);
+        :param smoothing_bins: width of the mask smoothing window in frequency bins (default: 5);
+        :param amin: minimum magnitude before converting to decibels (default: 1e-10).
+        """
+        self.n_std = n_std
+        self.prop_decrease = prop_decrease
+        self.smoothing_bins = smoothing_bins
+        self.amin = amin
+        self.profiles = {}
+
+    def _decibels(self, magnitude):
+        return 20 * np.log10(np.maximum(magnitude, self.amin))
+
+    def fit(self, spectrum, key=None, noise_frames=None):
+        """Estimate and cache noise profile
+
+        :param spectrum: complex or magnitude spectrum of frames (num_frames, bins);
+        :param key: source or channel the profile belongs to (default: None);
+        :param noise_frames: bool mask of frames to use, e.g. frames classified as non-speech (default: all);
+        :return noise profile in decibels.
+        """
+        level = self._decibels(np.abs(spectrum if noise_frames is None else spectrum[noise_frames]))
+        self.profiles[key] = np.mean(level, axis=0) + self.n_std * np.std(level, axis=0)
+        return self.profiles[key]
+
+    def gain(self, spectrum, key=None):
+        """Calculate gain of every bin with cached noise profile
+
+        :param spectrum: complex or magnitude spectrum of frames (num_frames, bins);
+        :param key: source or channel of cached profile (default: None);
+        :return numpy array of gains between 1 - prop_decrease and 1.
+        """
+        mask = (self._decibels(np.abs(spectrum)) > self.profiles[key]).astype(np.float64)
+        if self.smoothing_bins > 1:
+            import scipy.ndimage
+            mask = scipy.ndimage.uniform_filter1d(mask, self.smoothing_bins, axis=-1, mode='nearest')
+        return 1 - self.prop_decrease * (1 - mask)
+
+    @staticmethod
+    def _nfft(frame_length):
+        import scipy.fft
+
+        # frame lengths like 662 = 2 * 331 are slow FFT sizes, zero padding to a fast size does not change the gate
+        return scipy.fft.next_fast_len(frame_length, real=True)
+
+    def profile_key(self, key, frame_length, sample_rate=None):
+        """Key of the profile that gate_frames uses for frames of given length
+
+        :param key: source or channel of the profile;
+        :param frame_length: frame length in samples;
+        :param sample_rate: sample rate of frames (default: None);
+        :return tuple of key, FFT size and sample rate.
+        """
+        return key, self._nfft(frame_length), sample_rate
+
+    def gate_frames(self, framed_signal, key=None, n_frames=31, sample_rate=None):
+        """Gate windowed frames, fitting the profile on the first frames if there is no profile for key yet
+
+        :param framed_signal: 2D numpy array of frames (num_frames, frame_length);
+        :param key: source or channel of the profile (default: None);
+        :param n_frames: number of first silent frames used to fit a new profile (default: 31);
+        :param sample_rate: sample rate of frames, profiles of other rates are not reused (default: None);
+        :return 2D numpy array of gated frames.
+        """
+        import scipy.fft
+
+        frame_length = framed_signal.shape[-1]
+        key = self.profile_key(key, frame_length, sample_rate)
+        nfft = key[1]
+        spectrum = scipy.fft.rfft(framed_signal, n=nfft, axis=-1)
+        if key not in self.profiles:
+            self.fit(spectrum[:n_frames], key)
+        gated = spectrum * self.gain(spectrum, key).astype(spectrum.real.dtype, copy=False)
+        del spectrum
+        return scipy.fft.irfft(gated, n=nfft, axis=-1)[..., :frame_length]
@@ -1,9 +1,29 @@
 """This module provides some basic speech descriptors that help to detect speech activity in voice signal"""
 
-import librosa
 import numpy as np
-import scipy
-import scipy.stats
+
+import utils.kernels as kernels
+
+# librosa and scipy.stats are imported inside the per frame reference implementations only, so the vectorized
+# descriptors do not pay their import time
+
+# FFT size of spectral descriptors at the default sample rate
+REFERENCE_NFFT = 4096
+REFERENCE_SAMPLE_RATE = 22050
+
+
+def fft_size(sample_rate, reference_nfft=REFERENCE_NFFT, reference_rate=REFERENCE_SAMPLE_RATE):
+    """FFT size of spectral descriptors adapted to sample rate
+
+    The size is scaled with the sample rate and rounded up to a power of two, so the frequency resolution is at least
+    that of ``reference_nfft`` at ``reference_rate``, while 8 kHz audio is not padded to the size needed at 22050 Hz.
+
+    :param sample_rate: sample rate of audio signal;
+    :param reference_nfft: FFT size at reference rate (default: 4096);
+    :param reference_rate: reference sample rate (default: 22050);
+    :return FFT size.
+    """
+    return int(2 ** np.ceil(np.log2(reference_nfft * sample_rate / reference_rate)))
 
 
 def short_term_frame(frame):
@@ -18,6 +38,7 @@ def short_term_energy(frames):
 
 def additional_short_term_energy(framed_signal):
     """Another way to calculate short term energy using librosa library"""
+    import librosa
     return [librosa.feature.rms(frame) for frame in framed_signal]
 
 
@@ -36,11 +57,13 @@ def zero_crossing_rate(frames):
 
 def additional_zero_crossing_rate(framed_signal):
     """Another way to calculate short term energy using librosa library"""
+    import librosa
     return [librosa.feature.zero_crossing_rate(frame, )[0][0] for frame in framed_signal]
 
 
 def spectral_flatness_frame(frame):
     """Calculate spectral flatness of frame"""
+    import scipy.stats
     geometric_mean = scipy.stats.mstats.gmean(abs(frame))
     arithmetic_mean = np.mean(frame)
     return 10 * np.log10(geometric_mean / arithmetic_mean)
@@ -53,16 +76,133 @@ def spectral_flatness(pow_frames):
 
 def additional_spectral_flatness(framed_signal, nfft=4096):
     """Another way to calculate spectral flatness using librosa library"""
+    import librosa
     return [librosa.feature.spectral_flatness(frame, n_fft=nfft)[0][0] for frame in framed_signal]
 
 
 def spectral_rolloff(framed_signal, nfft=4096):
     """Calculate spectral_rolloff of each frame"""
+    import librosa
     return [librosa.feature.spectral_rolloff(frame, roll_percent=0.97, n_fft=nfft)[0][0] for frame in
             framed_signal]
 
 
 def spectral_bandwidth(framed_signal, nfft=4096):
     """Calculate spectral_bandwidth of each frame"""
+    import librosa
     return [librosa.feature.spectral_bandwidth(frame, n_fft=nfft)[0][0] for frame in
             framed_signal]
+
+
+def power_spectrum(framed_signal, nfft=4096, power=1.0, center=True, pad_mode='reflect'):
+    """Calculate spectrum of each frame with one batched FFT
+
+    The first STFT column that librosa computes for a single frame is reproduced: with ``center=True`` every frame
+    is padded by ``nfft // 2`` samples on both sides using ``pad_mode``, truncated to ``nfft`` samples and weighted
+    by a periodic Hann window. With ``center=False`` frames are simply zero-padded to ``nfft``.
+
+    :param framed_signal: 2D numpy array of frames (num_frames, frame_length), float32 frames are transformed in single
+        precision;
+    :param nfft: FFT size (default: 4096);
+    :param power: exponent for the magnitude spectrum, 1 for magnitude and 2 for power (default: 1.0);
+    :param center: if True pad frames the way librosa.stft(center=True) does (default: True);
+    :param pad_mode: numpy.pad mode used when center is True (default: 'reflect', librosa < 0.10 behaviour);
+    :return numpy array of shape (num_frames, nfft // 2 + 1).
+    """
+    frames = np.atleast_2d(framed_signal)
+    if center:
+        frames = np.pad(frames, ((0, 0), (nfft // 2, nfft // 2)), mode=pad_mode)[:, :nfft]
+        # periodic Hann window, the same as scipy.signal.get_window('hann', nfft)
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(nfft) / nfft)
+        frames = frames * (window.astype(np.float32) if frames.dtype == np.float32 else window)
+    if frames.dtype == np.float32:
+        # numpy < 2 transforms in double precision only
+        import scipy.fft
+        spectrum = np.abs(scipy.fft.rfft(frames, n=nfft, axis=1))
+    else:
+        spectrum = np.abs(np.fft.rfft(frames, n=nfft, axis=1))
+    if power != 1.0:
+        spectrum **= power
+    return spectrum
+
+
+def spectral_descriptors(framed_signal, sample_rate=22050, nfft=4096, roll_percent=0.97, amin=1e-10, center=True,
+                         pad_mode='reflect', block_size=512):
+    """Calculate spectral flatness, rolloff and bandwidth of each frame from one shared spectrum
+
+    Frames are transformed block by block, so only ``block_size`` spectra are kept in memory at once, and every
+    spectrum is reused for all three descriptors. The results match ``additional_spectral_flatness``,
+    ``spectral_rolloff`` and ``spectral_bandwidth`` (librosa 0.8 defaults) within a relative tolerance of 1e-6;
+    rolloff is exact because it is picked from the same frequency grid.
+
+    :param framed_signal: 2D numpy array of frames (num_frames, frame_length);
+    :param sample_rate: sample rate used to build the frequency grid (default: 22050);
+    :param nfft: FFT size (default: 4096);
+    :param roll_percent: energy percentage for spectral rolloff (default: 0.97);
+    :param amin: minimum power for spectral flatness (default: 1e-10);
+    :param center: if True pad frames the way librosa.stft(center=True) does (default: True);
+    :param pad_mode: numpy.pad mode used when center is True (default: 'reflect');
+    :param block_size: number of frames transformed at once (default: 512);
+    :return dict with 'flatness', 'rolloff' and 'bandwidth' numpy arrays of shape (num_frames,), float32 for float32
+        frames and float64 otherwise.
+    """
+    framed_signal = np.atleast_2d(framed_signal)
+    num_frames = len(framed_signal)
+    dtype = np.float32 if framed_signal.dtype == np.float32 else np.float64
+    freq = np.linspace(0, float(sample_rate) / 2, 1 + nfft // 2)
+    flatness = np.empty(num_frames, dtype=dtype)
+    rolloff = np.empty(num_frames, dtype=dtype)
+    bandwidth = np.empty(num_frames, dtype=dtype)
+
+    for start in range(0, num_frames, block_size):
+        stop = min(start + block_size, num_frames)
+        magnitude = power_spectrum(framed_signal[start:stop], nfft=nfft, center=center, pad_mode=pad_mode)
+
+        power = np.maximum(amin, magnitude ** 2)
+        flatness[start:stop] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        total_energy = np.cumsum(magnitude, axis=1)
+        reached = total_energy >= roll_percent * total_energy[:, -1:]
+        rolloff[start:stop] = freq[np.argmax(reached, axis=1)]
+
+        norm = total_energy[:, -1].copy()
+        norm[norm < np.finfo(magnitude.dtype).tiny] = 1
+        weights = magnitude / norm[:, None]
+        centroid = weights @ freq
+        deviation = (freq[None, :] - centroid[:, None]) ** 2
+        bandwidth[start:stop] = np.sqrt(np.sum(weights * deviation, axis=1))
+
+    return {'flatness': flatness, 'rolloff': rolloff, 'bandwidth': bandwidth}
+
+
+def zero_crossing_rates(framed_signal, threshold=1e-10):
+    """Calculate zero crossing rate of each frame with one vectorized pass
+
+    Follows librosa.feature.zero_crossing_rate: values with magnitude below ``threshold`` count as positive zeros.
+    The rate is divided by the frame length instead of librosa's 2048 samples window, which only rescales it.
+
+    :param framed_signal: 2D numpy array of frames (num_frames, frame_length);
+    :param threshold: magnitude treated as zero (default: 1e-10);
+    :return numpy array of shape (num_frames,).
+    """
+    framed_signal = np.atleast_2d(framed_signal)
+    negative = np.signbit(framed_signal) & (np.abs(framed_signal) > threshold)
+    crossings = np.count_nonzero(negative[:, 1:] != negative[:, :-1], axis=1)
+    return crossings / framed_signal.shape[1]
+
+
+def descriptor_matrix(framed_signal, sample_rate=22050, nfft=4096):
+    """Calculate raw short term energy, zero crossing rate, spectral flatness and spectral rolloff of each frame
+
+    :param framed_signal: 2D numpy array of frames (num_frames, frame_length);
+    :param sample_rate: sample rate of audio signal (default: 22050);
+    :param nfft: FFT size of spectral descriptors (default: 4096);
+    :return numpy array of shape (num_frames, 4), columns in the order listed above.
+    """
+    framed_signal = np.atleast_2d(framed_signal)
+    spectral = spectral_descriptors(framed_signal, sample_rate, nfft=nfft)
+    energy, zero_crossings = kernels.energy_zero_crossings(framed_signal)
+    return np.stack([energy,
+                     zero_crossings,
+                     spectral['flatness'],
+                     spectral['rolloff']], axis=1)
@@ -0,0 +1,79 @@
+"""This module provides numba compiled kernels for time domain descriptors and the speech decision
+
+numba is imported and the kernels of utils.numba_kernels are compiled on first use only, and compiled code is cached on
+disk, so importing this module stays cheap. Serial kernels release the GIL, so threads, e.g. shards of
+ShardedAnalysis, run them at once. Without numba, or with environment variable VAD_DISABLE_NUMBA set, the same results
+are computed with numpy.
+"""
+import os
+import threading
+
+import numpy as np
+
+_kernels = {}
+
+
+def _compile():
+    """Import kernels compiled with numba
+
+    :return dict of compiled functions or None when numba is not available.
+    """
+    try:
+        import utils.numba_kernels as numba_kernels
+    except ImportError:
+        return None
+    return {'energy_zero_crossings': numba_kernels.energy_zero_crossings,
+            'serial_energy_zero_crossings': numba_kernels.serial_energy_zero_crossings,
+            'speech_detection': numba_kernels.speech_detection}
+
+
+def compiled():
+    """Compiled kernels, compiling them on the first call
+
+    :return dict of compiled functions or None when numba is not available or disabled.
+    """
+    if os.environ.get('VAD_DISABLE_NUMBA'):
+        return None
+    if 'numba' not in _kernels:
+        _kernels['numba'] = _compile()
+    return _kernels['numba']
+
+
+def energy_zero_crossings(framed_signal, threshold=1e-10):
+    """Calculate short term energy and zero crossing rate of every frame in one fused pass over samples
+
+    Energy is the mean of squared samples, zero crossing rate is the same as utils.descriptors.zero_crossing_rates.
+    Frames are processed in parallel when called from the main thread, other threads run the serial kernel without
+    the GIL.
+
+    :param framed_signal: 2D numpy array of frames (num_frames, frame_length);
+    :param threshold: magnitude treated as zero (default: 1e-10);
+    :return tuple of numpy arrays of energy and zero crossing rate of shape (num_frames,).
+    """
+    framed_signal = np.atleast_2d(framed_signal)
+    kernels = compiled()
+    if kernels is not None:
+        # the TBB threading layer hangs at exit when its pool is first started from another thread, so other
+        # threads, e.g. streams of the local service, run the serial kernel
+        parallel = threading.current_thread() is threading.main_thread()
+        kernel = kernels['energy_zero_crossings' if parallel else 'serial_energy_zero_crossings']
+        return kernel(np.ascontiguousarray(framed_signal), threshold)
+
+    negative = np.signbit(framed_signal) & (np.abs(framed_signal) > threshold)
+    crossings = np.count_nonzero(negative[:, 1:] != negative[:, :-1], axis=1)
+    return np.mean(framed_signal ** 2, axis=1), crossings / framed_signal.shape[1]
+
+
+def speech_detection(deltas, thresholds, frames):
+    """Compare descriptors with thresholds and apply hangover in one compiled loop
+
+    :param deltas: numpy array of descriptor deviations from the baseline means (4, num_frames);
+    :param thresholds: sequence of energy, zero crossing, flatness and rolloff thresholds;
+    :param frames: hangover length;
+    :return bool numpy array of speech detection or None when numba is not available.
+    """
+    kernels = compiled()
+    if kernels is None:
+        return None
+    thresholds = np.array([thresholds[0], thresholds[1], thresholds[2], thresholds[3]], dtype=np.float64)
+    return kernels['speech_detection'](np.ascontiguousarray(deltas, dtype=np.float64), thresholds, frames)
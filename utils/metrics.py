@@ -0,0 +1,157 @@
+"""This module provides opt-in instrumentation of processing stages: timings, peak allocation and throughput"""
+
+import functools
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from loguru import logger
+
+PROMETHEUS_METRICS = (('wall_time', 'vad_stage_wall_seconds', 'Wall time of VAD stage'),
+                      ('cpu_time', 'vad_stage_cpu_seconds', 'CPU time of VAD stage'),
+                      ('peak_memory', 'vad_stage_peak_bytes', 'Peak allocation of VAD stage traced by tracemalloc'),
+                      ('frames_per_second', 'vad_stage_frames_per_second', 'Frames processed per second'))
+
+
+class StageMetrics:
+    """Measurements of one stage"""
+
+    def __init__(self, stage, wall_time, cpu_time, peak_memory, frames=None):
+        """Initialize measurements
+
+        :param stage: name of stage;
+        :param wall_time: wall time in seconds;
+        :param cpu_time: CPU time of the process in seconds;
+        :param peak_memory: peak traced allocation in bytes;
+        :param frames: number of frames the stage processed (default: unknown).
+        """
+        self.stage = stage
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.peak_memory = peak_memory
+        self.frames = frames
+
+    @property
+    def frames_per_second(self):
+        """Throughput of stage or None if frames are unknown"""
+        if not self.frames or not self.wall_time:
+            return None
+        return self.frames / self.wall_time
+
+    def as_dict(self):
+        """Measurements as a plain dict"""
+        return {'stage': self.stage,
+                'wall_time': self.wall_time,
+                'cpu_time': self.cpu_time,
+                'peak_memory': self.peak_memory,
+                'frames': self.frames,
+                'frames_per_second': self.frames_per_second}
+
+    def __repr__(self):
+        return f"StageMetrics({self.as_dict()})"
+
+
+class Metrics:
+    """Ordered collection of stage measurements of one run"""
+
+    def __init__(self, labels=None, log=True):
+        """Initialize collection
+
+        :param labels: dict of labels attached to every record, e.g. file name (default: none);
+        :param log: if True emit a structured log record for every stage (default: True).
+        """
+        self.labels = dict(labels or {})
+        self.log = log
+        self.stages = OrderedDict()
+
+    def add(self, metrics):
+        """Add measurements of a stage
+
+        :param metrics: StageMetrics object.
+        """
+        self.stages[metrics.stage] = metrics
+        if self.log:
+            logger.bind(**self.labels, **metrics.as_dict()).info(
+                f"Stage {metrics.stage}: {metrics.wall_time:.4f} s wall, {metrics.cpu_time:.4f} s cpu, "
+                f"{metrics.peak_memory / 2 ** 20:.1f} MB peak")
+
+    @property
+    def total_time(self):
+        """Sum of wall time of all stages"""
+        return sum(metrics.wall_time for metrics in self.stages.values())
+
+    def as_dict(self):
+        """Measurements as a plain dict"""
+        return {'labels': self.labels, 'stages': [metrics.as_dict() for metrics in self.stages.values()]}
+
+    def to_prometheus(self):
+        """Measurements in Prometheus text exposition format"""
+        lines = []
+        for attribute, name, description in PROMETHEUS_METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            for metrics in self.stages.values():
+                value = getattr(metrics, attribute)
+                if value is not None:
+                    labels = _prometheus_labels({**self.labels, 'stage': metrics.stage})
+                    lines.append(f'{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write measurements to a Prometheus text file, e.g. for node_exporter textfile collector
+
+        :param path: path of .prom file.
+        """
+        with open(path, 'w') as file:
+            file.write(self.to_prometheus())
+
+
+def _prometheus_labels(labels):
+    """Format label set escaping values"""
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return ','.join(escaped)
+
+
+def instrumented(stage, frames_attribute='framed_signal'):
+    """Decorate a method so that it is measured when its object has a Metrics object in ``metrics`` attribute
+
+    Nothing is measured and no overhead is added while ``metrics`` is None. Peak allocation comes from tracemalloc,
+    which slows allocations down noticeably while it traces.
+
+    :param stage: name of stage;
+    :param frames_attribute: attribute with frames the stage processes or their number, used for throughput
+        (default: framed_signal).
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = getattr(self, 'metrics', None)
+            if metrics is None:
+                return method(self, *args, **kwargs)
+
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+                peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+                if not tracing:
+                    tracemalloc.stop()
+                frames = getattr(self, frames_attribute, None)
+                if frames is not None and not isinstance(frames, int):
+                    frames = len(frames)
+                metrics.add(StageMetrics(stage, wall_time, cpu_time, peak, frames=frames))
+
+        return wrapper
+
+    return decorator
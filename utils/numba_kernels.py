@@ -0,0 +1,67 @@
+"""This module provides numba compiled kernels of utils.kernels, it is imported only when numba is used
+
+Kernels are module level functions, so numba finds them in its disk cache in every new process. Kernels defined in a
+closure call other dispatchers through free variables, their cache index never matches and every process compiled
+them again.
+"""
+import numba
+import numpy as np
+
+
+@numba.njit(nogil=True, cache=True)
+def frame_energy_zero_crossings(framed_signal, i, threshold, energy, zero_crossings):
+    frame_length = framed_signal.shape[1]
+    total = 0.0
+    crossings = 0
+    previous = framed_signal[i, 0] < 0 and -framed_signal[i, 0] > threshold
+    for j in range(frame_length):
+        value = framed_signal[i, j]
+        total += value * value
+        negative = value < 0 and -value > threshold
+        if negative != previous:
+            crossings += 1
+        previous = negative
+    energy[i] = total / frame_length
+    zero_crossings[i] = crossings / frame_length
+
+
+@numba.njit(parallel=True, cache=True)
+def energy_zero_crossings(framed_signal, threshold):
+    num_frames = framed_signal.shape[0]
+    energy = np.empty(num_frames)
+    zero_crossings = np.empty(num_frames)
+    for i in numba.prange(num_frames):
+        frame_energy_zero_crossings(framed_signal, i, threshold, energy, zero_crossings)
+    return energy, zero_crossings
+
+
+@numba.njit(nogil=True, cache=True)
+def serial_energy_zero_crossings(framed_signal, threshold):
+    num_frames = framed_signal.shape[0]
+    energy = np.empty(num_frames)
+    zero_crossings = np.empty(num_frames)
+    for i in range(num_frames):
+        frame_energy_zero_crossings(framed_signal, i, threshold, energy, zero_crossings)
+    return energy, zero_crossings
+
+
+@numba.njit(nogil=True, cache=True)
+def speech_detection(deltas, thresholds, frames):
+    num_frames = deltas.shape[1]
+    marks = np.zeros(num_frames, dtype=np.bool_)
+    run = 0
+    for i in range(num_frames):
+        if (deltas[2, i] <= thresholds[2] and deltas[0, i] >= thresholds[0] and
+                deltas[3, i] <= thresholds[3] and deltas[1, i] <= thresholds[1]):
+            run += 1
+        else:
+            run = 0
+        marks[i] = run >= frames and i >= frames
+
+    detection = np.zeros(num_frames, dtype=np.bool_)
+    next_mark = num_frames + frames
+    for i in range(num_frames - 1, -1, -1):
+        detection[i] = next_mark - i <= frames
+        if marks[i]:
+            next_mark = i
+    return detection
@@ -0,0 +1,183 @@
+"""This module provides export of speech segments as timestamps and streaming of speech audio"""
+
+import csv
+import json
+import pathlib
+
+import numpy as np
+import soundfile as sf
+
+SEGMENT_FORMATS = ('json', 'csv', 'rttm')
+
+# seconds of crossfade that keeps joined speech segments from clicking, output is crossfaded only when asked for
+CROSSFADE = 0.005
+
+
+def segments_to_seconds(segments, sample_rate):
+    """Convert (start, end) samples to seconds
+
+    :param segments: numpy array of (start, end) samples of shape (num_segments, 2);
+    :param sample_rate: sample rate of audio signal;
+    :return numpy array of (start, end) seconds.
+    """
+    return np.asarray(segments, dtype=np.float64).reshape(-1, 2) / sample_rate
+
+
+def segments_record(segments, sample_rate, file_id=None):
+    """Describe speech segments as a JSON serializable dict, the layout of JSON segments files
+
+    :param segments: numpy array of (start, end) samples of shape (num_segments, 2);
+    :param sample_rate: sample rate of audio signal;
+    :param file_id: recording name (default: None);
+    :return dict with file, sample_rate and list of segments.
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+    seconds = segments_to_seconds(segments, sample_rate)
+    return {'file': file_id,
+            'sample_rate': int(sample_rate),
+            'segments': [{'start': float(start_time), 'end': float(end_time),
+                          'start_sample': int(start), 'end_sample': int(end)}
+                         for (start, end), (start_time, end_time) in zip(segments, seconds)]}
+
+
+def export_segments(segments, sample_rate, path, file_id=None, segment_format=None, channel=1):
+    """Write speech segments to JSON, CSV or RTTM file without touching audio
+
+    :param segments: numpy array of (start, end) samples of shape (num_segments, 2);
+    :param sample_rate: sample rate of audio signal;
+    :param path: path of result file;
+    :param file_id: recording name for RTTM and JSON (default: stem of path);
+    :param segment_format: 'json', 'csv' or 'rttm' (default: suffix of path);
+    :param channel: 1-based channel number of RTTM lines (default: 1);
+    :return path of result file.
+    """
+    path = pathlib.Path(path)
+    segment_format = (segment_format or path.suffix.lstrip('.')).lower()
+    if segment_format not in SEGMENT_FORMATS:
+        raise ValueError(f"Unknown segment format {segment_format}, use one of {SEGMENT_FORMATS}")
+    file_id = file_id or path.stem
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+    seconds = segments_to_seconds(segments, sample_rate)
+
+    with open(path, 'w', newline='') as file:
+        if segment_format == 'json':
+            json.dump(segments_record(segments, sample_rate, file_id), file, indent=2)
+        elif segment_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(['start', 'end', 'start_sample', 'end_sample'])
+            for (start, end), (start_time, end_time) in zip(segments, seconds):
+                writer.writerow([f'{start_time:.6f}', f'{end_time:.6f}', start, end])
+        else:
+            # RTTM fields are separated by spaces
+            file_id = '_'.join(str(file_id).split())
+            for start_time, end_time in seconds:
+                file.write(f'SPEAKER {file_id} {channel} {start_time:.3f} {end_time - start_time:.3f} '
+                           f'<NA> <NA> speech <NA> <NA>\n')
+    return path
+
+
+def crossfade_lengths(segments, crossfade):
+    """Length of the crossfade at every boundary between consecutive segments
+
+    A crossfade takes at most half of each of the two segments, so short segments get shorter crossfades.
+
+    :param segments: numpy array of (start, end) samples of shape (num_segments, 2);
+    :param crossfade: crossfade length in samples;
+    :return numpy array of crossfade lengths (num_segments - 1,).
+    """
+    lengths = np.diff(np.asarray(segments, dtype=np.int64).reshape(-1, 2), axis=1)[:, 0]
+    return np.minimum(crossfade, np.minimum(lengths[:-1], lengths[1:]) // 2)
+
+
+def _fade_in(length, shape, dtype):
+    """Raised cosine ramp from 0 to 1, its reverse is the complementary fade out"""
+    ramp = 0.5 - 0.5 * np.cos(np.pi * (np.arange(length) + 0.5) / length)
+    return ramp.reshape((length,) + (1,) * (len(shape) - 1)).astype(dtype, copy=False)
+
+
+def mix_crossfade(tail, head):
+    """Overlap-add the fading out end of a segment and the fading in start of the next one
+
+    :param tail: numpy array of the last samples of a segment;
+    :param head: numpy array of the first samples of the next segment, of the same shape;
+    :return numpy array of crossfaded samples.
+    """
+    ramp = _fade_in(len(head), head.shape, head.dtype)
+    return tail * ramp[::-1] + head * ramp
+
+
+def stitched_chunks(signal, segments, crossfade=0):
+    """Speech segments of signal in order, overlap-added with short crossfades at the boundaries
+
+    The end of every segment is faded out while the start of the next one is faded in over the same samples, the
+    gains sum to 1, so there are no clicks at the cuts. Each crossfade makes the result shorter by its length. Only
+    the crossfaded samples are copied, the rest are yielded as slices of signal.
+
+    :param signal: numpy array of audio signal (samples,) or (samples, channels);
+    :param segments: numpy array of (start, end) samples;
+    :param crossfade: crossfade length in samples, 0 joins segments with hard cuts (default: 0);
+    :return generator of numpy arrays of speech samples.
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+    fades = np.append(crossfade_lengths(segments, crossfade), 0)
+    head, tail = 0, None
+    for (start, end), fade in zip(segments, fades):
+        chunk = signal[start:end]
+        if head:
+            yield mix_crossfade(tail, chunk[:head])
+        yield chunk[head:len(chunk) - fade]
+        head, tail = fade, chunk[len(chunk) - fade:]
+
+
+def join_segments(signal, segments, crossfade=0):
+    """Join speech segments of signal into one array with a single copy
+
+    :param signal: numpy array of audio signal;
+    :param segments: numpy array of (start, end) samples;
+    :param crossfade: crossfade length in samples at segment boundaries, see stitched_chunks (default: 0);
+    :return numpy array of speech samples.
+    """
+    chunks = list(stitched_chunks(signal, segments, crossfade))
+    return np.concatenate(chunks) if chunks else signal[:0].copy()
+
+
+def write_segments(path, signal, segments, sample_rate, crossfade=0):
+    """Write speech segments of signal to audio file slice by slice, without joining them in memory
+
+    :param path: path of result audio file;
+    :param signal: numpy array of audio signal (samples,) or (samples, channels);
+    :param segments: numpy array of (start, end) samples;
+    :param sample_rate: sample rate of audio signal;
+    :param crossfade: crossfade length in samples at segment boundaries, see stitched_chunks (default: 0);
+    :return path of result file.
+    """
+    channels = 1 if np.ndim(signal) == 1 else np.shape(signal)[1]
+    with sf.SoundFile(str(path), 'w', samplerate=sample_rate, channels=channels) as file:
+        for chunk in stitched_chunks(signal, segments, crossfade):
+            file.write(chunk)
+    return path
+
+
+def load_segments(path):
+    """Read speech segments in seconds from JSON, CSV or RTTM file written by export_segments or other tools
+
+    :param path: path of segments file;
+    :return numpy array of (start, end) seconds of shape (num_segments, 2).
+    """
+    path = pathlib.Path(path)
+    segment_format = path.suffix.lstrip('.').lower()
+    if segment_format not in SEGMENT_FORMATS:
+        raise ValueError(f"Unknown segment format {segment_format}, use one of {SEGMENT_FORMATS}")
+
+    with open(path, newline='') as file:
+        if segment_format == 'json':
+            segments = [(segment['start'], segment['end']) for segment in json.load(file)['segments']]
+        elif segment_format == 'csv':
+            segments = [(float(row['start']), float(row['end'])) for row in csv.DictReader(file)]
+        else:
+            segments = []
+            for line in file:
+                fields = line.split()
+                if len(fields) > 4 and fields[0] == 'SPEAKER':
+                    segments.append((float(fields[3]), float(fields[3]) + float(fields[4])))
+    return np.array(segments, dtype=np.float64).reshape(-1, 2)
@@ -1,7 +1,11 @@
-"""This module provides simple visualization of voice activity detection process using matplotlib"""
+"""This module provides simple visualization of voice activity detection process using matplotlib
+
+Long recordings are drawn fast: consecutive detected frames are merged into one span and signals longer than
+``max_points`` are drawn as min/max envelopes of equal bins, which look the same at screen resolution. Figures are
+shown with pyplot, or written to PNG/SVG files without any GUI backend when ``save_path`` is given.
+"""
+import contextlib
 
-import librosa
-import matplotlib.pyplot as plt
 import numpy as np
 
 from utils.audio_operations import normalize
@@ -21,85 +25,150 @@ LABELS = ['audio signal and detected regions',
 
 LINES = ["-", "--", "-.", "-."]
 
+# keyword arguments of impacts, ordered as descriptor arguments
+IMPACTS = ['short_term_energy_impact',
+           'zero_crossing_rate_impact',
+           'spectral_flatness_impact',
+           'spectral_rolloff_impact']
+
+# points per line, a few times the width of a figure in pixels
+MAX_POINTS = 4000
+
+
+def detection_spans(detect, hop):
+    """Merge consecutive detected frames into spans
+
+    Frame i covers [i * hop, (i + 1) * hop) seconds.
+
+    :param detect: bool numpy array of speech detection;
+    :param hop: step between frames in seconds, frame_step / sample_rate;
+    :return numpy array of (start, end) seconds of shape (num_spans, 2).
+    """
+    detect = np.concatenate([[False], np.asarray(detect, dtype=bool), [False]])
+    edges = np.flatnonzero(detect[1:] != detect[:-1])
+    return edges.reshape(-1, 2) * hop
+
+
+def min_max_envelope(values, duration, max_points=MAX_POINTS):
+    """Decimate values to minimum and maximum of equal bins
+
+    :param values: 1D numpy array;
+    :param duration: duration of values in seconds;
+    :param max_points: number of bins, None keeps all values (default: MAX_POINTS);
+    :return tuple of numpy arrays of time, minimum and maximum, minimum is maximum when values are not decimated.
+    """
+    values = np.asarray(values)
+    if max_points is None or len(values) <= max_points:
+        return np.linspace(0, duration, len(values)), values, values
+    starts = np.linspace(0, len(values), max_points, endpoint=False).astype(np.int64)
+    time = (starts + np.append(starts[1:], len(values))) * (0.5 * duration / len(values))
+    return time, np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+
+def _plot_line(ax, values, duration, max_points, color, **kwargs):
+    """Plot values as a line, or as a filled min/max envelope when they are decimated
+
+    :return tuple of time and maximum of values.
+    """
+    time, minimum, maximum = min_max_envelope(values, duration, max_points)
+    if minimum is maximum:
+        ax.plot(time, maximum, color=color, **kwargs)
+    else:
+        ax.fill_between(time, minimum, maximum, color=color, lw=0.5, edgecolor=color, **kwargs)
+    return time, maximum
+
+
+@contextlib.contextmanager
+def _figure(figsize, save_path):
+    """Figure that is shown with pyplot on exit, or written to save_path without pyplot
+
+    Figures written to files are not registered in pyplot, so batch jobs neither need a display nor keep figures
+    in memory.
+    """
+    if save_path is None:
+        import matplotlib.pyplot as plt
+        plt.rcParams.update({'font.size': 14})
+        yield plt.figure(figsize=figsize)
+        plt.show()
+    else:
+        import matplotlib
+        from matplotlib.figure import Figure
+        with matplotlib.rc_context({'font.size': 14}):
+            fig = Figure(figsize=figsize)
+            yield fig
+            fig.savefig(save_path)
+
+
+def _hop(kwargs):
+    """Step between frames in seconds of plotting kwargs, half a frame when only frame_length is given"""
+    return kwargs['hop'] if kwargs.get('hop') is not None else kwargs.get('frame_length') * 0.5
+
+
+def _descriptors_figure(fig, signal, descriptors, impacts, detect, hop, sample_rate, max_points):
+    """Draw signal with detected regions and one axes per descriptor"""
+    duration = len(signal) / sample_rate
+    fig_grid = fig.add_gridspec(ncols=1, nrows=len(descriptors) + 1)
+    ax = fig.add_subplot(fig_grid[0, 0])
+    ax.set_title(LABELS[0])
+    for start, end in detection_spans(detect, hop):
+        ax.axvspan(start, end, color='#C3C5C7', lw=0, alpha=0.2)
+    _plot_line(ax, signal, duration, max_points, COLORS[0], label=LABELS[0])
+
+    for i, descriptor in enumerate(descriptors):
+        ax = fig.add_subplot(fig_grid[i + 1, 0])
+        ax.set_title(LABELS[i + 1])
+        if impacts[i] is not None:
+            time, _, impact = min_max_envelope(impacts[i], duration, max_points)
+            ax.plot(time, impact, color='black', ls=LINES[i], alpha=0.4)
+        time, maximum = _plot_line(ax, descriptor, duration, max_points, COLORS[i + 1])
+        ax.fill_between(time, maximum, 0, color=COLORS[i + 1], alpha=0.3)
+        ax.grid(alpha=0.4)
+
+    ax.set_xlabel('Time, seconds')
+    fig.subplots_adjust(hspace=0.7)
+
 
 def plotting_descriptors(signal, *args, **kwargs):
     """Visualize audio signal and main speech descriptors
 
     :param signal: audio signal librosa.load() object;
     :param args: speech descriptions, not all of them can be used. (default: all of them);
-    :param kwargs: help to plot detected regions
+    :param kwargs: help to plot detected regions: detection_region, hop between frames in seconds (or frame_length
+        for 50 % overlap), sample_rate and *_impact arrays of IMPACTS; max_points of every line (default:
+        MAX_POINTS, None draws all samples); save_path of PNG or SVG file instead of showing the figure;
+    :return save_path or None.
     """
-    detect = kwargs.get('detection_region')
-    frame_length = kwargs.get('frame_length')
-    sample_rate = kwargs.get('sample_rate')
-
-    # short_term_energy_impact = kwargs.get('short_term_energy_impact')
-    # spectral_flatness_impact = kwargs.get('spectral_flatness_impact')
-    # spectral_rolloff_impact = kwargs.get('spectral_rolloff_impact')
-    # zero_crossing_rate_impact = kwargs.get('zero_crossing_rate_impact')
-    impacts = list(kwargs.values())[3:]
-    duration = librosa.get_duration(signal)
-
-    plt.rcParams.update({'font.size': 14})
-    fig = plt.figure(figsize=(16, 14))
-    fig_grid = plt.GridSpec(ncols=1, nrows=len(args) + 1, figure=fig)
-    plt.subplot(fig_grid[0, 0])
-    plt.title(LABELS[0])
-
-    for i in range(len(detect)):
-        color = '#C3C5C7' if detect[i] else 'white'
-
-        plt.axvspan((i * frame_length * 0.5),
-                    ((i * frame_length * sample_rate / 2) + frame_length * sample_rate / 2) / sample_rate,
-                    color=color, lw=0, alpha=0.2)
-    #
-    # plt.plot(np.linspace(0, duration, len(zero_crossing_rate_impact)), zero_crossing_rate_impact, color=COLORS[2],
-    #          ls='-.')
-    #
-    # plt.plot(np.linspace(0, duration, len(spectral_flatness_impact)), spectral_flatness_impact, color=COLORS[3],
-    #          ls='dotted')
-    #
-    # plt.plot(np.linspace(0, duration, len(spectral_rolloff_impact)), spectral_rolloff_impact, color=COLORS[4],
-    #          ls='dashed')
-    #
-    plt.plot(np.linspace(0, duration, len(signal)), normalize(signal), color=COLORS[0], label=LABELS[0])
-    # '-', '--', '-.', ':', 'None', ' ', '', 'solid', 'dashed', 'dashdot', 'dotted'
-    if args:
-        for i in range(len(args)):
-            plt.subplot(fig_grid[i + 1, 0])
-            plt.title(LABELS[i + 1])
-            plt.plot(np.linspace(0, duration, len(impacts[i])), impacts[i], color='black', ls=LINES[i], alpha=0.4)
-            plt.plot(np.linspace(0, duration, len(args[i])), args[i], color=COLORS[i + 1])
-            plt.fill_between(np.linspace(0, duration, len(args[i])), args[i], 0, color=COLORS[i + 1], alpha=0.3)
-            plt.grid(alpha=0.4)
-
-    plt.xlabel('Time, seconds')
-    plt.subplots_adjust(hspace=0.7)
-    plt.show()
-
-
-def plot_signals_comparison(signal, cut_signal, sample_rate):
+    save_path = kwargs.get('save_path')
+    impacts = [kwargs.get(name) for name in IMPACTS]
+    with _figure((16, 14), save_path) as fig:
+        _descriptors_figure(fig, normalize(signal), args, impacts, kwargs.get('detection_region'), _hop(kwargs),
+                            kwargs.get('sample_rate'),
+                            kwargs.get('max_points', MAX_POINTS))
+    return save_path
+
+
+def plot_signals_comparison(signal, cut_signal, sample_rate, save_path=None, max_points=MAX_POINTS):
     """Plot comparison graph
 
     :param signal: original audio signal;
     :param cut_signal: signal after voice activity detection procedure;
-    :param sample_rate: sample rate of both signals.
+    :param sample_rate: sample rate of both signals;
+    :param save_path: PNG or SVG file to write instead of showing the figure (default: show);
+    :param max_points: points of every line, None draws all samples (default: MAX_POINTS);
+    :return save_path or None.
     """
-    signal_duration = librosa.get_duration(signal)
-    plt.rcParams.update({'font.size': 14})
-    fig = plt.figure(figsize=(12, 8))
-
-    plt.subplot(2, 1, 1)
-    plt.title('Original audio signal')
-    plt.plot(np.linspace(0, signal_duration, len(signal)), signal, color=COLORS[0])
-    plt.grid(alpha=0.5)
+    with _figure((12, 8), save_path) as fig:
+        ax = fig.add_subplot(2, 1, 1)
+        ax.set_title('Original audio signal')
+        _plot_line(ax, signal, len(signal) / sample_rate, max_points, COLORS[0])
+        ax.grid(alpha=0.5)
 
-    plt.subplot(2, 1, 2)
-    plt.title('Voice activity')
-    plt.plot(np.linspace(0, int(len(cut_signal) / sample_rate), len(cut_signal)), cut_signal, color=COLORS[1])
-    plt.grid(alpha=0.5)
-    plt.xlabel('Time, seconds')
-    plt.show()
+        ax = fig.add_subplot(2, 1, 2)
+        ax.set_title('Voice activity')
+        _plot_line(ax, cut_signal, len(cut_signal) / sample_rate, max_points, COLORS[1])
+        ax.grid(alpha=0.5)
+        ax.set_xlabel('Time, seconds')
+    return save_path
 
 
 def plotting_descriptors_verbose(signal, *args, **kwargs):
@@ -107,35 +176,12 @@ def plotting_descriptors_verbose(signal, *args, **kwargs):
 
         :param signal: audio signal librosa.load() object;
         :param args: speech descriptions, not all of them can be used. (default: all of them);
-        :param kwargs: help to plot detected regions
+        :param kwargs: help to plot detected regions, max_points and save_path as in plotting_descriptors;
+        :return save_path or None.
         """
-    duration = librosa.get_duration(signal)
-    plt.rcParams.update({'font.size': 14})
-    fig = plt.figure(figsize=(16, 14))
-    fig_grid = plt.GridSpec(ncols=1, nrows=len(args) + 1, figure=fig)
-    plt.subplot(fig_grid[0, 0])
-    plt.title(LABELS[0])
-    detect = kwargs.get('detection_region')
-    frame_length = kwargs.get('frame_length')
-    sample_rate = kwargs.get('sample_rate')
-
-    for i in range(len(detect)):
-        color = '#C3C5C7' if detect[i] else 'white'
-
-        plt.axvspan((i * frame_length * 0.5),
-                    ((i * frame_length * sample_rate / 2) + frame_length * sample_rate / 2) / sample_rate,
-                    color=color, lw=0, alpha=0.2)
-
-    plt.plot(np.linspace(0, duration, len(signal)), signal, color=COLORS[0], label=LABELS[0])
-
-    if args:
-        for i in range(len(args)):
-            plt.subplot(fig_grid[i + 1, 0])
-            plt.title(LABELS[i + 1])
-            plt.plot(np.linspace(0, duration, len(args[i])), args[i], color=COLORS[i + 1])
-            plt.fill_between(np.linspace(0, duration, len(args[i])), args[i], 0, color=COLORS[i + 1], alpha=0.3)
-            plt.grid(alpha=0.4)
-
-    plt.xlabel('Time, seconds')
-    plt.subplots_adjust(hspace=0.7)
-    plt.show()
+    save_path = kwargs.get('save_path')
+    with _figure((16, 14), save_path) as fig:
+        _descriptors_figure(fig, signal, args, [None] * len(args), kwargs.get('detection_region'), _hop(kwargs),
+                            kwargs.get('sample_rate'),
+                            kwargs.get('max_points', MAX_POINTS))
+    return save_path
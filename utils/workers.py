@@ -0,0 +1,40 @@
+"""This module provides process pools of workers that limit their own BLAS and numba threads"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMBA_NUM_THREADS')
+# threadpoolctl limits of this worker process, kept so they stay in force
+_THREADPOOL_LIMITS = None
+
+
+def init_worker(threads):
+    """Limit BLAS and numba threads of a worker process
+
+    The variables are set in the worker only, numba reads them on its first import there, BLAS libraries that are
+    already loaded are limited by threadpoolctl.
+
+    :param threads: number of threads per worker.
+    """
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+    from threadpoolctl import threadpool_limits
+    global _THREADPOOL_LIMITS
+    _THREADPOOL_LIMITS = threadpool_limits(limits=threads)
+
+
+def process_pool(workers, initializer=init_worker, initargs=(1,)):
+    """Process pool whose workers start from a fresh interpreter instead of a fork
+
+    The TBB threading layer of the parallel numba kernel does not survive fork: once the kernel ran in the parent,
+    a forked pool leaves the parent hanging at exit. Workers import the main module again, so scripts that start a
+    pool need the ``if __name__ == '__main__'`` guard.
+
+    :param workers: number of worker processes;
+    :param initializer: function run by every worker on start (default: init_worker);
+    :param initargs: arguments of initializer (default: one thread per worker);
+    :return ProcessPoolExecutor object.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                               initializer=initializer, initargs=initargs)
@@ -0,0 +1,371 @@
+"""This module provides staged voice activity detection: cached signal analysis and cheap repeated thresholding"""
+import pathlib
+from functools import cached_property
+
+import numpy as np
+import soundfile as sf
+from loguru import logger
+
+import utils.audio_operations as audio_operations
+import utils.descriptors as speech_descriptors
+import utils.kernels as kernels
+from utils.cache import DescriptorCache
+from utils.denoise import SpectralGate
+from utils.segments import export_segments, join_segments, segments_to_seconds, write_segments
+from voice_detection.decision import (DESCRIPTORS, Thresholds, detect_speech, impact_mask, speech_segments,
+                                     unpack_impacts)
+
+
+class SpeechAnalysis:
+    """Audio file with lazily calculated and memoized speech descriptors
+
+    Nothing is loaded until a descriptor is requested, and every stage is calculated only once, so ``detect`` can be
+    called many times with different thresholds at the cost of a few vectorized comparisons.
+    """
+
+    def __init__(self, file, frame_length=0.03, frame_overlap=0.015, N_frames=31, n_fft=None, denoise='noisereduce',
+                 gate=None, noise_key=None, cache=None, dtype=np.float64, channel=None, sample_rate=22050):
+        """Initialize main params
+
+        :param file: name of audio file with path;
+        :param frame_length: length of each frame (default = 0.03);
+        :param frame_overlap: duration of frames overlap (default = 0.015);
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz);
+        :param denoise: 'noisereduce' for noisereduce over the whole signal, 'gate' for SpectralGate fitted on the
+            first N_frames frames, None to skip noise reduction (default: 'noisereduce');
+        :param gate: SpectralGate object whose cached noise profiles are reused (default: new gate);
+        :param noise_key: key of noise profile in gate, with channel set the key is (noise_key, channel)
+            (default: file);
+        :param cache: DescriptorCache object or cache folder, with a cache hit the signal and descriptors are read
+            from disk instead of being calculated (default: no cache);
+        :param dtype: float dtype of signal, frames and descriptors, float32 halves memory per frame (default: float64);
+        :param channel: index of channel to analyse, None averages channels (default: None);
+        :param sample_rate: sample rate the signal is resampled to, 'native' keeps the sample rate of file, which
+            saves resampling and, for 8 kHz audio, most of the frames and FFT work (default: 22050).
+        """
+        if denoise not in ('noisereduce', 'gate', None):
+            raise ValueError(f"Unknown denoise method {denoise}")
+        self.file = file
+        self.frame_length = frame_length
+        self.frame_overlap = frame_overlap
+        self.n_frames = N_frames
+        self.n_fft = n_fft
+        self.denoise = denoise
+        self.gate = gate if gate is not None else SpectralGate()
+        self.noise_key = noise_key if noise_key is not None else file
+        if channel is not None:
+            # every channel has its own noise, the same keys as MultiChannelAnalysis
+            self.noise_key = (self.noise_key, channel)
+        self.cache = DescriptorCache(cache) if isinstance(cache, (str, pathlib.Path)) else cache
+        self.dtype = np.dtype(dtype)
+        self.channel = channel
+        self.target_rate = None if sample_rate == 'native' else sample_rate
+
+    @property
+    def name(self):
+        """Name of results: stem of file, with channel number if a channel is analysed"""
+        stem = pathlib.Path(self.file).stem
+        return stem if self.channel is None else f'{stem}_ch{self.channel}'
+
+    @property
+    def cache_params(self):
+        """Params that change cached arrays"""
+        n_fft = self.n_fft
+        if n_fft is None and self.target_rate is not None:
+            n_fft = speech_descriptors.fft_size(self.target_rate)
+        params = {'frame_length': self.frame_length, 'frame_overlap': self.frame_overlap, 'n_fft': n_fft,
+                  'denoise': self.denoise, 'dtype': self.dtype.name}
+        if self.target_rate != speech_descriptors.REFERENCE_SAMPLE_RATE:
+            params['sample_rate'] = self.target_rate
+        if self.channel is not None:
+            params['channel'] = self.channel
+        if self.denoise == 'gate':
+            params.update(n_frames=self.n_frames, n_std=self.gate.n_std, prop_decrease=self.gate.prop_decrease,
+                          smoothing_bins=self.gate.smoothing_bins)
+        return params
+
+    @cached_property
+    def _cache_key(self):
+        """Key of this analysis in cache"""
+        return self.cache.key(self.file, self.cache_params)
+
+    @cached_property
+    def _cached(self):
+        """Arrays of this analysis read from cache, or None"""
+        if self.cache is None:
+            return None
+        entry = self.cache.load(self._cache_key)
+        if entry is not None:
+            logger.info(f"Load signal and descriptors of {self.file} from cache")
+        return entry
+
+    @cached_property
+    def _audio(self):
+        """Load audio signal, denoise it with noisereduce if required"""
+        if self._cached is not None:
+            return self._cached['audio'], self._cached['sample_rate']
+        logger.info(f"Load {self.file}")
+        if self.channel is None:
+            signal, sample_rate = audio_operations.load(self.file, self.target_rate)
+        else:
+            signal, sample_rate = audio_operations.load(self.file, self.target_rate, mono=False)
+            signal = np.ascontiguousarray(signal[self.channel])
+        if self.denoise == 'noisereduce':
+            import noisereduce as nr
+            signal = nr.reduce_noise(signal, signal[:-1])
+        return signal.astype(self.dtype, copy=False), sample_rate
+
+    @cached_property
+    def signal(self):
+        """Denoised audio signal"""
+        if self.denoise != 'gate':
+            return self._audio[0]
+        if self._cached is not None:
+            return self._cached['signal']
+        frame_step = int(round(self.frame_overlap * self.sample_rate))
+        return audio_operations.overlap_add(self.framed_signal, frame_step, np.blackman(self.framed_signal.shape[1]),
+                                            signal_length=len(self._audio[0]))
+
+    @property
+    def sample_rate(self):
+        """Sample rate of audio signal"""
+        return self._audio[1]
+
+    @property
+    def fft_size(self):
+        """FFT size of spectral descriptors, n_fft or the size adapted to sample rate"""
+        return self.n_fft or speech_descriptors.fft_size(self.sample_rate)
+
+    @cached_property
+    def preemphasis_signal(self):
+        """Audio signal after preemphasis filter"""
+        return audio_operations.preemphasis(self.signal)
+
+    @cached_property
+    def framed_signal(self):
+        """Windowed frames of denoised audio signal
+
+        With the spectral gate frames are gated in place, so descriptors use the gated frames without framing
+        the signal again.
+        """
+        framed_signal = audio_operations.framing_signal(self._audio[0], self.sample_rate,
+                                                        frame_length=self.frame_length,
+                                                        frame_overlap=self.frame_overlap, dtype=self.dtype)
+        if self.denoise == 'gate':
+            logger.info("Apply spectral gate")
+            framed_signal = self.gate.gate_frames(framed_signal, key=self.noise_key, n_frames=self.n_frames,
+                                                  sample_rate=self.sample_rate)
+        return framed_signal
+
+    @cached_property
+    def _time_domain(self):
+        """Raw short term energy and zero crossing rate calculated in one pass over samples"""
+        logger.info("Calculate short term energy and zero crossing rate")
+        return kernels.energy_zero_crossings(self.framed_signal)
+
+    @cached_property
+    def short_term_energy(self):
+        """Normalized short term energy of each frame"""
+        if self._cached is not None:
+            return self._cached['descriptors'][0]
+        energy = self._time_domain[0]
+        return audio_operations.normalize(energy / np.linalg.norm(energy))
+
+    @cached_property
+    def zero_crossing_rate(self):
+        """Normalized zero crossing rate of each frame"""
+        if self._cached is not None:
+            return self._cached['descriptors'][1]
+        return audio_operations.normalize(self._time_domain[1])
+
+    @cached_property
+    def _spectral(self):
+        """Spectral descriptors calculated from one shared spectrum"""
+        logger.info("Calculate spectral descriptors")
+        return speech_descriptors.spectral_descriptors(self.framed_signal, self.sample_rate, nfft=self.fft_size)
+
+    @cached_property
+    def spectral_flatness(self):
+        """Normalized spectral flatness of each frame"""
+        if self._cached is not None:
+            return self._cached['descriptors'][2]
+        return audio_operations.normalize(self._spectral['flatness'])
+
+    @cached_property
+    def spectral_rolloff(self):
+        """Normalized spectral rolloff of each frame"""
+        if self._cached is not None:
+            return self._cached['descriptors'][3]
+        return audio_operations.normalize(self._spectral['rolloff'])
+
+    @cached_property
+    def descriptors(self):
+        """Stack of normalized descriptors ordered as decision.DESCRIPTORS, stored in cache once calculated"""
+        if self._cached is not None:
+            return self._cached['descriptors']
+        descriptors = np.stack([getattr(self, name) for name in DESCRIPTORS]).astype(self.dtype, copy=False)
+        if self.cache is not None:
+            arrays = {'audio': self._audio[0], 'descriptors': descriptors}
+            if self.denoise == 'gate':
+                arrays['signal'] = self.signal
+            self.cache.store(self._cache_key, arrays, {'sample_rate': self.sample_rate})
+        return descriptors
+
+    @property
+    def num_frames(self):
+        """Number of frames"""
+        return self.descriptors.shape[1]
+
+    @cached_property
+    def means(self):
+        """Mean value of each descriptor over the first N_frames frames"""
+        return np.mean(self.descriptors[:, :self.n_frames], axis=1)
+
+    @cached_property
+    def deltas(self):
+        """Deviation of each descriptor from its mean value"""
+        return self.descriptors - self.means[:, None]
+
+    def detect(self, energy_threshold=5 * 10 ** -6, flatness_threshold=0.12, zerocrossing_threshold=0.9,
+               rolloff_threshold=0.7):
+        """Detect speech frames with given thresholds
+
+        :param energy_threshold: threshold of short term energy (default: 5 * 10 ** -6);
+        :param flatness_threshold: threshold of spectral flatness (default: 0.12);
+        :param zerocrossing_threshold: threshold of zero crossing rate (default: 0.9);
+        :param rolloff_threshold: threshold of spectral rolloff (default: 0.7);
+        :return Detection object.
+        """
+        thresholds = Thresholds(energy_threshold, zerocrossing_threshold, flatness_threshold, rolloff_threshold)
+        return Detection(self, thresholds)
+
+
+class Detection:
+    """Result of thresholding speech descriptors of SpeechAnalysis"""
+
+    def __init__(self, analysis, thresholds, speech_detection=None):
+        """Calculate speech detection
+
+        :param analysis: SpeechAnalysis object;
+        :param thresholds: Thresholds tuple;
+        :param speech_detection: already calculated speech detection, e.g. of a batch of channels (default: calculate).
+        """
+        self.analysis = analysis
+        self.thresholds = thresholds
+        if speech_detection is None:
+            speech_detection = detect_speech(analysis.deltas, thresholds)
+        self.speech_detection = speech_detection
+        self.indexes = np.where(self.speech_detection[:-1] != self.speech_detection[1:])[0]
+
+    @cached_property
+    def segments(self):
+        """Speech segments as numpy array of (start, end) samples of shape (num_segments, 2)"""
+        frame_step = int(round(self.analysis.frame_overlap * self.analysis.sample_rate))
+        return np.minimum(speech_segments(self.speech_detection) * frame_step, len(self.analysis.signal))
+
+    @property
+    def segments_seconds(self):
+        """Speech segments as numpy array of (start, end) seconds"""
+        return segments_to_seconds(self.segments, self.analysis.sample_rate)
+
+    def export_segments(self, path, segment_format=None):
+        """Write speech segments to JSON, CSV or RTTM file, audio is not touched
+
+        :param path: path of result file, its suffix chooses the format;
+        :param segment_format: 'json', 'csv' or 'rttm' (default: suffix of path);
+        :return path of result file.
+        """
+        logger.info(f"Save speech segments in {path}")
+        channel = 1 if self.analysis.channel is None else self.analysis.channel + 1
+        return export_segments(self.segments, self.analysis.sample_rate, path,
+                               file_id=pathlib.Path(self.analysis.file).stem, segment_format=segment_format,
+                               channel=channel)
+
+    @cached_property
+    def impact_mask(self):
+        """Per descriptor decisions packed into one byte per frame, see decision.impact_mask"""
+        return impact_mask(self.analysis.deltas, self.thresholds)
+
+    @property
+    def impacts(self):
+        """Per descriptor 0/1 decisions (4, num_frames) ordered as decision.DESCRIPTORS, unpacked from impact_mask"""
+        return unpack_impacts(self.impact_mask)
+
+    def _crossfade_samples(self, crossfade):
+        return int(round(crossfade * self.analysis.sample_rate))
+
+    def speech_signal(self, crossfade=0):
+        """Join speech chunks of audio signal
+
+        :param crossfade: seconds of crossfade between chunks, e.g. utils.segments.CROSSFADE, 0 for hard cuts
+            (default: 0);
+        :return numpy array of speech samples.
+        """
+        logger.info("Join speech chunks")
+        return join_segments(self.analysis.signal, self.segments, self._crossfade_samples(crossfade))
+
+    def save(self, save_path=None, cutted_signal=None, crossfade=0):
+        """Save speech signal to WAV format
+
+        Speech segments are streamed to the file as slices of the signal, unless a joined signal is given.
+
+        :param save_path: path to save cut audio file (default: current dir);
+        :param cutted_signal: already joined speech signal (default: stream segments);
+        :param crossfade: seconds of crossfade between streamed segments, e.g. utils.segments.CROSSFADE, 0 for hard
+            cuts (default: 0);
+        :return path of saved file or None if the folder does not exist.
+        """
+        path = pathlib.Path(save_path or '.') / f'{self.analysis.name}_vad.wav'
+        logger.info(f"Save result signal in {path}")
+        try:
+            if cutted_signal is None:
+                write_segments(path, self.analysis.signal, self.segments, self.analysis.sample_rate,
+                               self._crossfade_samples(crossfade))
+            else:
+                sf.write(str(path), cutted_signal, self.analysis.sample_rate)
+        except RuntimeError:
+            logger.error('Please check save path, the folder must exist')
+            return None
+        return path
+
+    def plot(self, cutted_signal=None, save_path=None, image_format='png'):
+        """Show descriptor graphs and comparison of original and speech signals, or write them to image files
+
+        :param cutted_signal: already joined speech signal (default: join it now);
+        :param save_path: folder to write {name}_descriptors and {name}_comparison images to instead of showing
+            them, no display is needed then (default: show);
+        :param image_format: 'png' or 'svg' (default: 'png');
+        :return list of paths of written images, empty when graphs are shown.
+        """
+        import utils.visualize as verbose
+
+        logger.info("Plotting graphs")
+        analysis = self.analysis
+        logger.info(f"Short term energy threshold: {self.thresholds.energy}\n"
+                    f"Zero crossing rate threshold: {self.thresholds.zerocrossing}\n"
+                    f"Spectral flatness threshold: {self.thresholds.flatness}\n"
+                    f"Spectral rolloff threshold: {self.thresholds.rolloff}\n")
+        paths = [None, None]
+        if save_path is not None:
+            paths = [pathlib.Path(save_path) / f'{analysis.name}_{kind}.{image_format}'
+                     for kind in ('descriptors', 'comparison')]
+        energy_impact, zerocross_impact, flatness_impact, rolloff_impact = self.impacts
+        hop = int(round(analysis.frame_overlap * analysis.sample_rate)) / analysis.sample_rate
+        verbose.plotting_descriptors(analysis.signal,
+                                     analysis.short_term_energy,
+                                     analysis.zero_crossing_rate,
+                                     analysis.spectral_flatness,
+                                     analysis.spectral_rolloff,
+                                     detection_region=self.speech_detection,
+                                     hop=hop,
+                                     sample_rate=analysis.sample_rate,
+                                     short_term_energy_impact=energy_impact,
+                                     zero_crossing_rate_impact=zerocross_impact,
+                                     spectral_flatness_impact=flatness_impact,
+                                     spectral_rolloff_impact=rolloff_impact,
+                                     save_path=paths[0])
+        if cutted_signal is None:
+            cutted_signal = self.speech_signal()
+        verbose.plot_signals_comparison(analysis.signal, cutted_signal, analysis.sample_rate, save_path=paths[1])
+        return [path for path in paths if path is not None]
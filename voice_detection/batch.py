@@ -0,0 +1,257 @@
+"""This module provides command line batch mode that runs voice activity detection over many files in parallel
+
+Usage: python -m voice_detection.batch <directory | manifest> --output <dir> [--workers N]
+"""
+import argparse
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from loguru import logger
+
+from utils.cache import DescriptorCache
+from utils.segments import SEGMENT_FORMATS
+from utils.workers import process_pool
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.aiff', '.aif')
+MANIFEST_NAME = 'manifest.jsonl'
+SUMMARY_NAME = 'summary.json'
+# params that change how fast results are made, not the results
+RUNTIME_PARAMS = ('cache', 'shard_workers')
+
+
+def collect_files(source):
+    """Collect audio files of a directory (recursively) or of a manifest with one path per line
+
+    Output folders mirror the folders of files relative to the directory, or to the common folder of all files of
+    a manifest, so files of the same name in different folders get different results.
+
+    :param source: directory or text manifest;
+    :return list of (file, relative output folder) tuples.
+    :raise ValueError: if results of two files would be written to the same path.
+    """
+    source = pathlib.Path(source)
+    if source.is_dir():
+        paths = sorted(path for path in source.rglob('*') if path.suffix.lower() in AUDIO_EXTENSIONS)
+        root = source
+    else:
+        paths = []
+        with open(source) as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    path = pathlib.Path(line)
+                    if not path.is_absolute():
+                        path = source.parent / path
+                    paths.append(path)
+        root = os.path.commonpath([os.path.abspath(path.parent) for path in paths]) if paths else '.'
+
+    files = [(str(path), os.path.relpath(os.path.abspath(path.parent), os.path.abspath(root))) for path in paths]
+    results = {}
+    for (file, folder), path in zip(files, paths):
+        # results are named by stem, so a.wav and a.flac of one folder collide too
+        result = (folder, path.stem)
+        if result in results:
+            raise ValueError(f"{file} and {results[result]} would write the same results to "
+                             f"{pathlib.Path(folder) / path.stem}_vad.*")
+        results[result] = file
+    return files
+
+
+def result_params(params):
+    """Params that change results of a file, in the JSON form stored in manifest records
+
+    :param params: dict of params of run_batch;
+    :return JSON serializable dict.
+    """
+    params = {name: value for name, value in params.items() if name not in RUNTIME_PARAMS}
+    return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+
+def read_manifest(output, params=None):
+    """Read results of previous runs
+
+    :param output: output folder;
+    :param params: if set only records made with these params count, see result_params (default: any params);
+    :return dict of file -> record for successfully processed files.
+    """
+    done = {}
+    path = pathlib.Path(output) / MANIFEST_NAME
+    if not path.exists():
+        return done
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line may be cut by a crash
+                continue
+            if record.get('status') == 'ok' and (params is None or record.get('params') == params):
+                done[record['file']] = record
+            elif record['file'] in done:
+                # a later run with other params supersedes the earlier result
+                del done[record['file']]
+    return done
+
+
+def sample_rate_arg(value):
+    """Parse sample rate argument, a number of Hz or 'native'"""
+    return value if value == 'native' else int(value)
+
+
+def process_file(file, save_path, params):
+    """Run voice activity detection for one file in a worker process
+
+    :param file: name of audio file with path;
+    :param save_path: folder for the cut audio file;
+    :param params: dict of SpeechAnalysis params, 'thresholds' dict of detect() params, 'save_audio' flag,
+        'segments' format of timestamps file, 'plots' format of QA plots and 'shard_workers' threads that analyse
+        shards of the file (see ShardedAnalysis);
+    :return record for the manifest.
+    """
+    from voice_detection.analysis import SpeechAnalysis
+
+    start = time.perf_counter()
+    record = {'file': file}
+    try:
+        params = dict(params)
+        thresholds = params.pop('thresholds', {})
+        save_audio = params.pop('save_audio', True)
+        segment_format = params.pop('segments', None)
+        plot_format = params.pop('plots', None)
+        shard_workers = params.pop('shard_workers', None)
+        if shard_workers:
+            from voice_detection.sharding import ShardedAnalysis
+            analysis = ShardedAnalysis(file, workers=shard_workers, **params)
+        else:
+            analysis = SpeechAnalysis(file, **params)
+        detection = analysis.detect(**thresholds)
+        pathlib.Path(save_path).mkdir(parents=True, exist_ok=True)
+        if save_audio:
+            output = detection.save(save_path)
+            if output is None:
+                raise RuntimeError(f'can not write to {save_path}')
+            record['output'] = str(output)
+        if segment_format:
+            segments_path = pathlib.Path(save_path) / f'{pathlib.Path(file).stem}_vad.{segment_format}'
+            record['segments'] = str(detection.export_segments(segments_path))
+        if plot_format:
+            record['plots'] = [str(path) for path in detection.plot(save_path=save_path, image_format=plot_format)]
+        record.update(status='ok', frames=int(len(detection.speech_detection)),
+                      speech_frames=int(detection.speech_detection.sum()),
+                      duration=len(analysis.signal) / analysis.sample_rate)
+    except Exception as error:
+        record.update(status='error', error=f'{type(error).__name__}: {error}')
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+
+def run_batch(files, output, workers=None, threads=1, params=None, resume=True):
+    """Process files on a process pool and append results to the manifest as soon as they are ready
+
+    :param files: list of (file, relative output folder) tuples, see collect_files();
+    :param output: output folder for cut audio files, manifest and summary;
+    :param workers: number of worker processes (default: number of cpus);
+    :param threads: BLAS/numba threads per worker (default: 1);
+    :param params: dict of SpeechAnalysis params and 'thresholds' dict of detect() params;
+    :param resume: if True skip files that are marked as done in the manifest with the same params, files done
+        with other params, e.g. thresholds or sample rate, are processed again (default: True);
+    :return summary dict.
+    """
+    output = pathlib.Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count()
+    params = params or {}
+    stored_params = result_params(params)
+
+    done = read_manifest(output, stored_params) if resume else {}
+    pending = [(file, folder) for file, folder in files if file not in done]
+    logger.info(f"{len(files)} files, {len(files) - len(pending)} already done, {workers} workers")
+
+    summary = {'files': len(files), 'skipped': len(files) - len(pending), 'ok': 0, 'error': 0, 'audio_seconds': 0.0}
+    start = time.perf_counter()
+    with open(output / MANIFEST_NAME, 'a') as manifest, \
+            process_pool(workers, initargs=(threads,)) as executor:
+        queue = iter(pending)
+        running = set()
+        while True:
+            # keep a bounded number of tasks in flight, so huge corpora do not create huge future lists
+            for file, folder in queue:
+                running.add(executor.submit(process_file, file, str(output / folder), params))
+                if len(running) >= workers * 4:
+                    break
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                record['params'] = stored_params
+                summary[record['status']] += 1
+                summary['audio_seconds'] += record.get('duration', 0.0)
+                if record['status'] != 'ok':
+                    logger.error(f"{record['file']}: {record['error']}")
+                manifest.write(json.dumps(record) + '\n')
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+    summary['elapsed'] = time.perf_counter() - start
+    summary['done'] = summary['skipped'] + summary['ok']
+    with open(output / SUMMARY_NAME, 'w') as file:
+        json.dump(summary, file, indent=2)
+    logger.info(f"Done: {summary['ok']} ok, {summary['error']} errors in {summary['elapsed']:.1f} s")
+    return summary
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Voice activity detection for a directory or a manifest of files')
+    parser.add_argument('source', help='directory with audio files or text file with one path per line')
+    parser.add_argument('-o', '--output', required=True, help='folder for cut audio files and manifest')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all cpus)')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='BLAS/numba threads per worker (default: 1)')
+    parser.add_argument('--shard-workers', type=int, default=None,
+                        help='split every file into shards analysed by this many threads, for few long files')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='process files already listed in the manifest, even when done with the same params')
+    parser.add_argument('--segments', choices=SEGMENT_FORMATS, help='also write speech timestamps in this format')
+    parser.add_argument('--no-audio', action='store_true', help='do not write cut audio files')
+    parser.add_argument('--plots', choices=('png', 'svg'), help='also write descriptor and comparison plots')
+    parser.add_argument('--denoise', choices=('noisereduce', 'gate', 'none'), default='noisereduce')
+    parser.add_argument('--cache', help='folder of descriptor cache shared by runs with other thresholds')
+    parser.add_argument('--cache-size', type=float, default=1024, help='size cap of cache in MB (default: 1024)')
+    parser.add_argument('--frame-length', type=float, default=0.03)
+    parser.add_argument('--frame-overlap', type=float, default=0.015)
+    parser.add_argument('--n-frames', type=int, default=31)
+    parser.add_argument('--n-fft', type=int, default=None, help='FFT size (default: adapted to sample rate)')
+    parser.add_argument('--sample-rate', type=sample_rate_arg, default=22050,
+                        help="sample rate of analysis or 'native' to keep the rate of every file (default: 22050)")
+    parser.add_argument('--energy-threshold', type=float, default=5 * 10 ** -6)
+    parser.add_argument('--flatness-threshold', type=float, default=0.12)
+    parser.add_argument('--zerocrossing-threshold', type=float, default=0.9)
+    parser.add_argument('--rolloff-threshold', type=float, default=0.7)
+    args = parser.parse_args(argv)
+
+    params = {'frame_length': args.frame_length,
+              'frame_overlap': args.frame_overlap,
+              'N_frames': args.n_frames,
+              'n_fft': args.n_fft,
+              'sample_rate': args.sample_rate,
+              'denoise': None if args.denoise == 'none' else args.denoise,
+              'cache': DescriptorCache(args.cache, int(args.cache_size * 2 ** 20)) if args.cache else None,
+              'save_audio': not args.no_audio,
+              'segments': args.segments,
+              'plots': args.plots,
+              'shard_workers': args.shard_workers,
+              'thresholds': {'energy_threshold': args.energy_threshold,
+                             'flatness_threshold': args.flatness_threshold,
+                             'zerocrossing_threshold': args.zerocrossing_threshold,
+                             'rolloff_threshold': args.rolloff_threshold}}
+    summary = run_batch(collect_files(args.source), args.output, workers=args.workers, threads=args.threads,
+                        params=params, resume=not args.no_resume)
+    return 1 if summary['error'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,212 @@
+"""This module provides voice activity detection of very long recordings with bounded memory"""
+import os
+import pathlib
+import tempfile
+
+import numpy as np
+import soundfile as sf
+from loguru import logger
+
+import utils.audio_operations as audio_operations
+import utils.descriptors as speech_descriptors
+from utils.denoise import SpectralGate
+from utils.segments import crossfade_lengths, export_segments, mix_crossfade, segments_to_seconds
+from voice_detection.decision import Hangover, SegmentCollector, Thresholds, speech_condition
+
+
+class BlockAnalysis:
+    """Audio file analysed block by block
+
+    The file is read through soundfile blocks that overlap by ``frame - hop`` samples, so every block holds a whole
+    number of frames and no frame is lost at the borders. Raw descriptors are spilled to a disk backed memmap of
+    4 values per frame, decisions run through an incremental hangover and the output is copied from the file in
+    chunks, so peak memory depends on ``block_frames`` only.
+
+    Unlike SpeechAnalysis the signal is analysed at its native sample rate and multichannel files are downmixed
+    to mono. The only noise reduction that works block by block is the spectral gate, its profile is fitted on the
+    first N_frames frames of the file before the blocks are read, whatever ``block_frames`` is. Saved segments are
+    copied from the original file and can be crossfaded like SpeechAnalysis output.
+    """
+
+    def __init__(self, file, frame_length=0.03, frame_overlap=0.015, N_frames=31, n_fft=None, block_frames=1024,
+                 denoise=None, gate=None, noise_key=None):
+        """Initialize main params
+
+        :param file: name of audio file with path;
+        :param frame_length: length of each frame (default = 0.03);
+        :param frame_overlap: duration of frames overlap (default = 0.015);
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz);
+        :param block_frames: number of frames read and analysed at once (default: 1024);
+        :param denoise: 'gate' to apply SpectralGate to frames, None to skip noise reduction (default: None);
+        :param gate: SpectralGate object whose cached noise profiles are reused (default: new gate);
+        :param noise_key: key of noise profile in gate (default: file).
+        """
+        if denoise not in ('gate', None):
+            raise ValueError(f"Unknown denoise method {denoise} for block processing")
+        self.file = file
+        info = sf.info(file)
+        self.sample_rate = info.samplerate
+        self.length = info.frames
+        self.frame_size = int(round(frame_length * self.sample_rate))
+        self.hop = int(round(frame_overlap * self.sample_rate))
+        self.n_frames = N_frames
+        self.n_fft = n_fft or speech_descriptors.fft_size(self.sample_rate)
+        self.block_frames = block_frames
+        self.denoise = denoise
+        self.gate = gate if gate is not None else SpectralGate()
+        self.noise_key = noise_key if noise_key is not None else file
+        # the frames framing_signal makes, so ranges and baseline are taken over the frames of SpeechAnalysis
+        self.num_frames = audio_operations.frame_count(self.length, self.sample_rate, frame_length, frame_overlap)
+        self._raw = None
+
+    def __del__(self):
+        if getattr(self, '_raw', None) is not None:
+            path = self._raw.filename
+            self._raw = None
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @property
+    def raw_descriptors(self):
+        """Disk backed (num_frames, 4) array of raw descriptors, calculated on first use"""
+        if self._raw is None:
+            self._raw = self.__analyse()
+        return self._raw
+
+    def __analyse(self):
+        """Calculate raw descriptors block by block"""
+        logger.info(f"Calculate speech descriptors of {self.file} in blocks of {self.block_frames} frames")
+        handle, path = tempfile.mkstemp(suffix='.descriptors')
+        os.close(handle)
+        raw = np.memmap(path, dtype=np.float64, mode='w+', shape=(max(self.num_frames, 1), 4))
+
+        window = np.blackman(self.frame_size)
+        profile_key = self.gate.profile_key(self.noise_key, self.frame_size, self.sample_rate)
+        if self.denoise == 'gate' and self.num_frames and profile_key not in self.gate.profiles:
+            # fit the profile on the same first frames as SpeechAnalysis, also when blocks are shorter
+            count = min(self.n_frames, self.num_frames)
+            first = sf.read(self.file, frames=self.frame_size + (count - 1) * self.hop, dtype='float64',
+                            always_2d=True)[0]
+            self.gate.gate_frames(self.__frames(first.mean(axis=1), count) * window, key=self.noise_key,
+                                  n_frames=self.n_frames, sample_rate=self.sample_rate)
+        blocksize = self.frame_size + (self.block_frames - 1) * self.hop
+        index = 0
+        for block in sf.blocks(self.file, blocksize=blocksize, overlap=self.frame_size - self.hop,
+                               dtype='float64', always_2d=True):
+            if index >= self.num_frames:
+                break
+            count = min(self.block_frames, self.num_frames - index)
+            frames = self.__frames(block.mean(axis=1), count) * window
+            if self.denoise == 'gate':
+                frames = self.gate.gate_frames(frames, key=self.noise_key, n_frames=self.n_frames,
+                                               sample_rate=self.sample_rate)
+            raw[index:index + count] = speech_descriptors.descriptor_matrix(frames, self.sample_rate,
+                                                                            nfft=self.n_fft)
+            index += count
+        raw.flush()
+        return raw
+
+    def __frames(self, mono, count):
+        """Cut count frames from samples, zero padded at the end of file like framing_signal does"""
+        length = self.frame_size + (count - 1) * self.hop
+        if len(mono) < length:
+            mono = np.concatenate([mono, np.zeros(length - len(mono))])
+        return np.lib.stride_tricks.sliding_window_view(mono, self.frame_size)[::self.hop][:count]
+
+    def __statistics(self):
+        """Baseline means and descriptor ranges used for min-max scaling"""
+        raw = self.raw_descriptors
+        minimum = np.full(4, np.inf)
+        maximum = np.full(4, -np.inf)
+        for start in range(0, self.num_frames, self.block_frames):
+            chunk = raw[start:start + self.block_frames]
+            minimum = np.minimum(minimum, chunk.min(axis=0))
+            maximum = np.maximum(maximum, chunk.max(axis=0))
+        scale = maximum - minimum
+        scale[scale == 0] = 1
+        return np.mean(raw[:self.n_frames], axis=0), scale
+
+    def detect(self, energy_threshold=5 * 10 ** -6, flatness_threshold=0.12, zerocrossing_threshold=0.9,
+               rolloff_threshold=0.7):
+        """Detect speech segments with given thresholds
+
+        :param energy_threshold: threshold of short term energy (default: 5 * 10 ** -6);
+        :param flatness_threshold: threshold of spectral flatness (default: 0.12);
+        :param zerocrossing_threshold: threshold of zero crossing rate (default: 0.9);
+        :param rolloff_threshold: threshold of spectral rolloff (default: 0.7);
+        :return BlockDetection object.
+        """
+        thresholds = Thresholds(energy_threshold, zerocrossing_threshold, flatness_threshold, rolloff_threshold)
+        logger.info("Extract speech segments")
+        raw = self.raw_descriptors
+        means, scale = self.__statistics()
+        hangover = Hangover()
+        collector = SegmentCollector()
+        for start in range(0, self.num_frames, self.block_frames):
+            deltas = (raw[start:start + self.block_frames] - means) / scale
+            collector.push(hangover.push_many(speech_condition(deltas.T, thresholds)))
+        collector.push(hangover.flush())
+        return BlockDetection(self, collector.close() * self.hop)
+
+
+class BlockDetection:
+    """Speech segments of BlockAnalysis"""
+
+    def __init__(self, analysis, segments):
+        """Initialize result
+
+        :param analysis: BlockAnalysis object;
+        :param segments: numpy array of (start, end) samples of shape (num_segments, 2).
+        """
+        self.analysis = analysis
+        self.segments = segments
+
+    @property
+    def segments_seconds(self):
+        """Speech segments as numpy array of (start, end) seconds"""
+        return segments_to_seconds(self.segments, self.analysis.sample_rate)
+
+    def export_segments(self, path, segment_format=None):
+        """Write speech segments to JSON, CSV or RTTM file, audio is not touched
+
+        :param path: path of result file, its suffix chooses the format;
+        :param segment_format: 'json', 'csv' or 'rttm' (default: suffix of path);
+        :return path of result file.
+        """
+        logger.info(f"Save speech segments in {path}")
+        return export_segments(self.segments, self.analysis.sample_rate, path,
+                               file_id=pathlib.Path(self.analysis.file).stem, segment_format=segment_format)
+
+    def save(self, save_path=None, chunk_size=65536, crossfade=0):
+        """Copy speech segments of the file to WAV format chunk by chunk
+
+        Only the crossfaded ends of segments are held in memory besides one chunk, see
+        utils.segments.stitched_chunks.
+
+        :param save_path: path to save cut audio file (default: current dir);
+        :param chunk_size: number of samples copied at once (default: 65536);
+        :param crossfade: seconds of crossfade between segments, e.g. utils.segments.CROSSFADE, 0 for hard cuts
+            (default: 0);
+        :return path of saved file.
+        """
+        path = pathlib.Path(save_path or '.') / f'{pathlib.Path(self.analysis.file).stem}_vad.wav'
+        logger.info(f"Save result signal in {path}")
+        fades = np.append(crossfade_lengths(self.segments, int(round(crossfade * self.analysis.sample_rate))), 0)
+        with sf.SoundFile(self.analysis.file) as source, \
+                sf.SoundFile(str(path), 'w', samplerate=self.analysis.sample_rate, channels=1) as target:
+
+            def read(length):
+                return source.read(length, dtype='float64', always_2d=True).mean(axis=1)
+
+            head, tail = 0, None
+            for (start, end), fade in zip(self.segments, fades):
+                source.seek(start)
+                if head:
+                    target.write(mix_crossfade(tail, read(head)))
+                for position in range(start + head, end - fade, chunk_size):
+                    target.write(read(min(chunk_size, end - fade - position)))
+                head, tail = fade, read(fade)
+        return path
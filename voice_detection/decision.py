@@ -0,0 +1,209 @@
+"""This module provides the speech/silence decision rules shared by the offline and streaming detectors"""
+from collections import deque, namedtuple
+
+import numpy as np
+
+import utils.kernels as kernels
+
+HANGOVER_FRAMES = 7
+
+DESCRIPTORS = ('short_term_energy', 'zero_crossing_rate', 'spectral_flatness', 'spectral_rolloff')
+
+Thresholds = namedtuple('Thresholds', ['energy', 'zerocrossing', 'flatness', 'rolloff'])
+Thresholds.__new__.__defaults__ = (5 * 10 ** -6, 0.9, 0.12, 0.7)
+
+
+def speech_condition(deltas, thresholds):
+    """Check every frame against the descriptor thresholds
+
+    :param deltas: array of descriptor deviations from the baseline means, first axis ordered as DESCRIPTORS;
+    :param thresholds: Thresholds tuple;
+    :return bool numpy array, True where all four descriptors look like speech.
+    """
+    energy, zerocross, flatness, rolloff = deltas
+    return (flatness <= thresholds.flatness) & \
+           (energy >= thresholds.energy) & \
+           (rolloff <= thresholds.rolloff) & \
+           (zerocross <= thresholds.zerocrossing)
+
+
+def impact_mask(deltas, thresholds):
+    """Pack the decision of every descriptor into one byte per frame
+
+    Bit i is set when descriptor i of DESCRIPTORS looks like speech. Zero crossing rate has to be strictly below its
+    threshold here, as in the impacts VAD always reported.
+
+    :param deltas: numpy array of descriptor deviations from the baseline means (4, num_frames);
+    :param thresholds: Thresholds tuple;
+    :return uint8 numpy array (num_frames,).
+    """
+    energy, zerocross, flatness, rolloff = deltas
+    mask = (energy >= thresholds.energy).astype(np.uint8)
+    mask |= (zerocross < thresholds.zerocrossing).astype(np.uint8) << 1
+    mask |= (flatness <= thresholds.flatness).astype(np.uint8) << 2
+    mask |= (rolloff <= thresholds.rolloff).astype(np.uint8) << 3
+    return mask
+
+
+def unpack_impacts(mask):
+    """Unpack impact_mask() into one 0/1 row per descriptor
+
+    :param mask: uint8 numpy array of packed impacts (num_frames,);
+    :return uint8 numpy array (4, num_frames), rows ordered as DESCRIPTORS.
+    """
+    return (mask[None, :] >> np.arange(len(DESCRIPTORS), dtype=np.uint8)[:, None]) & 1
+
+
+def hangover(condition, frames=HANGOVER_FRAMES):
+    """Apply the speech hangover of VAD.__voice_indexes to frame conditions
+
+    A frame is marked as speech when one of the next ``frames`` frames closes a run of at least ``frames``
+    consecutive speech conditions. Works along the last axis, so a stack of conditions is processed at once.
+
+    :param condition: bool numpy array of frame conditions (..., num_frames);
+    :param frames: hangover length (default: 7);
+    :return bool numpy array of speech detection with the same shape.
+    """
+    condition = np.asarray(condition, dtype=bool)
+    num_frames = condition.shape[-1]
+    index = np.arange(num_frames)
+    last_silence = np.maximum.accumulate(np.where(condition, -1, index), axis=-1)
+    marks = (index - last_silence) >= frames
+    # the original loop slices detection[i - frames:i], which is empty for the first frames
+    marks[..., :frames] = False
+
+    cumulative = np.concatenate([np.zeros(condition.shape[:-1] + (1,), dtype=int), np.cumsum(marks, axis=-1)],
+                                axis=-1)
+    upper = np.minimum(index + frames, num_frames - 1) + 1
+    return (cumulative[..., upper] - cumulative[..., index + 1]) > 0
+
+
+def detect_speech(deltas, thresholds, frames=HANGOVER_FRAMES):
+    """Decide speech for every frame: speech_condition() followed by hangover()
+
+    Runs as one compiled loop when numba is available.
+
+    :param deltas: numpy array of descriptor deviations from the baseline means (4, num_frames);
+    :param thresholds: Thresholds tuple;
+    :param frames: hangover length (default: 7);
+    :return bool numpy array of speech detection (num_frames,).
+    """
+    detection = kernels.speech_detection(deltas, thresholds, frames)
+    if detection is None:
+        detection = hangover(speech_condition(deltas, thresholds), frames)
+    return detection
+
+
+class Hangover:
+    """Incremental version of hangover() that keeps only the last ``frames`` marks"""
+
+    def __init__(self, frames=HANGOVER_FRAMES):
+        """Initialize state
+
+        :param frames: hangover length (default: 7).
+        """
+        self.frames = frames
+        self.index = 0
+        self.run = 0
+        self.marks = deque(maxlen=frames)
+
+    def push(self, condition):
+        """Add one frame condition
+
+        :param condition: True if the frame looks like speech;
+        :return final decision of frame ``index - frames`` or None while it is not known yet.
+        """
+        self.run = self.run + 1 if condition else 0
+        self.marks.append(self.run >= self.frames and self.index >= self.frames)
+        self.index += 1
+        if self.index > self.frames:
+            return any(self.marks)
+        return None
+
+    def push_many(self, conditions):
+        """Add a block of frame conditions at once, equivalent to calling push() for each of them
+
+        :param conditions: bool numpy array of frame conditions;
+        :return bool numpy array of final decisions of the frames that became known.
+        """
+        conditions = np.asarray(conditions, dtype=bool)
+        count = len(conditions)
+        start = self.index
+        index = np.arange(count)
+        last_silence = np.maximum.accumulate(np.where(conditions, -1, index)) if count else index
+        run = np.where(last_silence < 0, self.run + index + 1, index - last_silence)
+        marks = np.concatenate([np.array(self.marks, dtype=bool),
+                                (run >= self.frames) & (start + index >= self.frames)])
+        offset = start - len(self.marks)
+
+        self.index += count
+        if count:
+            self.run = int(run[-1])
+        self.marks.extend(marks[-self.frames:].tolist())
+
+        decided = np.arange(max(start - self.frames, 0), max(self.index - self.frames, 0))
+        cumulative = np.concatenate([[0], np.cumsum(marks)])
+        return (cumulative[decided + self.frames - offset + 1] - cumulative[decided + 1 - offset]) > 0
+
+    def flush(self):
+        """Finish the stream
+
+        :return list of final decisions of the frames that were still pending.
+        """
+        marks = list(self.marks)
+        pending = min(self.index, self.frames)
+        decisions = [any(marks[len(marks) - pending + k + 1:]) for k in range(pending)]
+        self.marks.clear()
+        return decisions
+
+
+class SegmentCollector:
+    """Collect speech segments from final frame decisions
+
+    Segments are measured in hops: hop k belongs to speech when frame k + 1 is speech, which gives the same samples
+    VAD joins between consecutive speech indexes.
+    """
+
+    def __init__(self):
+        """Initialize state"""
+        self.decided = 0
+        self.in_speech = False
+        self.start = 0
+        self.segments = []
+
+    def push(self, decisions):
+        """Add final decisions of the next frames
+
+        :param decisions: bool numpy array of frame decisions.
+        """
+        decisions = np.asarray(decisions, dtype=bool)
+        previous = np.concatenate([[self.in_speech], decisions])
+        for change in np.flatnonzero(previous[1:] != previous[:-1]):
+            hop = max(self.decided + change - 1, 0)
+            if decisions[change]:
+                self.start = hop
+            else:
+                self.segments.append((self.start, hop))
+        self.in_speech = bool(previous[-1])
+        self.decided += len(decisions)
+
+    def close(self):
+        """Finish the last segment
+
+        :return numpy array of (start, end) hop indexes of shape (num_segments, 2).
+        """
+        if self.in_speech:
+            self.segments.append((self.start, max(self.decided - 1, 0)))
+            self.in_speech = False
+        return np.array(self.segments, dtype=np.int64).reshape(-1, 2)
+
+
+def speech_segments(speech_detection):
+    """Find speech segments of a detection mask
+
+    :param speech_detection: bool numpy array of frame decisions;
+    :return numpy array of (start, end) hop indexes of shape (num_segments, 2), see SegmentCollector.
+    """
+    collector = SegmentCollector()
+    collector.push(speech_detection)
+    return collector.close()
@@ -0,0 +1,211 @@
+"""This module provides batched voice activity detection of every channel of stereo and multi-microphone recordings"""
+import pathlib
+from functools import cached_property
+
+import numpy as np
+from loguru import logger
+
+import utils.audio_operations as audio_operations
+import utils.descriptors as speech_descriptors
+import utils.kernels as kernels
+from utils.denoise import SpectralGate
+from voice_detection.analysis import Detection, SpeechAnalysis
+from voice_detection.decision import DESCRIPTORS, Thresholds, hangover, speech_condition
+
+
+class MultiChannelAnalysis:
+    """Audio file whose channels are analysed separately in one batched pass
+
+    The file is decoded and resampled once into a (channels, samples) array. Framing, descriptors, baseline means and
+    the decision work on the stacked channels at once, only noise reduction runs channel by channel, as every
+    channel has its own noise. Every channel gets its own baseline from its first N_frames frames, so a quiet
+    microphone is not judged by the noise of a loud one.
+
+    Per channel results are SpeechAnalysis objects of ``channels`` that share the batched arrays, so thresholds of
+    one channel can still be tuned with its own ``detect``.
+    """
+
+    def __init__(self, file, frame_length=0.03, frame_overlap=0.015, N_frames=31, n_fft=None, denoise='noisereduce',
+                 gate=None, noise_key=None, dtype=np.float64, sample_rate=22050):
+        """Initialize main params
+
+        :param file: name of audio file with path;
+        :param frame_length: length of each frame (default = 0.03);
+        :param frame_overlap: duration of frames overlap (default = 0.015);
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz);
+        :param denoise: 'noisereduce', 'gate' or None, as in SpeechAnalysis (default: 'noisereduce');
+        :param gate: SpectralGate object whose cached noise profiles are reused, keyed by (noise_key, channel)
+            (default: new gate);
+        :param noise_key: key of noise profiles in gate (default: file);
+        :param dtype: float dtype of signal, frames and descriptors (default: float64);
+        :param sample_rate: sample rate the signal is resampled to, 'native' keeps the sample rate of file
+            (default: 22050).
+        """
+        if denoise not in ('noisereduce', 'gate', None):
+            raise ValueError(f"Unknown denoise method {denoise}")
+        self.file = file
+        self.frame_length = frame_length
+        self.frame_overlap = frame_overlap
+        self.n_frames = N_frames
+        self.n_fft = n_fft
+        self.denoise = denoise
+        self.gate = gate if gate is not None else SpectralGate()
+        self.noise_key = noise_key if noise_key is not None else file
+        self.dtype = np.dtype(dtype)
+        self.target_rate = None if sample_rate == 'native' else sample_rate
+
+    @cached_property
+    def _audio(self):
+        """Load all channels of audio signal, denoise every channel with noisereduce if required"""
+        logger.info(f"Load {self.file}")
+        signal, sample_rate = audio_operations.load(self.file, self.target_rate, mono=False)
+        if self.denoise == 'noisereduce':
+            import noisereduce as nr
+            signal = np.stack([nr.reduce_noise(channel, channel[:-1]) for channel in signal])
+        return signal.astype(self.dtype, copy=False), sample_rate
+
+    @property
+    def sample_rate(self):
+        """Sample rate of audio signal"""
+        return self._audio[1]
+
+    @property
+    def fft_size(self):
+        """FFT size of spectral descriptors, n_fft or the size adapted to sample rate"""
+        return self.n_fft or speech_descriptors.fft_size(self.sample_rate)
+
+    @property
+    def num_channels(self):
+        """Number of channels"""
+        return self._audio[0].shape[0]
+
+    @cached_property
+    def framed_signal(self):
+        """Windowed frames of every channel (channels, num_frames, frame_length)"""
+        framed_signal = audio_operations.framing_signal(self._audio[0], self.sample_rate,
+                                                        frame_length=self.frame_length,
+                                                        frame_overlap=self.frame_overlap, dtype=self.dtype)
+        if self.denoise == 'gate':
+            logger.info("Apply spectral gate")
+            framed_signal = np.stack([self.gate.gate_frames(frames, key=(self.noise_key, channel),
+                                                            n_frames=self.n_frames, sample_rate=self.sample_rate)
+                                      for channel, frames in enumerate(framed_signal)])
+        return framed_signal
+
+    @cached_property
+    def signal(self):
+        """Denoised audio signal of every channel (channels, samples)"""
+        if self.denoise != 'gate':
+            return self._audio[0]
+        frame_step = int(round(self.frame_overlap * self.sample_rate))
+        window = np.blackman(self.framed_signal.shape[-1])
+        return audio_operations.overlap_add(self.framed_signal, frame_step, window,
+                                            signal_length=self._audio[0].shape[1])
+
+    @cached_property
+    def descriptors(self):
+        """Normalized descriptors of every channel (channels, 4, num_frames) ordered as decision.DESCRIPTORS
+
+        Frames of all channels are passed to the descriptor functions as one (channels * num_frames) batch,
+        normalization is done per channel.
+        """
+        channels, num_frames, frame_length = self.framed_signal.shape
+        frames = self.framed_signal.reshape(channels * num_frames, frame_length)
+        logger.info(f"Calculate speech descriptors of {channels} channels")
+        energy, zero_crossings = kernels.energy_zero_crossings(frames)
+        spectral = speech_descriptors.spectral_descriptors(frames, self.sample_rate, nfft=self.fft_size)
+
+        energy = energy.reshape(channels, num_frames)
+        # the norm of every channel on its own, np.linalg.norm(axis=-1) sums in another order than SpeechAnalysis
+        energy = energy / np.array([np.linalg.norm(values) for values in energy])[:, None]
+        raw = (energy, zero_crossings, spectral['flatness'], spectral['rolloff'])
+        descriptors = np.stack([audio_operations.normalize(values.reshape(channels, num_frames), axis=-1)
+                                for values in raw], axis=1)
+        return descriptors.astype(self.dtype, copy=False)
+
+    @cached_property
+    def means(self):
+        """Mean value of each descriptor over the first N_frames frames of every channel (channels, 4)"""
+        return np.mean(self.descriptors[..., :self.n_frames], axis=-1)
+
+    @cached_property
+    def deltas(self):
+        """Deviation of each descriptor from its channel mean value (channels, 4, num_frames)"""
+        return self.descriptors - self.means[..., None]
+
+    @cached_property
+    def channels(self):
+        """SpeechAnalysis object of every channel, filled with the batched arrays"""
+        analyses = []
+        for channel in range(self.num_channels):
+            analysis = SpeechAnalysis(self.file, self.frame_length, self.frame_overlap, self.n_frames, self.n_fft,
+                                      denoise=self.denoise, gate=self.gate, noise_key=self.noise_key,
+                                      dtype=self.dtype, channel=channel, sample_rate=self.target_rate or 'native')
+            # values of cached properties live in the instance dict, so the channel never calculates them again
+            analysis.__dict__.update(_cached=None, _audio=(self._audio[0][channel], self.sample_rate),
+                                     signal=self.signal[channel], framed_signal=self.framed_signal[channel],
+                                     descriptors=self.descriptors[channel], means=self.means[channel],
+                                     deltas=self.deltas[channel])
+            analysis.__dict__.update(zip(DESCRIPTORS, self.descriptors[channel]))
+            analyses.append(analysis)
+        return analyses
+
+    def detect(self, energy_threshold=5 * 10 ** -6, flatness_threshold=0.12, zerocrossing_threshold=0.9,
+               rolloff_threshold=0.7):
+        """Detect speech frames of all channels with given thresholds
+
+        :param energy_threshold: threshold of short term energy (default: 5 * 10 ** -6);
+        :param flatness_threshold: threshold of spectral flatness (default: 0.12);
+        :param zerocrossing_threshold: threshold of zero crossing rate (default: 0.9);
+        :param rolloff_threshold: threshold of spectral rolloff (default: 0.7);
+        :return MultiChannelDetection object.
+        """
+        thresholds = Thresholds(energy_threshold, zerocrossing_threshold, flatness_threshold, rolloff_threshold)
+        return MultiChannelDetection(self, thresholds)
+
+
+class MultiChannelDetection:
+    """Result of thresholding speech descriptors of MultiChannelAnalysis"""
+
+    def __init__(self, analysis, thresholds):
+        """Calculate speech detection of all channels at once
+
+        :param analysis: MultiChannelAnalysis object;
+        :param thresholds: Thresholds tuple.
+        """
+        self.analysis = analysis
+        self.thresholds = thresholds
+        # descriptors first, so speech_condition unpacks (channels, num_frames) arrays
+        self.speech_detection = hangover(speech_condition(np.moveaxis(analysis.deltas, 1, 0), thresholds))
+        self.channels = [Detection(channel, thresholds, speech_detection=detection)
+                         for channel, detection in zip(analysis.channels, self.speech_detection)]
+
+    @property
+    def segments(self):
+        """Speech segments of every channel, list of numpy arrays of (start, end) samples"""
+        return [detection.segments for detection in self.channels]
+
+    @property
+    def segments_seconds(self):
+        """Speech segments of every channel, list of numpy arrays of (start, end) seconds"""
+        return [detection.segments_seconds for detection in self.channels]
+
+    def export_segments(self, path, segment_format=None):
+        """Write speech segments of every channel to its own JSON, CSV or RTTM file
+
+        :param path: path of result file, channel number is added to its name as ``_ch{channel}``;
+        :param segment_format: 'json', 'csv' or 'rttm' (default: suffix of path);
+        :return list of paths of result files.
+        """
+        path = pathlib.Path(path)
+        return [detection.export_segments(path.with_name(f'{path.stem}_ch{channel}{path.suffix}'), segment_format)
+                for channel, detection in enumerate(self.channels)]
+
+    def save(self, save_path=None):
+        """Save speech signal of every channel to its own WAV file
+
+        :param save_path: path to save cut audio files (default: current dir);
+        :return list of paths of saved files, None for files that could not be saved.
+        """
+        return [detection.save(save_path) for detection in self.channels]
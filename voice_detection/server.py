@@ -0,0 +1,475 @@
+"""This module provides local HTTP service mode with pre-warmed worker processes
+
+Usage: python -m voice_detection.server [--host 127.0.0.1] [--port 8765] [--workers N] [--queue-size 64]
+
+Endpoints:
+    POST /segments  audio file or raw PCM in body -> JSON speech segments, the layout of JSON segments files;
+    POST /trim      audio file or raw PCM in body -> WAV file with speech only;
+    POST /stream    chunked raw PCM in body -> chunked JSON lines of speech events as soon as they are decided;
+    GET  /health    state of the service.
+
+The query string holds SpeechAnalysis and detect() params, e.g. ``/segments?denoise=gate&rolloff_threshold=0.94``.
+A body is raw PCM when ``sample_rate`` is given in the query, its sample format is set by ``pcm`` (s16le or f32le,
+default: s16le). Otherwise the body is an audio file of any format soundfile reads. ``target_rate`` sets the sample
+rate of analysis, a number or ``native`` (default: 22050).
+
+Analysis runs on a process pool whose workers import everything and compile kernels before the server accepts
+connections. When ``queue_size`` requests are already pending, new ones are refused with 503 at once instead of
+piling up.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+from loguru import logger
+
+from utils.workers import init_worker, process_pool
+
+
+PCM_FORMATS = {'s16le': '<i2', 'f32le': '<f4'}
+
+ANALYSIS_PARAMS = {'frame_length': float, 'frame_overlap': float, 'N_frames': int, 'n_fft': int}
+
+THRESHOLD_PARAMS = ('energy_threshold', 'flatness_threshold', 'zerocrossing_threshold', 'rolloff_threshold')
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    """Request that can not be served"""
+
+    def __init__(self, status, message):
+        """Initialize error
+
+        :param status: HTTP status code;
+        :param message: description for the client.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class StreamAborted(Exception):
+    """Streamed response failed after its header was sent, the connection was aborted instead of answered"""
+
+
+def parse_params(query, defaults=None):
+    """Read analysis, threshold and PCM params of a request
+
+    :param query: dict of query string values;
+    :param defaults: dict of server wide params (default: none);
+    :return dict of SpeechAnalysis params, 'thresholds' dict of detect() params, 'sample_rate' and 'pcm'.
+    """
+    params = {key: value for key, value in (defaults or {}).items() if key != 'thresholds'}
+    thresholds = dict((defaults or {}).get('thresholds', {}))
+    try:
+        for name, value in query.items():
+            if name in ANALYSIS_PARAMS:
+                params[name] = ANALYSIS_PARAMS[name](value)
+            elif name in THRESHOLD_PARAMS:
+                thresholds[name] = float(value)
+            elif name == 'denoise':
+                params['denoise'] = None if value == 'none' else value
+            elif name == 'sample_rate':
+                params['sample_rate'] = int(value)
+            elif name == 'target_rate':
+                params['target_rate'] = value if value == 'native' else int(value)
+            elif name == 'pcm':
+                if value not in PCM_FORMATS:
+                    raise ValueError(f"unknown PCM format {value}, use one of {tuple(PCM_FORMATS)}")
+                params['pcm'] = value
+            else:
+                raise ValueError(f"unknown param {name}")
+    except ValueError as error:
+        raise HTTPError(400, str(error))
+    if params.get('denoise', 'noisereduce') not in ('noisereduce', 'gate', None):
+        raise HTTPError(400, f"unknown denoise method {params['denoise']}")
+    params['thresholds'] = thresholds
+    return params
+
+
+def decode_pcm(data, pcm='s16le'):
+    """Convert raw little endian PCM bytes to float samples
+
+    :param data: bytes of samples, a whole number of samples;
+    :param pcm: sample format, s16le or f32le (default: s16le);
+    :return numpy array of float32 samples.
+    """
+    samples = np.frombuffer(data, dtype=PCM_FORMATS[pcm])
+    if pcm == 's16le':
+        return samples.astype(np.float32) / 2 ** 15
+    return samples.astype(np.float32)
+
+
+def _audio_file(body, params):
+    """Wrap request body as an audio file object
+
+    :raise ValueError: if soundfile can not decode the body, so the client gets 400 instead of 500.
+    """
+    import soundfile as sf
+
+    sample_rate = params.pop('sample_rate', None)
+    pcm = params.pop('pcm', 's16le')
+    file = io.BytesIO()
+    try:
+        if sample_rate is None:
+            file = io.BytesIO(body)
+            sf.info(file)
+        else:
+            usable = len(body) - len(body) % np.dtype(PCM_FORMATS[pcm]).itemsize
+            sf.write(file, decode_pcm(body[:usable], pcm), sample_rate, format='WAV', subtype='FLOAT')
+    except (RuntimeError, TypeError, EOFError) as error:
+        # soundfile.LibsndfileError is a RuntimeError, its error_string leaves out the address of the file object
+        raise ValueError(f"can not decode audio: {getattr(error, 'error_string', error)}")
+    file.seek(0)
+    return file
+
+
+def analyse(body, params, output='segments'):
+    """Run voice activity detection for one request in a worker process
+
+    :param body: bytes of audio file or raw PCM;
+    :param params: dict of params, see parse_params();
+    :param output: 'segments' for JSON segments, 'trim' for WAV file with speech only (default: 'segments');
+    :return bytes of response body.
+    """
+    import soundfile as sf
+
+    from utils.segments import segments_record
+    from voice_detection.analysis import SpeechAnalysis
+
+    params = dict(params)
+    thresholds = params.pop('thresholds', {})
+    file = _audio_file(body, params)
+    if 'target_rate' in params:
+        # sample_rate of the query is the rate of raw PCM, the analysis rate is target_rate
+        params['sample_rate'] = params.pop('target_rate')
+    analysis = SpeechAnalysis(file, **params)
+    detection = analysis.detect(**thresholds)
+    if output == 'trim':
+        result = io.BytesIO()
+        sf.write(result, detection.speech_signal(), analysis.sample_rate, format='WAV')
+        return result.getvalue()
+    record = segments_record(detection.segments, analysis.sample_rate)
+    record['duration'] = len(analysis.signal) / analysis.sample_rate
+    return json.dumps(record).encode()
+
+
+def _warm_worker(threads, denoise):
+    """Limit threads of a worker process and pay import and compilation cost before the first request"""
+    import soundfile as sf
+
+    init_worker(threads)
+    rng = np.random.default_rng(0)
+    signal = rng.normal(0, 0.01, 22050).astype(np.float32)
+    signal[11025:] += 0.3 * np.sin(2 * np.pi * 150 * np.arange(11025) / 22050).astype(np.float32)
+    file = io.BytesIO()
+    sf.write(file, signal, 22050, format='WAV', subtype='FLOAT')
+    for method in {'gate', denoise}:
+        # a failed initializer breaks the whole pool, a cold worker is only slower
+        try:
+            analyse(file.getvalue(), {'denoise': method})
+        except Exception as error:
+            logger.warning(f"Warm up with denoise={method} failed: {type(error).__name__}: {error}")
+
+
+def _worker_ready():
+    """Report pid of a warm worker"""
+    return os.getpid()
+
+
+class VADServer:
+    """asyncio HTTP server that dispatches voice activity detection to a pool of warm worker processes"""
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, threads=1, queue_size=64, max_body=2 ** 28,
+                 params=None):
+        """Initialize main params
+
+        :param host: interface to listen on (default: 127.0.0.1);
+        :param port: port to listen on, 0 picks a free one (default: 8765);
+        :param workers: number of worker processes (default: number of cpus);
+        :param threads: BLAS/numba threads per worker (default: 1);
+        :param queue_size: maximum number of pending requests, more are refused with 503 (default: 64);
+        :param max_body: maximum size of request body in bytes (default: 256 MB);
+        :param params: dict of default SpeechAnalysis params and 'thresholds' dict of detect() params.
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.threads = threads
+        self.queue_size = queue_size
+        self.max_body = max_body
+        self.params = params or {}
+        self.pending = 0
+        self.served = 0
+        self.refused = 0
+        self.executor = None
+        self.server = None
+        self.connections = {}
+
+    async def start(self):
+        """Start and warm up worker processes, then start listening"""
+        start = time.perf_counter()
+        self.executor = process_pool(self.workers, _warm_worker,
+                                     (self.threads, self.params.get('denoise', 'noisereduce')))
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.executor, _worker_ready)
+                                      for _ in range(self.workers)))
+        logger.info(f"{len(set(pids))} workers warmed up in {time.perf_counter() - start:.1f} s")
+
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        """Start server and serve until cancelled"""
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop listening, drop idle connections and shut worker processes down"""
+        if self.server is not None:
+            self.server.close()
+            tasks = list(self.connections.values())
+            for writer in list(self.connections):
+                writer.close()
+            # closed transports wake idle handlers up with end of stream
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def _handle(self, reader, writer):
+        """Serve requests of one keep-alive connection"""
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, b'malformed request line', keep_alive=False)
+                    break
+                headers = await self._read_headers(reader)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    keep_alive = await self._dispatch(method, target, headers, reader, writer) and keep_alive
+                except StreamAborted:
+                    break
+                except HTTPError as error:
+                    # the body may be left unread, so the connection can not be reused
+                    await self._respond(writer, error.status, str(error).encode(), keep_alive=False)
+                    break
+                except Exception as error:
+                    logger.exception(error)
+                    await self._respond(writer, 500, f'{type(error).__name__}: {error}'.encode(), keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader):
+        """Read header lines up to the empty line"""
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _dispatch(self, method, target, headers, reader, writer):
+        """Route request
+
+        :return True if the connection can be reused.
+        """
+        url = urlsplit(target)
+        if url.path == '/health':
+            body = json.dumps({'workers': self.workers, 'pending': self.pending, 'queue_size': self.queue_size,
+                               'served': self.served, 'refused': self.refused}).encode()
+            await self._respond(writer, 200, body, 'application/json')
+            return True
+        if url.path not in ('/segments', '/trim', '/stream'):
+            raise HTTPError(404, f'unknown path {url.path}')
+        if method != 'POST':
+            raise HTTPError(405, f'{url.path} accepts POST only')
+        params = parse_params(dict(parse_qsl(url.query)), self.params)
+
+        if self.pending >= self.queue_size:
+            self.refused += 1
+            await self._respond(writer, 503, b'too many pending requests', keep_alive=False,
+                                extra_headers={'Retry-After': '1'})
+            return False
+        self.pending += 1
+        try:
+            if url.path == '/stream':
+                await self._stream(params, headers, reader, writer)
+            else:
+                body = await self._read_body(headers, reader)
+                output = 'trim' if url.path == '/trim' else 'segments'
+                loop = asyncio.get_running_loop()
+                try:
+                    result = await loop.run_in_executor(self.executor, analyse, body, params, output)
+                except ValueError as error:
+                    # bodies that can not be decoded and params analysis rejects, other errors are ours: 500
+                    raise HTTPError(400, str(error))
+                await self._respond(writer, 200, result, 'audio/wav' if output == 'trim' else 'application/json')
+            self.served += 1
+        finally:
+            self.pending -= 1
+        return True
+
+    async def _read_body(self, headers, reader):
+        """Read whole request body, plain or chunked"""
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks, size = [], 0
+            async for chunk in self._read_chunks(reader):
+                size += len(chunk)
+                if size > self.max_body:
+                    raise HTTPError(413, f'body is larger than {self.max_body} bytes')
+                chunks.append(chunk)
+            return b''.join(chunks)
+        if 'content-length' not in headers:
+            raise HTTPError(411, 'Content-Length or chunked body required')
+        length = self._content_length(headers)
+        if length > self.max_body:
+            raise HTTPError(413, f'body is larger than {self.max_body} bytes')
+        return await reader.readexactly(length)
+
+    @staticmethod
+    def _content_length(headers):
+        """Length of plain request body, 0 without Content-Length"""
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(400, f"invalid Content-Length {headers['content-length']}")
+        return length
+
+    @staticmethod
+    async def _read_chunks(reader):
+        """Yield chunks of chunked request body as they arrive"""
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';')[0].strip() or b'0', 16)
+            except ValueError:
+                raise HTTPError(400, f'invalid chunk size {line[:32]!r}')
+            if size == 0:
+                await VADServer._read_headers(reader)
+                return
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield chunk
+
+    async def _stream(self, params, headers, reader, writer):
+        """Run StreamingVAD over chunked PCM body and answer with speech events as soon as they are decided
+
+        Streaming state lives in this connection, so blocks are processed on a thread instead of the process pool.
+        Once the 200 header is sent, errors can not be answered with another response: the connection is aborted
+        before the last chunk, so the client sees an incomplete body, and StreamAborted is raised.
+        """
+        from voice_detection.stream import StreamingVAD
+
+        if 'sample_rate' not in params:
+            raise HTTPError(400, 'sample_rate is required for streams')
+        pcm = params.get('pcm', 's16le')
+        sample_size = np.dtype(PCM_FORMATS[pcm]).itemsize
+        detector = StreamingVAD(params['sample_rate'],
+                                **{name: params[name] for name in ANALYSIS_PARAMS if name in params},
+                                **params['thresholds'])
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = self._read_chunks(reader)
+        else:
+            chunks = self._body_chunks(reader, self._content_length(headers))
+
+        loop = asyncio.get_running_loop()
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n')
+        try:
+            rest = b''
+            async for chunk in chunks:
+                data = rest + chunk
+                usable = len(data) - len(data) % sample_size
+                rest = data[usable:]
+                events = await loop.run_in_executor(None, detector.process, decode_pcm(data[:usable], pcm))
+                await self._write_events(writer, events)
+            await self._write_events(writer, detector.flush())
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        except Exception as error:
+            if not isinstance(error, (ConnectionError, asyncio.IncompleteReadError)):
+                logger.exception(error)
+            writer.transport.abort()
+            raise StreamAborted(str(error)) from error
+
+    @staticmethod
+    async def _body_chunks(reader, length, size=2 ** 16):
+        """Yield plain request body in pieces"""
+        while length > 0:
+            chunk = await reader.read(min(size, length))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', length)
+            length -= len(chunk)
+            yield chunk
+
+    @staticmethod
+    async def _write_events(writer, events):
+        """Write speech events as one chunk of JSON lines"""
+        if events:
+            data = ''.join(json.dumps(event._asdict()) + '\n' for event in events).encode()
+            writer.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            await writer.drain()
+
+    @staticmethod
+    async def _respond(writer, status, body, content_type='text/plain', keep_alive=True, extra_headers=None):
+        """Write complete response"""
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body)),
+                   'Connection': 'keep-alive' if keep_alive else 'close', **(extra_headers or {})}
+        head = f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n' + \
+               ''.join(f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Local voice activity detection service')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all cpus)')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='BLAS/numba threads per worker (default: 1)')
+    parser.add_argument('--queue-size', type=int, default=64, help='pending requests before 503 (default: 64)')
+    parser.add_argument('--max-body', type=int, default=2 ** 28, help='maximum body size in bytes (default: 256 MB)')
+    parser.add_argument('--denoise', choices=('noisereduce', 'gate', 'none'), default='noisereduce')
+    args = parser.parse_args(argv)
+
+    server = VADServer(args.host, args.port, workers=args.workers, threads=args.threads, queue_size=args.queue_size,
+                       max_body=args.max_body, params={'denoise': None if args.denoise == 'none' else args.denoise})
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
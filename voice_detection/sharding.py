@@ -0,0 +1,178 @@
+"""This module provides analysis of one long recording split into shards that are processed in parallel
+
+Every descriptor of a frame depends on that frame only, so shards of consecutive frames are analysed independently on
+a thread or process pool, and raw descriptors are merged in order. Everything that depends on the whole file runs
+after the merge, exactly as in SpeechAnalysis: normalization by the minimum and maximum of every descriptor, the
+baseline of the first N_frames frames and the speech decision, whose hangover sees runs of speech frames that cross
+shard boundaries as one run. The result is the same as of a single pass, only the per-frame work is spread over
+cores.
+"""
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import cached_property
+
+import numpy as np
+from loguru import logger
+
+import utils.audio_operations as audio_operations
+import utils.descriptors as speech_descriptors
+import utils.kernels as kernels
+from utils.workers import process_pool
+from voice_detection.analysis import SpeechAnalysis
+
+# shards smaller than this cost more in scheduling than they win in parallelism
+MIN_SHARD_FRAMES = 2048
+
+
+def shard_bounds(num_frames, shards, min_frames=MIN_SHARD_FRAMES):
+    """Split frames into contiguous shards of nearly equal size
+
+    :param num_frames: number of frames;
+    :param shards: wanted number of shards;
+    :param min_frames: minimal number of frames of a shard (default: MIN_SHARD_FRAMES);
+    :return numpy array of (start, stop) frames of shape (num_shards, 2).
+    """
+    shards = max(1, min(shards, num_frames // max(min_frames, 1)))
+    edges = np.linspace(0, num_frames, shards + 1).astype(np.int64)
+    return np.stack([edges[:-1], edges[1:]], axis=1)
+
+
+def analyse_shard(signal, sample_rate, num_frames, skip, params):
+    """Calculate raw descriptors of the frames of one shard
+
+    With the spectral gate the shard also rebuilds its part of the gated signal. Samples near the start of a shard
+    are covered by frames of the previous shard too, so the shard frames ``skip`` more frames before its first one,
+    and overlap-add sums for its own samples the same terms as over the whole signal.
+
+    :param signal: samples from the start of the first framed frame to the end of the last one;
+    :param sample_rate: sample rate of audio signal;
+    :param num_frames: number of framed frames, including skipped ones;
+    :param skip: number of leading frames that belong to the previous shard;
+    :param params: dict of frame_length, frame_overlap, n_fft, dtype, gate and noise_key;
+    :return tuple of raw energy, zero crossing rate, flatness and rolloff of the shard frames and gated samples from
+        the first shard frame on, or None without the gate.
+    """
+    framed_signal = audio_operations.framing_signal(signal, sample_rate, frame_length=params['frame_length'],
+                                                    frame_overlap=params['frame_overlap'], dtype=params['dtype'],
+                                                    num_frames=num_frames)
+    gated = None
+    if params['gate'] is not None:
+        framed_signal = params['gate'].gate_frames(framed_signal, key=params['noise_key'], sample_rate=sample_rate)
+        frame_step = int(round(params['frame_overlap'] * sample_rate))
+        gated = audio_operations.overlap_add(framed_signal, frame_step, np.blackman(framed_signal.shape[1]))
+        gated = gated[skip * frame_step:]
+        framed_signal = framed_signal[skip:]
+    energy, zero_crossings = kernels.energy_zero_crossings(framed_signal)
+    spectral = speech_descriptors.spectral_descriptors(framed_signal, sample_rate, nfft=params['n_fft'])
+    return energy, zero_crossings, spectral['flatness'], spectral['rolloff'], gated
+
+
+class ShardedAnalysis(SpeechAnalysis):
+    """SpeechAnalysis whose per-frame work is split into shards processed in parallel
+
+    The signal is loaded and denoised with noisereduce, which needs the whole signal, before it is split. The noise
+    profile of the spectral gate is fitted on the first N_frames frames once and shared by all shards. Descriptors,
+    baseline and detection are the same as of SpeechAnalysis with the same params.
+    """
+
+    def __init__(self, file, frame_length=0.03, frame_overlap=0.015, N_frames=31, n_fft=None, denoise='noisereduce',
+                 gate=None, noise_key=None, cache=None, dtype=np.float64, channel=None, sample_rate=22050, workers=None,
+                 shards=None, executor='thread'):
+        """Initialize main params
+
+        :param file: name of audio file with path;
+        :param frame_length: length of each frame (default = 0.03);
+        :param frame_overlap: duration of frames overlap (default = 0.015);
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz);
+        :param denoise: 'noisereduce', 'gate' or None, as in SpeechAnalysis (default: 'noisereduce');
+        :param gate: SpectralGate object whose cached noise profiles are reused (default: new gate);
+        :param noise_key: key of noise profile in gate (default: file);
+        :param cache: DescriptorCache object or cache folder (default: no cache);
+        :param dtype: float dtype of signal, frames and descriptors (default: float64);
+        :param channel: index of channel to analyse, None averages channels (default: None);
+        :param sample_rate: sample rate the signal is resampled to, 'native' keeps the sample rate of file
+            (default: 22050);
+        :param workers: number of parallel workers (default: number of cpus);
+        :param shards: number of shards, a few per worker even out their speed (default: 2 per worker);
+        :param executor: 'thread', 'process' or a concurrent.futures.Executor to run shards on, threads share the
+            signal without copies (default: 'thread').
+        """
+        super().__init__(file, frame_length=frame_length, frame_overlap=frame_overlap, N_frames=N_frames,
+                         n_fft=n_fft, denoise=denoise, gate=gate, noise_key=noise_key, cache=cache, dtype=dtype,
+                         channel=channel, sample_rate=sample_rate)
+        if not isinstance(executor, Executor) and executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor {executor}")
+        self.workers = workers or os.cpu_count()
+        self.shards = shards or 2 * self.workers
+        self.executor = executor
+
+    def _map(self, function, *iterables):
+        """Run function over shards on the executor, results are in the order of shards"""
+        if isinstance(self.executor, Executor):
+            return list(self.executor.map(function, *iterables))
+        if self.executor == 'thread':
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return list(executor.map(function, *iterables))
+        # every process gets one BLAS thread, the processes are the parallelism
+        with process_pool(self.workers) as executor:
+            return list(executor.map(function, *iterables))
+
+    @cached_property
+    def _shards(self):
+        """Raw descriptors and gated signal merged from all shards"""
+        signal = self._audio[0]
+        frame_length = int(round(self.frame_length * self.sample_rate))
+        frame_step = int(round(self.frame_overlap * self.sample_rate))
+        num_frames = audio_operations.frame_count(len(signal), self.sample_rate, self.frame_length,
+                                                  self.frame_overlap)
+        bounds = shard_bounds(num_frames, self.shards)
+
+        gate = None
+        # samples of a frame start are also covered by this many previous frames
+        overlap = 0
+        if self.denoise == 'gate':
+            gate = self.gate
+            overlap = -(-frame_length // frame_step) - 1
+            if gate.profile_key(self.noise_key, frame_length, self.sample_rate) not in gate.profiles:
+                # fit the profile the way gate_frames does for the whole signal, before the gate is shared
+                first_frames = audio_operations.framing_signal(signal, self.sample_rate, self.frame_length,
+                                                               self.frame_overlap, dtype=self.dtype,
+                                                               num_frames=min(self.n_frames, num_frames))
+                gate.gate_frames(first_frames, key=self.noise_key, n_frames=self.n_frames,
+                                 sample_rate=self.sample_rate)
+
+        firsts = np.maximum(bounds[:, 0] - overlap, 0)
+        slices = [signal[first * frame_step:(stop - 1) * frame_step + frame_length]
+                  for first, (_, stop) in zip(firsts, bounds)]
+        params = {'frame_length': self.frame_length, 'frame_overlap': self.frame_overlap, 'n_fft': self.fft_size,
+                  'dtype': self.dtype, 'gate': gate, 'noise_key': self.noise_key}
+        logger.info(f"Analyse {num_frames} frames in {len(bounds)} shards on {self.workers} {self.executor} workers")
+        results = self._map(analyse_shard, slices, [self.sample_rate] * len(bounds), bounds[:, 1] - firsts,
+                            bounds[:, 0] - firsts, [params] * len(bounds))
+
+        merged = {name: np.concatenate([result[index] for result in results])
+                  for index, name in enumerate(('energy', 'zero_crossings', 'flatness', 'rolloff'))}
+        if gate is not None:
+            # every shard owns the samples from its first frame to the first frame of the next shard
+            parts = [result[4][:(stop - start) * frame_step] for result, (start, stop) in zip(results[:-1], bounds)]
+            gated = np.concatenate(parts + [results[-1][4]])[:len(signal)]
+            merged['signal'] = np.concatenate([gated, np.zeros(len(signal) - len(gated), dtype=gated.dtype)])
+        return merged
+
+    @cached_property
+    def signal(self):
+        """Denoised audio signal, rebuilt from gated frames of the shards with the spectral gate"""
+        if self.denoise != 'gate' or self._cached is not None:
+            return SpeechAnalysis.signal.func(self)
+        return self._shards['signal']
+
+    @cached_property
+    def _time_domain(self):
+        """Raw short term energy and zero crossing rate merged from shards"""
+        return self._shards['energy'], self._shards['zero_crossings']
+
+    @cached_property
+    def _spectral(self):
+        """Raw spectral flatness and rolloff merged from shards"""
+        return {'flatness': self._shards['flatness'], 'rolloff': self._shards['rolloff']}
@@ -0,0 +1,196 @@
+"""This module provides voice activity detector for live audio streams"""
+from collections import namedtuple
+
+import numpy as np
+
+import utils.descriptors as speech_descriptors
+from voice_detection.decision import HANGOVER_FRAMES, Hangover, Thresholds, speech_condition
+
+SpeechEvent = namedtuple('SpeechEvent', ['kind', 'sample', 'time'])
+
+
+class StreamingVAD:
+    """Voice activity detector that works on blocks of PCM audio of any size
+
+    Descriptors are calculated frame by frame as soon as a frame is complete. The baseline means are taken from
+    the first ``N_frames`` frames, and every descriptor is scaled by its running range instead of the range of the
+    whole file, which is the only difference from ``VAD``.
+
+    Algorithmic latency: a hop of audio is released ``HANGOVER_FRAMES * hop + frame`` samples after it was pushed
+    (135 ms with default params). The first ``N_frames`` frames are held back until the baseline is known, so the
+    very first decision comes after ``(N_frames - 1) * hop + frame`` samples. Besides the pushed block, memory is
+    bounded by ``N_frames`` descriptor values and ``N_frames`` hops of audio, whatever the length of the stream.
+
+    Speech samples of ``trim`` are always joined with hard cuts, VAD and BlockAnalysis can crossfade theirs: a
+    crossfade would hold back the end of every segment until the next segment starts, which may be any time later.
+    """
+
+    def __init__(self, sample_rate, frame_length=0.03, frame_overlap=0.015, energy_threshold=5 * 10 ** -6,
+                 flatness_threshold=0.12, zerocrossing_threshold=0.9, rolloff_threshold=0.7, N_frames=31,
+                 n_fft=None):
+        """Initialize main params
+
+        :param sample_rate: sample rate of incoming audio;
+        :param frame_length: length of each frame (default = 0.03);
+        :param frame_overlap: duration of frames overlap (default = 0.015);
+        :param energy_threshold: threshold of short term energy (default: 5 * 10 ** -6);
+        :param flatness_threshold: threshold of spectral flatness (default: 0.12);
+        :param zerocrossing_threshold: threshold of zero crossing rate (default: 0.9);
+        :param rolloff_threshold: threshold of spectral rolloff (default: 0.7);
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz).
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = int(round(frame_length * sample_rate))
+        self.hop = int(round(frame_overlap * sample_rate))
+        self.thresholds = Thresholds(energy_threshold, zerocrossing_threshold, flatness_threshold, rolloff_threshold)
+        self.n_frames = N_frames
+        self.n_fft = n_fft or speech_descriptors.fft_size(sample_rate)
+        self.window = np.blackman(self.frame_size)
+        self.reset()
+
+    @property
+    def latency(self):
+        """Algorithmic latency in seconds once the baseline is estimated"""
+        return (HANGOVER_FRAMES * self.hop + self.frame_size) / self.sample_rate
+
+    def reset(self):
+        """Forget the stream and start again"""
+        self.buffer = np.zeros(0)
+        self.frame_index = 0
+        self.hangover = Hangover()
+        self.baseline = []
+        self.means = None
+        self.minimum = np.full(4, np.inf)
+        self.maximum = np.full(4, -np.inf)
+        self.audio = np.zeros(0)
+        self.audio_start = 0
+        self.decided = 0
+        self.in_speech = False
+
+    def process(self, block):
+        """Push a block of audio and get speech boundaries decided meanwhile
+
+        :param block: 1D numpy array of float or integer PCM samples;
+        :return list of SpeechEvent('start' | 'end', sample, time).
+        """
+        return self.__events(self.__feed(block))
+
+    def trim(self, block):
+        """Push a block of audio and get speech samples decided meanwhile
+
+        :param block: 1D numpy array of float or integer PCM samples;
+        :return numpy array of speech samples.
+        """
+        return self.__chunks(self.__feed(block))
+
+    def flush(self, chunks=False):
+        """Finish the stream, samples that do not fill a frame are dropped like framing_signal does
+
+        :param chunks: if True return remaining speech samples instead of events;
+        :return list of SpeechEvent or numpy array of speech samples.
+        """
+        decisions = []
+        if self.frame_index == 0 and len(self.buffer):
+            self.buffer = np.append(self.buffer, np.zeros(self.frame_size - len(self.buffer)))
+            decisions.extend(self.__decide(self.__frames()))
+        if self.means is None and self.baseline:
+            decisions.extend(self.__release_baseline())
+        decisions.extend(self.hangover.flush())
+        decisions.append(False)
+        result = self.__chunks(decisions) if chunks else self.__events(decisions)
+        self.reset()
+        return result
+
+    def __feed(self, block):
+        """Frame new samples and return final decisions"""
+        block = np.asarray(block)
+        if np.issubdtype(block.dtype, np.integer):
+            block = block / float(np.iinfo(block.dtype).max + 1)
+        block = block.astype(np.float64, copy=False).ravel()
+
+        self.audio = np.append(self.audio, block)
+        self.buffer = np.append(self.buffer, block)
+        return self.__decide(self.__frames())
+
+    def __frames(self):
+        """Cut complete frames from buffer"""
+        count = 0 if len(self.buffer) < self.frame_size else (len(self.buffer) - self.frame_size) // self.hop + 1
+        if not count:
+            return np.zeros((0, self.frame_size))
+        view = np.lib.stride_tricks.sliding_window_view(self.buffer, self.frame_size)[::self.hop][:count]
+        frames = view * self.window
+        self.buffer = self.buffer[count * self.hop:]
+        self.frame_index += count
+        return frames
+
+    def __decide(self, frames):
+        """Calculate descriptors of new frames and run them through the hangover"""
+        if not len(frames):
+            return []
+        raw = speech_descriptors.descriptor_matrix(frames, self.sample_rate, nfft=self.n_fft)
+        minimum = np.minimum.accumulate(np.vstack([self.minimum, raw]), axis=0)[1:]
+        maximum = np.maximum.accumulate(np.vstack([self.maximum, raw]), axis=0)[1:]
+
+        decisions = []
+        for values, self.minimum, self.maximum in zip(raw, minimum, maximum):
+            if self.means is None:
+                self.baseline.append(values)
+                if len(self.baseline) == self.n_frames:
+                    decisions.extend(self.__release_baseline())
+                continue
+            decisions.extend(self.__push(values))
+        return decisions
+
+    def __release_baseline(self):
+        """Estimate baseline means and decide held back frames"""
+        baseline = np.array(self.baseline)
+        self.means = baseline.mean(axis=0)
+        self.baseline = []
+        decisions = []
+        for values in baseline:
+            decisions.extend(self.__push(values))
+        return decisions
+
+    def __push(self, values):
+        """Run one frame through the thresholds and the hangover"""
+        scale = self.maximum - self.minimum
+        scale[scale == 0] = 1
+        condition = speech_condition((values - self.means) / scale, self.thresholds)
+        decision = self.hangover.push(bool(condition))
+        return [] if decision is None else [decision]
+
+    def __events(self, decisions):
+        """Turn frame decisions into speech boundaries"""
+        events = []
+        for decision in decisions:
+            if decision != self.in_speech:
+                sample = max(self.decided - 1, 0) * self.hop
+                events.append(SpeechEvent('start' if decision else 'end', sample, sample / self.sample_rate))
+                self.in_speech = decision
+            self.__release_hop()
+        return events
+
+    def __chunks(self, decisions):
+        """Collect hops of audio that belong to speech
+
+        Hop k is speech when frame k + 1 is detected as speech, the same samples VAD joins.
+        """
+        chunks = []
+        for decision in decisions:
+            hop = self.__release_hop()
+            if decision and hop is not None and len(hop):
+                chunks.append(hop)
+            self.in_speech = decision
+        return np.concatenate(chunks) if chunks else np.zeros(0)
+
+    def __release_hop(self):
+        """Drop audio of the previous hop once frame ``decided`` is final"""
+        hop = None
+        if self.decided > 0:
+            start = (self.decided - 1) * self.hop - self.audio_start
+            hop = self.audio[start:start + self.hop]
+            self.audio = self.audio[start + self.hop:]
+            self.audio_start += start + self.hop
+        self.decided += 1
+        return hop
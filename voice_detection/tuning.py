@@ -0,0 +1,190 @@
+"""This module provides automatic tuning of descriptor thresholds against reference speech segments"""
+import itertools
+
+import numpy as np
+from loguru import logger
+
+from utils.segments import load_segments
+from voice_detection.decision import Thresholds, hangover, speech_condition
+
+DEFAULT_GRID = {'energy': [-0.3, -0.1, -0.03, 0, 5 * 10 ** -6, 0.01, 0.03, 0.1],
+                'zerocrossing': [0, 0.2, 0.4, 0.6, 0.8, 0.9, 1.05],
+                'flatness': [0.01, 0.03, 0.06, 0.12, 0.25, 0.5, 1, 2.2],
+                'rolloff': [0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.94, 1]}
+
+DEFAULT_BOUNDS = {'energy': (-0.3, 0.1),
+                  'zerocrossing': (0, 1.1),
+                  'flatness': (0, 2.5),
+                  'rolloff': (0.1, 1)}
+
+VAD_PARAMS = {'energy': 'energy_threshold',
+              'zerocrossing': 'zerocrossing_threshold',
+              'flatness': 'flatness_threshold',
+              'rolloff': 'rolloff_threshold'}
+
+
+def threshold_grid(grid=None):
+    """Build every combination of threshold values
+
+    :param grid: dict of threshold name -> values, names as in Thresholds (default: DEFAULT_GRID);
+    :return numpy array of shape (combinations, 4), columns ordered as Thresholds.
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    return np.array(list(itertools.product(*(grid[name] for name in Thresholds._fields))), dtype=np.float64)
+
+
+def random_thresholds(samples, bounds=None, seed=0):
+    """Draw threshold combinations uniformly
+
+    :param samples: number of combinations;
+    :param bounds: dict of threshold name -> (low, high) (default: DEFAULT_BOUNDS);
+    :param seed: random seed (default: 0);
+    :return numpy array of shape (samples, 4), columns ordered as Thresholds.
+    """
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    rng = np.random.default_rng(seed)
+    low, high = np.array([bounds[name] for name in Thresholds._fields]).T
+    return rng.uniform(low, high, size=(samples, 4))
+
+
+def reference_hops(segments, num_hops, frame_step, sample_rate):
+    """Label every hop of audio with reference segments
+
+    :param segments: numpy array of (start, end) seconds;
+    :param num_hops: number of hops;
+    :param frame_step: hop length in samples;
+    :param sample_rate: sample rate of audio signal;
+    :return bool numpy array, True where the middle of a hop lies inside a segment.
+    """
+    centers = (np.arange(num_hops) + 0.5) * frame_step / sample_rate
+    labels = np.zeros(num_hops, dtype=bool)
+    for start, end in np.asarray(segments, dtype=np.float64).reshape(-1, 2):
+        labels[np.searchsorted(centers, start):np.searchsorted(centers, end)] = True
+    return labels
+
+
+def score_detections(detections, labels, metric='f1'):
+    """Score stack of frame detections against hop labels
+
+    Hop k is speech when frame k + 1 is detected, as in Detection.segments.
+
+    :param detections: bool numpy array (combinations, num_frames);
+    :param labels: bool numpy array of hop labels (num_frames - 1,);
+    :param metric: 'f1' or 'accuracy' (default: 'f1');
+    :return numpy array of scores (combinations,).
+    """
+    predicted = detections[:, 1:]
+    if metric == 'accuracy':
+        return np.mean(predicted == labels, axis=1)
+    if metric != 'f1':
+        raise ValueError(f"Unknown metric {metric}")
+    true_positive = np.count_nonzero(predicted & labels, axis=1)
+    false_count = np.count_nonzero(predicted != labels, axis=1)
+    return 2 * true_positive / np.maximum(2 * true_positive + false_count, 1)
+
+
+def evaluate(deltas, thresholds, labels, metric='f1', chunk_size=256):
+    """Evaluate many threshold combinations at once
+
+    Comparisons and hangover are broadcast over a parameter axis, ``chunk_size`` combinations at a time to bound
+    memory by ``chunk_size * num_frames`` values.
+
+    :param deltas: descriptor deviations from baseline means (4, num_frames), see SpeechAnalysis.deltas;
+    :param thresholds: numpy array of shape (combinations, 4), columns ordered as Thresholds;
+    :param labels: bool numpy array of hop labels (num_frames - 1,);
+    :param metric: 'f1' or 'accuracy' (default: 'f1');
+    :param chunk_size: number of combinations evaluated at once (default: 256);
+    :return numpy array of scores (combinations,).
+    """
+    thresholds = np.atleast_2d(thresholds)
+    scores = np.empty(len(thresholds))
+    for start in range(0, len(thresholds), chunk_size):
+        chunk = thresholds[start:start + chunk_size]
+        condition = speech_condition(deltas, Thresholds(*(chunk[:, i, None] for i in range(4))))
+        scores[start:start + chunk_size] = score_detections(hangover(condition), labels, metric)
+    return scores
+
+
+class TuningResult:
+    """Scores of evaluated threshold combinations"""
+
+    def __init__(self, thresholds, scores, metric):
+        """Initialize result
+
+        :param thresholds: numpy array of shape (combinations, 4), columns ordered as Thresholds;
+        :param scores: numpy array of scores (combinations,);
+        :param metric: name of metric.
+        """
+        self.thresholds = thresholds
+        self.scores = scores
+        self.metric = metric
+
+    @property
+    def best_score(self):
+        """Best score"""
+        return float(self.scores.max())
+
+    @property
+    def best_thresholds(self):
+        """Best combination as Thresholds tuple"""
+        return Thresholds(*(float(value) for value in self.thresholds[np.argmax(self.scores)]))
+
+    @property
+    def best_params(self):
+        """Best combination as dict of VAD and SpeechAnalysis.detect() keyword arguments"""
+        return {VAD_PARAMS[name]: value for name, value in self.best_thresholds._asdict().items()}
+
+    def top(self, count=10):
+        """Best combinations
+
+        :param count: number of combinations (default: 10);
+        :return list of (score, Thresholds) tuples.
+        """
+        order = np.argsort(-self.scores, kind='stable')[:count]
+        return [(float(self.scores[i]), Thresholds(*self.thresholds[i])) for i in order]
+
+
+def tune(analysis, reference, grid=None, samples=None, bounds=None, refine=0, metric='f1', seed=0,
+         chunk_size=256):
+    """Find thresholds that reproduce reference speech segments best
+
+    By default the whole grid is evaluated. With ``samples`` a random sample inside ``bounds`` is evaluated instead,
+    and every ``refine`` round draws the same number of samples in a box shrunk by half around the best so far.
+
+    :param analysis: SpeechAnalysis object, its descriptors are calculated once;
+    :param reference: numpy array of (start, end) seconds or path of JSON, CSV or RTTM segments file;
+    :param grid: dict of threshold name -> values for grid search (default: DEFAULT_GRID);
+    :param samples: number of random combinations per round instead of grid (default: None);
+    :param bounds: dict of threshold name -> (low, high) for random search (default: DEFAULT_BOUNDS);
+    :param refine: number of refinement rounds of random search (default: 0);
+    :param metric: 'f1' or 'accuracy' (default: 'f1');
+    :param seed: random seed (default: 0);
+    :param chunk_size: number of combinations evaluated at once (default: 256);
+    :return TuningResult object.
+    """
+    if isinstance(reference, (str, bytes)) or hasattr(reference, '__fspath__'):
+        reference = load_segments(reference)
+    deltas = analysis.deltas
+    frame_step = int(round(analysis.frame_overlap * analysis.sample_rate))
+    labels = reference_hops(reference, deltas.shape[1] - 1, frame_step, analysis.sample_rate)
+
+    if samples is None:
+        thresholds = threshold_grid(grid)
+    else:
+        bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+        thresholds = random_thresholds(samples, bounds, seed)
+    logger.info(f"Evaluate {len(thresholds)} threshold combinations")
+    scores = evaluate(deltas, thresholds, labels, metric, chunk_size)
+
+    for round_index in range(refine if samples is not None else 0):
+        best = thresholds[np.argmax(scores)]
+        bounds = {name: (best[i] - (bounds[name][1] - bounds[name][0]) / 4,
+                         best[i] + (bounds[name][1] - bounds[name][0]) / 4)
+                  for i, name in enumerate(Thresholds._fields)}
+        candidates = random_thresholds(samples, bounds, seed + round_index + 1)
+        thresholds = np.vstack([thresholds, candidates])
+        scores = np.concatenate([scores, evaluate(deltas, candidates, labels, metric, chunk_size)])
+
+    result = TuningResult(thresholds, scores, metric)
+    logger.info(f"Best {metric} {result.best_score:.4f} with {result.best_params}")
+    return result
@@ -2,15 +2,11 @@
 import pathlib
 import warnings
 
-import librosa
-import noisereduce as nr
 import numpy as np
-import soundfile as sf
 from loguru import logger
 
-import utils.audio_operations as audio_operations
-import utils.descriptors as speech_descriptors
-import utils.visualize as verbose
+from utils.metrics import Metrics, instrumented
+from voice_detection.analysis import SpeechAnalysis
 
 warnings.filterwarnings("ignore")
 
@@ -19,7 +15,9 @@ class VAD:
 
     def __init__(self, file, save_path=None, frame_length=0.03, frame_overlap=0.015, energy_threshold=5 * 10 ** -6,
                  flatness_threshold=0.12, zerocrossing_threshold=0.9, rolloff_threshold=0.7, visualise=False,
-                 N_frames=31):
+                 N_frames=31, n_fft=None, instrument=False, metrics_path=None, save_audio=True, segments_path=None,
+                 cache=None, dtype=np.float64, workers=None, sample_rate=22050, denoise='noisereduce', gate=None,
+                 crossfade=0):
         """Initialize main params
 
         :param file: name of audio file with path;
@@ -31,7 +29,26 @@ class VAD:
         :param zerocrossing_threshold: threshold of zero crossing rate (default: 0.9);
         :param rolloff_threshold: threshold of spectral rolloff (default: 0.7);
         :param visualise: if True show descriptor graphs that can help to configure thresholds;
-        :param N_frames: number of first silent frames.
+        :param N_frames: number of first silent frames;
+        :param n_fft: FFT size of spectral descriptors (default: adapted to sample rate, 4096 at 22050 Hz);
+        :param instrument: if True measure time, CPU time, peak allocation and throughput of every stage and keep them
+            in ``metrics`` (default: False);
+        :param metrics_path: if set write stage metrics to this Prometheus text file (default: None);
+        :param save_audio: if False do not write cut audio file (default: True);
+        :param segments_path: if set write speech segments to this JSON, CSV or RTTM file (default: None);
+        :param cache: DescriptorCache object or cache folder to reuse signal and descriptors of previous runs
+            (default: no cache);
+        :param dtype: float dtype of signal, frames and descriptors, float32 halves memory per frame (default: float64);
+        :param workers: if set split the file into shards analysed by this many threads, see ShardedAnalysis
+            (default: one pass);
+        :param sample_rate: sample rate the signal is resampled to, 'native' analyses the file at its own rate, e.g.
+            8 kHz telephony audio without upsampling (default: 22050);
+        :param denoise: 'noisereduce' for noisereduce over the whole signal, 'gate' for SpectralGate fitted on the
+            first N_frames frames, None to skip noise reduction (default: 'noisereduce');
+        :param gate: SpectralGate object whose cached noise profiles are reused by detectors of similar recordings
+            (default: new gate);
+        :param crossfade: seconds of raised cosine crossfade between joined speech segments, e.g.
+            utils.segments.CROSSFADE (5 ms), 0 for hard cuts (default: 0).
         """
         self.file = file
         self.file_name = "".join(self.file.split(".")[:-1])
@@ -46,6 +63,18 @@ class VAD:
         self.rolloff_threshold = rolloff_threshold
         self.visualise = visualise
         self.n_frames = N_frames
+        self.n_fft = n_fft
+        self.save_audio = save_audio
+        self.segments_path = segments_path
+        self.cache = cache
+        self.dtype = dtype
+        self.workers = workers
+        self.sample_rate = sample_rate
+        self.denoise = denoise
+        self.gate = gate
+        self.crossfade = crossfade
+        self._cutted_signal = None
+        self.metrics = Metrics(labels={'file': pathlib.Path(file).name}) if instrument or metrics_path else None
 
         self.__speech_descriptors()
         self.__mean_values()
@@ -53,147 +82,104 @@ class VAD:
         self.__separate_speech_information()
         self.__save_signal()
 
+        if metrics_path:
+            self.metrics.write_prometheus(metrics_path)
+
+    @instrumented('speech_descriptors', frames_attribute='num_frames')
     def __speech_descriptors(self):
         """Calculate main speech descriptors"""
         logger.info("Calculate speech descriptors")
-        self.signal, self.sample_rate = librosa.load(self.file, mono=True)
-        self.signal = nr.reduce_noise(self.signal, self.signal[:-1])
-        # self.signal = audio_operations.normalize(self.signal)
-        self.framed_signal = audio_operations.framing_signal(self.signal, self.sample_rate, frame_length=0.03,
-                                                             frame_overlap=0.015)
-        self.preemphasis_signal = librosa.effects.preemphasis(self.signal)
-        self.preemphasis_framed_signal = audio_operations.framing_signal(self.signal, self.sample_rate,
-                                                                         frame_length=0.03,
-                                                                         frame_overlap=0.015)
-
-        self.short_term_energy = speech_descriptors.short_term_energy(self.framed_signal) / np.linalg.norm(
-            speech_descriptors.short_term_energy(self.framed_signal))
-        self.short_term_energy = audio_operations.normalize(self.short_term_energy)
-
-        self.zero_crossing_rate = speech_descriptors.additional_zero_crossing_rate(self.framed_signal)
-        self.zero_crossing_rate = audio_operations.normalize(self.zero_crossing_rate)
-
-        self.spectral_flatness = speech_descriptors.additional_spectral_flatness(self.preemphasis_framed_signal)
-        self.spectral_flatness = audio_operations.normalize(self.spectral_flatness)
+        params = {'frame_length': self.frame_length, 'frame_overlap': self.frame_overlap, 'N_frames': self.n_frames,
+                  'n_fft': self.n_fft, 'cache': self.cache, 'dtype': self.dtype, 'sample_rate': self.sample_rate,
+                  'denoise': self.denoise, 'gate': self.gate}
+        if self.workers:
+            from voice_detection.sharding import ShardedAnalysis
+            self.analysis = ShardedAnalysis(self.file, workers=self.workers, **params)
+        else:
+            self.analysis = SpeechAnalysis(self.file, **params)
+        self.signal = self.analysis.signal
+        self.sample_rate = self.analysis.sample_rate
 
-        self.spectral_rolloff = speech_descriptors.spectral_rolloff(self.preemphasis_framed_signal)
-        self.spectral_rolloff = audio_operations.normalize(self.spectral_rolloff)
+        self.short_term_energy = self.analysis.short_term_energy
+        self.zero_crossing_rate = self.analysis.zero_crossing_rate
+        self.spectral_flatness = self.analysis.spectral_flatness
+        self.spectral_rolloff = self.analysis.spectral_rolloff
 
+    @instrumented('mean_values', frames_attribute='num_frames')
     def __mean_values(self):
         """Calculate mean value of each first 30 frames of speech descriptor"""
         logger.info("Get mean values")
-        self.mean_energy = np.mean(self.short_term_energy[:self.n_frames])
-        self.mean_flatness = np.mean(self.spectral_flatness[:self.n_frames])
-        self.mean_zerocross = np.mean(self.zero_crossing_rate[:self.n_frames])
-        self.mean_rolloff = np.mean(self.spectral_rolloff[:self.n_frames])
-
-    def __apply_descriptors(self):
-        pass
+        self.mean_energy, self.mean_zerocross, self.mean_flatness, self.mean_rolloff = self.analysis.means
 
+    @instrumented('voice_indexes', frames_attribute='num_frames')
     def __voice_indexes(self):
         """Calculate indexes where speech activity is appeared
 
         :return numpy array of speech activity indexes.
         """
         logger.info("Extract speech indexes")
-        speech_detection = np.zeros(len(self.framed_signal), dtype='bool')
-        speech_counter = 0
-        silence_detection = 0
-        self.spectral_flatness_impact = np.zeros(len(self.framed_signal), dtype='int')
-        self.short_term_energy_impact = np.zeros(len(self.framed_signal), dtype='int')
-        self.zero_crossing_rate_impact = np.zeros(len(self.framed_signal), dtype='int')
-        self.spectral_rolloff_impact = np.zeros(len(self.framed_signal), dtype='int')
-
-        for i in range(len(self.framed_signal)):
-
-            if self.zero_crossing_rate[i] - self.mean_zerocross < self.zerocrossing_threshold:
-                self.zero_crossing_rate_impact[i] = 1
-            else:
-                self.zero_crossing_rate_impact[i] = 0
-
-            if self.spectral_flatness[i] - self.mean_flatness <= self.flatness_threshold:
-                self.spectral_flatness_impact[i] = 1
-            else:
-                self.spectral_flatness_impact[i] = 0
-
-            if self.short_term_energy[i] - self.mean_energy >= self.energy_threshold:
-                self.short_term_energy_impact[i] = 1
-            else:
-                self.short_term_energy_impact[i] = 0
-
-            if self.spectral_rolloff[i] - self.mean_rolloff <= self.rolloff_threshold:
-                self.spectral_rolloff_impact[i] = 1
-            else:
-                self.spectral_rolloff_impact[i] = 0
-
-            if self.spectral_flatness[i] - self.mean_flatness <= self.flatness_threshold and \
-                    self.short_term_energy[i] - self.mean_energy >= self.energy_threshold and \
-                    self.spectral_rolloff[i] - self.mean_rolloff <= self.rolloff_threshold and \
-                    self.zero_crossing_rate[i] - self.mean_zerocross <= self.zerocrossing_threshold:
-
-                speech_counter += 1
-                if speech_counter >= 7:
-                    speech_detection[i - 7:i] = True
-
-            else:
-                silence_detection += 1
-                if silence_detection >= 7:
-                    speech_detection[i - 7:i] = False
-                speech_counter = 0
-                silence_detection = 0
-
-        self.indexes = np.where(speech_detection[:-1] != speech_detection[1:])[0]
-
-        if self.visualise:
-            logger.info("Plotting graphs")
-            self.__print_current_threshold_values()
-            verbose.plotting_descriptors(self.signal,
-                                         self.short_term_energy,
-                                         self.zero_crossing_rate,
-                                         self.spectral_flatness,
-                                         self.spectral_rolloff,
-                                         detection_region=speech_detection,
-                                         frame_length=self.frame_length,
-                                         sample_rate=self.sample_rate,
-                                         short_term_energy_impact=self.short_term_energy_impact,
-                                         zero_crossing_rate_impact=self.zero_crossing_rate_impact,
-                                         spectral_flatness_impact=self.spectral_flatness_impact,
-                                         spectral_rolloff_impact=self.spectral_rolloff_impact)
-
+        self.detection = self.analysis.detect(energy_threshold=self.energy_threshold,
+                                              flatness_threshold=self.flatness_threshold,
+                                              zerocrossing_threshold=self.zerocrossing_threshold,
+                                              rolloff_threshold=self.rolloff_threshold)
+        self.speech_detection = self.detection.speech_detection
+        self.indexes = self.detection.indexes
+        self.impact_mask = self.detection.impact_mask
+
+    @instrumented('separate_speech_information', frames_attribute='num_frames')
     def __separate_speech_information(self):
         """Separate speech and noises"""
         logger.info("Separate speech and noises")
-        coefficient = self.frame_length * self.sample_rate / 2
-        self.cutted_signal = []
-        i = 0
-
-        logger.info("Join speech chunks")
-        while i < len(self.indexes):
-            chunk = self.signal[int(self.indexes[i] * coefficient):int(self.indexes[i + 1] * coefficient)]
-            self.cutted_signal.extend(chunk)
-            i += 2
+        self.segments = self.detection.segments
         if self.visualise:
-            verbose.plot_signals_comparison(self.signal, self.cutted_signal, self.sample_rate)
+            self.detection.plot(self.cutted_signal)
 
+    @instrumented('save_signal', frames_attribute='num_frames')
     def __save_signal(self):
-        """Save signal to WAV format"""
-
-        if not self.save_path:
-            fn = pathlib.Path(self.file_name).name
-            logger.info(f"Save result signal in {self.file_name}_vad.wav")
-            sf.write(f'{fn}_vad.wav', self.cutted_signal, self.sample_rate)
-
-        else:
-            try:
-                fn = pathlib.Path(self.file_name).name
-                fp = pathlib.Path(self.save_path)
-                logger.info(f"Save result signal in {fp}\\{fn}_vad.wav")
-                sf.write(f'{fp}\\{fn}_vad.wav', self.cutted_signal, self.sample_rate)
-            except RuntimeError:
-                logger.error('Please check save path, the folder must exist')
-
-    def __print_current_threshold_values(self):
-        logger.info(f"Short term energy threshold: {self.energy_threshold}\n"
-                    f"Zero crossing rate threshold: {self.zerocrossing_threshold}\n"
-                    f"Spectral flatness threshold: {self.flatness_threshold}\n"
-                    f"Spectral rolloff threshold: {self.rolloff_threshold}\n")
+        """Save signal to WAV format and segments to timestamps file"""
+        if self.save_audio:
+            self.detection.save(self.save_path, crossfade=self.crossfade)
+        if self.segments_path:
+            self.detection.export_segments(self.segments_path)
+
+    @property
+    def short_term_energy_impact(self):
+        """0/1 short term energy decision of each frame, unpacked from impact_mask"""
+        return (self.impact_mask >> 0) & 1
+
+    @property
+    def zero_crossing_rate_impact(self):
+        """0/1 zero crossing rate decision of each frame, unpacked from impact_mask"""
+        return (self.impact_mask >> 1) & 1
+
+    @property
+    def spectral_flatness_impact(self):
+        """0/1 spectral flatness decision of each frame, unpacked from impact_mask"""
+        return (self.impact_mask >> 2) & 1
+
+    @property
+    def spectral_rolloff_impact(self):
+        """0/1 spectral rolloff decision of each frame, unpacked from impact_mask"""
+        return (self.impact_mask >> 3) & 1
+
+    @property
+    def framed_signal(self):
+        """Frames of signal, framed on first access only, since descriptors may come from cache"""
+        return self.analysis.framed_signal
+
+    @property
+    def preemphasis_framed_signal(self):
+        """Descriptors were always calculated on frames of the signal itself, not of the preemphasis signal"""
+        return self.framed_signal
+
+    @property
+    def num_frames(self):
+        """Number of frames"""
+        return self.analysis.num_frames
+
+    @property
+    def cutted_signal(self):
+        """Speech signal, joined on first access"""
+        if self._cutted_signal is None:
+            self._cutted_signal = self.detection.speech_signal(crossfade=self.crossfade)
+        return self._cutted_signal